@@ -1,20 +1,123 @@
 import logging
+from collections.abc import Mapping
+from z80_timings import INTERRUPT_TSTATES, NMI_TSTATES
+
+# Регистровый файл: индексы ячеек в списке baseCPUClass.regs.
+# 8-битные регистры хранятся по отдельности, IX/IY/SP/PC - целыми 16-битными ячейками.
+REG_A, REG_F, REG_B, REG_C, REG_D, REG_E, REG_H, REG_L = range(8)
+REG_A_, REG_F_, REG_B_, REG_C_, REG_D_, REG_E_, REG_H_, REG_L_ = range(8, 16)  # Альтернативный набор
+REG_IX, REG_IY, REG_SP, REG_PC, REG_I, REG_R = range(16, 22)
+REGISTER_COUNT = 22
+
+REG_INDEX = {
+    'A': REG_A, 'F': REG_F, 'B': REG_B, 'C': REG_C, 'D': REG_D, 'E': REG_E, 'H': REG_H, 'L': REG_L,
+    'IX': REG_IX, 'IY': REG_IY, 'SP': REG_SP, 'PC': REG_PC,
+    'A_': REG_A_, 'F_': REG_F_, 'B_': REG_B_, 'C_': REG_C_, 'D_': REG_D_, 'E_': REG_E_, 'H_': REG_H_, 'L_': REG_L_,
+    'I': REG_I, 'R': REG_R,
+}
+
+# Пары из двух 8-битных ячеек: (старший, младший)
+PAIR_INDEX = {
+    'AF': (REG_A, REG_F), 'BC': (REG_B, REG_C), 'DE': (REG_D, REG_E), 'HL': (REG_H, REG_L),
+    'AF_': (REG_A_, REG_F_), 'BC_': (REG_B_, REG_C_), 'DE_': (REG_D_, REG_E_), 'HL_': (REG_H_, REG_L_),
+}
+
+# 16-битные регистры, хранящиеся одной ячейкой
+WORD_INDEX = {'IX': REG_IX, 'IY': REG_IY, 'SP': REG_SP, 'PC': REG_PC}
+
+# Операнды r в кодировке команд: B, C, D, E, H, L, (HL), A
+R8_SLOTS = (REG_B, REG_C, REG_D, REG_E, REG_H, REG_L, None, REG_A)
+
+# Биты регистра флагов
+FLAG_C, FLAG_N, FLAG_PV, FLAG_3, FLAG_H, FLAG_5, FLAG_Z, FLAG_S = 0x01, 0x02, 0x04, 0x08, 0x10, 0x20, 0x40, 0x80
+FLAG_MASK = {'C': FLAG_C, 'N': FLAG_N, 'P/V': FLAG_PV, '3': FLAG_3, 'H': FLAG_H, '5': FLAG_5, 'Z': FLAG_Z, 'S': FLAG_S}
+
+# Таблицы флагов, вычисляемые один раз при импорте.
+# Индекс - 8-битный результат операции.
+PARITY = [0] * 256  # P/V для четного числа единичных битов
+SZ = [0] * 256      # S и Z
+SZ53 = [0] * 256    # S, Z и недокументированные биты 5 и 3
+SZP = [0] * 256     # S, Z и P/V
+SZ53P = [0] * 256   # S, Z, 5, 3 и P/V
+INC_FLAGS = [0] * 256  # Флаги INC r (без C), индекс - результат
+DEC_FLAGS = [0] * 256  # Флаги DEC r (без C), индекс - результат
+for _i in range(256):
+    PARITY[_i] = 0 if bin(_i).count('1') & 1 else FLAG_PV
+    SZ[_i] = (_i & FLAG_S) | (0 if _i else FLAG_Z)
+    SZ53[_i] = SZ[_i] | (_i & (FLAG_5 | FLAG_3))
+    SZP[_i] = SZ[_i] | PARITY[_i]
+    SZ53P[_i] = SZ53[_i] | PARITY[_i]
+    INC_FLAGS[_i] = SZ53[_i] | (FLAG_PV if _i == 0x80 else 0) | (0 if _i & 0x0F else FLAG_H)
+    DEC_FLAGS[_i] = SZ53[_i] | FLAG_N | (FLAG_PV if _i == 0x7F else 0) | (FLAG_H if _i & 0x0F == 0x0F else 0)
+
+# Полуперенос и переполнение для 8-битных ADD/ADC/SUB/SBC/CP.
+# Индекс собирается из битов 3 и 7 операндов и результата:
+# ((a & 0x88) >> 3) | ((value & 0x88) >> 2) | ((result & 0x88) >> 1),
+# младшие три бита - для полупереноса, старшие - для переполнения.
+HALFCARRY_ADD = (0, FLAG_H, FLAG_H, FLAG_H, 0, 0, 0, FLAG_H)
+HALFCARRY_SUB = (0, 0, FLAG_H, 0, FLAG_H, 0, FLAG_H, FLAG_H)
+OVERFLOW_ADD = (0, 0, 0, FLAG_PV, FLAG_PV, 0, 0, 0)
+OVERFLOW_SUB = (0, FLAG_PV, 0, 0, 0, 0, FLAG_PV, 0)
+
+# Результат и флаги сдвигов группы CB, упакованные как (результат << 8) | F.
+# Для RL/RR индекс включает входной перенос: (C << 8) | значение.
+RLC_TABLE = [0] * 256
+RRC_TABLE = [0] * 256
+SLA_TABLE = [0] * 256
+SRA_TABLE = [0] * 256
+SLL_TABLE = [0] * 256
+SRL_TABLE = [0] * 256
+RL_TABLE = [0] * 512
+RR_TABLE = [0] * 512
+for _i in range(256):
+    for _table, _result, _carry in (
+            (RLC_TABLE, ((_i << 1) | (_i >> 7)) & 0xFF, _i >> 7),
+            (RRC_TABLE, (_i >> 1) | ((_i & 1) << 7), _i & 1),
+            (SLA_TABLE, (_i << 1) & 0xFF, _i >> 7),
+            (SRA_TABLE, (_i >> 1) | (_i & 0x80), _i & 1),
+            (SLL_TABLE, ((_i << 1) | 1) & 0xFF, _i >> 7),
+            (SRL_TABLE, _i >> 1, _i & 1)):
+        _table[_i] = (_result << 8) | SZ53P[_result] | _carry
+    for _c in (0, 1):
+        _result = ((_i << 1) | _c) & 0xFF
+        RL_TABLE[(_c << 8) | _i] = (_result << 8) | SZ53P[_result] | (_i >> 7)
+        _result = (_i >> 1) | (_c << 7)
+        RR_TABLE[(_c << 8) | _i] = (_result << 8) | SZ53P[_result] | (_i & 1)
+del _i, _c, _table, _result, _carry
+
+
+class RegisterView(Mapping):
+    """
+    Словарь регистров только для чтения поверх регистрового файла.
+    Оставлен для загрузчиков снапшотов, отладочного вывода и тестов.
+    """
+    def __init__(self, cpu):
+        self._cpu = cpu
+
+    def __getitem__(self, name):
+        index = REG_INDEX.get(name)
+        if index is not None:
+            return self._cpu.regs[index]
+        if name == 'IFF':
+            return int(self._cpu.interrupts_enabled)
+        if name == 'IM':
+            return self._cpu.interrupt_mode
+        raise KeyError(name)
+
+    def __iter__(self):
+        yield from REG_INDEX
+        yield 'IFF'
+        yield 'IM'
+
+    def __len__(self):
+        return len(REG_INDEX) + 2
+
 
 class baseCPUClass:
     def __init__(self):
-        self.registers = {
-            'A': 0, 'F': 0, 'B': 0, 'C': 0, 'D': 0, 'E': 0, 'H': 0, 'L': 0,
-            'IX': 0, 'IY': 0, 'SP': 0, 'PC': 0,
-            'A_': 0, 'F_': 0, 'B_': 0, 'C_': 0, 'D_': 0, 'E_': 0, 'H_': 0, 'L_': 0  # Альтернативный набор регистров
-        }
-        # ... (предыдущая инициализация)
-        self.registers['IX'] = 0
-        self.registers['IY'] = 0
-        self.registers['I'] = 0
-        self.registers['R'] = 0
-
-        self.registers['IFF'] = 0
-        self.registers['IM'] = 0
+        # Список не пересоздается: обработчики команд держат ссылку на него
+        self.regs = [0] * REGISTER_COUNT
+        self.registers = RegisterView(self)
 
         self.iff1 = False
         self.iff2 = False
@@ -25,64 +128,58 @@ class baseCPUClass:
         self.interrupt_mode = 0
         self.halted = False
 
-        self.cycles = 0
+        self.tstates = 0  # Счетчик T-состояний, только растет
+        self.deadline = 0  # Граница T-состояний текущего run_tstates (0 - без ограничения)
+        self.access_time = 0  # Такт следующего обращения к памяти (задержки спорной памяти)
 
         self.debug = True
 
     def reset(self):
         # Сброс всех регистров и флагов
-        self.registers = {
-            'A': 0, 'F': 0, 'B': 0, 'C': 0, 'D': 0, 'E': 0, 'H': 0, 'L': 0,
-            'IX': 0, 'IY': 0, 'SP': 0, 'PC': 0,
-            'A_': 0, 'F_': 0, 'B_': 0, 'C_': 0, 'D_': 0, 'E_': 0, 'H_': 0, 'L_': 0  # Альтернативный набор регистров
-        }
-        # ... (предыдущая инициализация)
-        self.registers['IX'] = 0
-        self.registers['IY'] = 0
-        self.registers['I'] = 0
-        self.registers['R'] = 0
+        self.regs[:] = [0] * REGISTER_COUNT
 
         self.interrupts_enabled = False
         self.interrupt_mode = 0
         self.halted = False
 
+    def get_register(self, name):
+        return self.regs[REG_INDEX[name]]
+
+    def set_register(self, name, value):
+        """
+        Устанавливает значение регистра по имени.
+
+        :param name: имя регистра ('A', 'F_', 'IX', 'I', 'R' и т.д.)
+        :param value: значение регистра
+        """
+        index = REG_INDEX[name]
+        self.regs[index] = value & (0xFFFF if REG_IX <= index <= REG_PC else 0xFF)
+
+    def register_lines(self):
+        """
+        Строки панели отладки с регистрами (debug_panel.DebugPanel).
+
+        :return: список строк
+        """
+        return [
+            f"AF: {self.get_register_pair('AF'):04X}",
+            f"BC: {self.get_register_pair('BC'):04X}",
+            f"DE: {self.get_register_pair('DE'):04X}",
+            f"HL: {self.get_register_pair('HL'):04X}",
+            f"IX: {self.regs[REG_IX]:04X}",
+            f"IY: {self.regs[REG_IY]:04X}",
+            f"PC: {self.regs[REG_PC]:04X}",
+            f"SP: {self.regs[REG_SP]:04X}",
+            f"Interrupts enabled: {self.interrupts_enabled}",
+            f"Interrupt mode: {self.interrupt_mode}",
+        ]
+
     def display_registers(self, screen, font, offset):
         x, y = 10, 10 + offset
-        #for reg, value in self.registers.items():
-        #    text = font.render(f"{reg}: {value:04X}", True, (255, 255, 255))
-        #    screen.blit(text, (x, y))
-        #    y += 20
-        text = font.render(f"AF: {self.get_register_pair('AF'):04X}", True, (255, 255, 255))
-        screen.blit(text, (x, y))
-        y += 20
-        text = font.render(f"BC: {self.get_register_pair('BC'):04X}", True, (255, 255, 255))
-        screen.blit(text, (x, y))
-        y += 20
-        text = font.render(f"DE: {self.get_register_pair('DE'):04X}", True, (255, 255, 255))
-        screen.blit(text, (x, y))
-        y += 20
-        text = font.render(f"HL: {self.get_register_pair('HL'):04X}", True, (255, 255, 255))
-        screen.blit(text, (x, y))
-        y += 20
-        text = font.render(f"IX: {self.registers['IX']:04X}", True, (255, 255, 255))
-        screen.blit(text, (x, y))
-        y += 20
-        text = font.render(f"IY: {self.registers['IY']:04X}", True, (255, 255, 255))
-        screen.blit(text, (x, y))
-        y += 20
-        text = font.render(f"PC: {self.registers['PC']:04X}", True, (255, 255, 255))
-        screen.blit(text, (x, y))
-        y += 20
-        text = font.render(f"SP: {self.registers['SP']:04X}", True, (255, 255, 255))
-        screen.blit(text, (x, y))
-
-        y += 20
-        text = font.render(f"Interrupts enabled: {self.interrupts_enabled}", True, (255, 255, 255))
-        screen.blit(text, (x, y))
-
-        y += 20
-        text = font.render(f"Interrupt mode: {self.interrupt_mode}", True, (255, 255, 255))
-        screen.blit(text, (x, y))
+        for line in self.register_lines():
+            text = font.render(line, True, (255, 255, 255))
+            screen.blit(text, (x, y))
+            y += 20
 
     def load_memory(self, address, data):
         # Загрузка данных в память по заданному адресу
@@ -98,7 +195,6 @@ class baseCPUClass:
             raise ValueError(f"Недопустимый режим прерываний: {mode}")
 
         self.interrupt_mode = mode
-        self.registers['IM'] = mode
 
         if mode == 0:
             # В режиме 0 внешнее устройство может поместить любую инструкцию на шину данных
@@ -119,61 +215,87 @@ class baseCPUClass:
             #print("Процессор возобновил выполнение после прерывания.")
 
         self.interrupts_enabled = False
+        # Подтверждение прерывания - 7 тактов, дальше запись в стек (и чтение вектора в IM 2)
+        self.access_time = self.tstates + 7
+        self.tstates += INTERRUPT_TSTATES[self.interrupt_mode]
 
-        self.registers['SP'] = (self.registers['SP'] - 1) & 0xFFFF
-        self.memory[self.registers['SP']] = (self.registers['PC'] >> 8) & 0xFF
-        self.registers['SP'] = (self.registers['SP'] - 1) & 0xFFFF
-        self.memory[self.registers['SP']] = self.registers['PC'] & 0xFF
+        self.regs[REG_SP] = (self.regs[REG_SP] - 1) & 0xFFFF
+        self.write_byte(self.regs[REG_SP], (self.regs[REG_PC] >> 8) & 0xFF)
+        self.regs[REG_SP] = (self.regs[REG_SP] - 1) & 0xFFFF
+        self.write_byte(self.regs[REG_SP], self.regs[REG_PC] & 0xFF)
 
         if self.interrupt_mode == 0:
-            self.registers['PC'] = 0x0038
+            self.regs[REG_PC] = 0x0038
         elif self.interrupt_mode == 1:
-            self.registers['PC'] = 0x0038
+            self.regs[REG_PC] = 0x0038
             logging.info('========== Call interrupt ==========')
             logging.disable()
         elif self.interrupt_mode == 2:
             #vector = self.io_controller.get_data_bus_value()
             vector = 0
-            address = (self.registers['I'] << 8) | vector
-            self.registers['PC'] = (self.memory[address + 1] << 8) | self.memory[address]
+            address = (self.regs[REG_I] << 8) | vector
+            self.regs[REG_PC] = (self.read_byte(address + 1) << 8) | self.read_byte(address)
 
         #print("Interrupt 38")
 
     def handle_nmi(self):
-        self.sp = (self.sp - 1) & 0xFFFF
-        self.memory[self.sp] = (self.pc >> 8) & 0xFF
-        self.sp = (self.sp - 1) & 0xFFFF
-        self.memory[self.sp] = self.pc & 0xFF
-        self.pc = 0x0066
+        self.access_time = self.tstates + 5
+        self.tstates += NMI_TSTATES
+        self.regs[REG_SP] = (self.regs[REG_SP] - 1) & 0xFFFF
+        self.write_byte(self.regs[REG_SP], (self.regs[REG_PC] >> 8) & 0xFF)
+        self.regs[REG_SP] = (self.regs[REG_SP] - 1) & 0xFFFF
+        self.write_byte(self.regs[REG_SP], self.regs[REG_PC] & 0xFF)
+        self.regs[REG_PC] = 0x0066
 
     def fetch(self):
-        self.registers['R'] = (self.registers['R'] + 1) & 0x7F | (self.registers['R'] & 0x80)
+        regs = self.regs
+        r = regs[REG_R]
+        regs[REG_R] = (r + 1) & 0x7F | (r & 0x80)
 
-        value = self.memory[self.registers['PC']]
-        self.registers['PC'] = (self.registers['PC'] + 1) & 0xFFFF
-        return value
+        pc = regs[REG_PC]
+        regs[REG_PC] = (pc + 1) & 0xFFFF
+        return self.pages[pc >> 14][pc & 0x3FFF]
+
+    # Выборка кода команды после префикса (цикл M1); с задержками спорной памяти
+    # подменяется методом из contention.contended_fetchers
+    fetch_opcode = fetch
 
     def fetch_word(self):
-        low = self.fetch()
-        high = self.fetch()
+        regs = self.regs
+        r = regs[REG_R]
+        regs[REG_R] = (r + 2) & 0x7F | (r & 0x80)
+
+        pc = regs[REG_PC]
+        regs[REG_PC] = (pc + 2) & 0xFFFF
         #print(f"word {(high << 8) | low:04X}")
-        return (high << 8) | low
+        pages = self.pages
+        return (pages[(pc + 1) >> 14][(pc + 1) & 0x3FFF] << 8) | pages[pc >> 14][pc & 0x3FFF]
 
     # Вспомогательные методы
     def fetch_signed(self):
         value = self.fetch()
         return value if value < 128 else value - 256
 
+    def fetch_displacement(self):
+        """
+        Смещение d команд с операндом (IX+d)/(IY+d): за его чтением идут
+        5 внутренних тактов вычисления адреса.
+
+        :return: 8-битное знаковое смещение
+        """
+        offset = self.fetch_signed()
+        self.access_time += 5
+        return offset
+
     def set_flag(self, flag, value):
-        mask = {'C': 0x01, 'N': 0x02, 'P/V': 0x04, '3': 0x08, 'H': 0x10, '5': 0x20, 'Z': 0x40, 'S': 0x80}[flag]
+        mask = FLAG_MASK[flag]
         if value:
-            self.registers['F'] |= mask
+            self.regs[REG_F] |= mask
         else:
-            self.registers['F'] &= ~mask
+            self.regs[REG_F] &= ~mask
 
     def get_flag(self, flag):
-        mask = {'C': 0x01, 'N': 0x02, 'P/V': 0x04, 'H': 0x10, 'Z': 0x40, 'S': 0x80}[flag]
-        return (self.registers['F'] & mask) != 0
+        return (self.regs[REG_F] & FLAG_MASK[flag]) != 0
 
     def update_flags(self, result, zero=False, sign=False, parity=False, halfcarry=True, carry=False):
         if zero:
@@ -183,7 +305,7 @@ class baseCPUClass:
         if parity:
             self.set_flag('P/V', self.parity(result))
         if halfcarry:
-            self.set_flag('H', self.registers['F'] & ~0x10 | (0x10 if result & 0x0F < self.registers['A'] & 0x0F else 0))
+            self.set_flag('H', self.regs[REG_F] & ~0x10 | (0x10 if result & 0x0F < self.regs[REG_A] & 0x0F else 0))
         if carry:
             self.set_flag('C', result > 0xFF)
         self.set_flag('N', 0)  # Reset N flag for most arithmetic operations
@@ -199,63 +321,51 @@ class baseCPUClass:
         #pass
 
     def load_register(self, reg, value):
-        self.registers[reg] = value & 0xFF
-        if reg == 'A':
-            self.update_flags(value)
+        """
+        Загрузка значения в 8-битный регистр.
+
+        :param reg: индекс регистра (REG_A, REG_B, ...)
+        :param value: значение
+        """
+        self.regs[reg] = value & 0xFF
 
     def load_register_pair(self, pair, value):
         #print(f'pair {pair}')
         #print(f'value {value:04X}')
-        if pair == 'SP':
-            self.registers['SP'] = value
+        index = WORD_INDEX.get(pair)
+        if index is not None:
+            self.regs[index] = value & 0xFFFF
         else:
-            high, low = pair
-            self.registers[high] = (value >> 8) & 0xFF
-            self.registers[low] = value & 0xFF
+            high, low = PAIR_INDEX[pair]
+            self.regs[high] = (value >> 8) & 0xFF
+            self.regs[low] = value & 0xFF
 
     def get_register_pair(self, pair):
-        if pair == 'SP':
-            return self.registers['SP']
-        elif pair == 'PC':
-            return self.registers['PC']
-        elif pair == 'IX':
-            return self.registers['IX']
-        elif pair == 'IY':
-            return self.registers['IY']
-        else:
-            high, low = pair
-            return (self.registers[high] << 8) | self.registers[low]
+        index = WORD_INDEX.get(pair)
+        if index is not None:
+            return self.regs[index]
+        high, low = PAIR_INDEX[pair]
+        return (self.regs[high] << 8) | self.regs[low]
 
     def set_register_pair(self, pair, value):
         """
         Устанавливает значение для пары регистров.
 
-        :param pair: строка, обозначающая пару регистров ('BC', 'DE', 'HL', 'AF', 'SP')
+        :param pair: строка, обозначающая пару регистров ('BC', 'DE', 'HL', 'AF', 'SP', 'HL_' ...)
         :param value: 16-битное значение для установки
         """
-        # Убеждаемся, что значение 16-битное
-        value = value & 0xFFFF
-
-        if pair == 'SP':
-            self.registers['SP'] = value
-        elif pair == 'PC':
-            self.registers['PC'] = value
-        elif pair == 'IX':
-            self.registers['IX'] = value
-        elif pair == 'IY':
-            self.registers['IY'] = value
-        else:
-            # Для остальных пар регистров
-            if len(pair) == 2:
-                high, low = pair
-            else:
-                high = pair[0] + '_'
-                low = pair[1] + '_'
-            self.registers[high] = (value >> 8) & 0xFF  # Старший байт
-            self.registers[low] = value & 0xFF  # Младший байт
+        self.load_register_pair(pair, value)
 
     def store_memory(self, address, value):
-        self.memory[address] = value & 0xFF
+        self.write_byte(address, value & 0xFF)
+
+    def modify_memory(self, address, value):
+        """
+        Запись результата команды чтение-модификация-запись (INC (HL), RLC (HL), SET n,(IX+d)...):
+        между чтением и записью проходит внутренний такт.
+        """
+        self.access_time += 1
+        self.write_byte(address, value & 0xFF)
 
     def store_word(self, address, value):
         """
@@ -268,10 +378,10 @@ class baseCPUClass:
         value = value & 0xFFFF
 
         # Сохраняем младший байт
-        self.memory[address] = value & 0xFF
+        self.write_byte(address, value & 0xFF)
 
         # Сохраняем старший байт
-        self.memory[(address + 1) & 0xFFFF] = (value >> 8) & 0xFF
+        self.write_byte((address + 1) & 0xFFFF, (value >> 8) & 0xFF)
 
     def load_word(self, address):
         """
@@ -280,54 +390,30 @@ class baseCPUClass:
         :param address: адрес в памяти, куда нужно сохранить слово
         :param value: 16-битное значение для сохранения
         """
-        return self.memory[address] | (self.memory[address + 1] << 8)
+        return self.read_byte(address) | (self.read_byte(address + 1) << 8)
 
     def inc_register(self, reg):
-        value = self.registers[reg]
-        self.registers[reg] = (self.registers[reg] + 1) & 0xFF
-        self.update_flags(self.registers[reg], zero=True, sign=True, halfcarry=True)
-
-        self.set_flag('H', (value & 0x0F) == 0x0F)
-        self.set_flag('P/V', self.registers[reg] == 0x80)
-        # Установка флагов 3 и 5
-        self.set_flag('3', self.registers[reg] & 0x08)
-        self.set_flag('5', self.registers[reg] & 0x20)
+        regs = self.regs
+        result = (regs[reg] + 1) & 0xFF
+        regs[reg] = result
+        # Флаг C не меняется
+        regs[REG_F] = (regs[REG_F] & FLAG_C) | INC_FLAGS[result]
 
     def dec_register(self, reg):
-        value = self.registers[reg]
-        self.registers[reg] = (self.registers[reg] - 1) & 0xFF
-        self.update_flags(self.registers[reg], zero=True, sign=True, halfcarry=True)
-
-        self.set_flag('N', 1)  # Add/Subtract flag (set for decrement)
-        self.set_flag('H', (value & 0x0F) == 0)
-        self.set_flag('P/V', self.registers[reg] == 0x7F)
-        # Установка флагов 3 и 5
-        self.set_flag('3', self.registers[reg] & 0x08)
-        self.set_flag('5', self.registers[reg] & 0x20)
+        regs = self.regs
+        result = (regs[reg] - 1) & 0xFF
+        regs[reg] = result
+        regs[REG_F] = (regs[REG_F] & FLAG_C) | DEC_FLAGS[result]
 
     def inc_memory(self, address):
-        value = self.memory[address]
-        self.memory[address] = (self.memory[address] + 1) & 0xFF
-        self.update_flags(self.memory[address], zero=True, sign=True, halfcarry=True)
-
-        self.set_flag('H', (value & 0x0F) == 0x0F)
-        self.set_flag('P/V', self.memory[address] == 0x80)
-        # Установка флагов 3 и 5
-        self.set_flag('3', self.memory[address] & 0x08)
-        self.set_flag('5', self.memory[address] & 0x20)
-
+        result = (self.read_byte(address) + 1) & 0xFF
+        self.modify_memory(address, result)
+        self.regs[REG_F] = (self.regs[REG_F] & FLAG_C) | INC_FLAGS[result]
 
     def dec_memory(self, address):
-        value = self.memory[address]
-        self.memory[address] = (self.memory[address] - 1) & 0xFF
-        self.update_flags(self.memory[address], zero=True, sign=True, halfcarry=True)
-
-        self.set_flag('N', 1)  # Add/Subtract flag (set for decrement)
-        self.set_flag('H', (value & 0x0F) == 0)
-        self.set_flag('P/V', self.memory[address] == 0x7F)
-        # Установка флагов 3 и 5
-        self.set_flag('3', self.memory[address] & 0x08)
-        self.set_flag('5', self.memory[address] & 0x20)
+        result = (self.read_byte(address) - 1) & 0xFF
+        self.modify_memory(address, result)
+        self.regs[REG_F] = (self.regs[REG_F] & FLAG_C) | DEC_FLAGS[result]
 
     def inc_register_pair(self, pair):
         value = self.get_register_pair(pair)
@@ -340,20 +426,13 @@ class baseCPUClass:
         self.load_register_pair(pair, value)
 
     def add(self, operand):
-        value = self.registers[operand] if isinstance(operand, str) else operand
-        result = self.registers['A'] + value
-        h_flag = ((self.registers['A'] & 0xF) + (value & 0xF)) & 0x10 == 0x10
-        overflow = ((self.registers['A'] ^ result) & (value ^ result) & 0x80) != 0
-        self.registers['A'] = result & 0xFF
-        self.update_flags(result, zero=True, sign=True, carry=True, halfcarry=True)
-        self.set_flag('H',  h_flag)
-        #self.set_flag('P/V', self.registers['A'] == 0x80)
-        #self.set_flag('P/V', ((self.registers['A'] ^ ~value) & (self.registers['A'] ^ result) & 0x80) != 0)
-        self.set_flag('P/V', overflow)
-        #print(f"PV {((self.registers['A'] ^ ~value) & (self.registers['A'] ^ result) & 0x80) != 0}")
-        # Установка флагов 3 и 5
-        self.set_flag('3', self.registers['A'] & 0x08)
-        self.set_flag('5', self.registers['A'] & 0x20)
+        regs = self.regs
+        value = regs[REG_INDEX[operand]] if isinstance(operand, str) else operand
+        a = regs[REG_A]
+        result = a + value
+        lookup = ((a & 0x88) >> 3) | ((value & 0x88) >> 2) | ((result & 0x88) >> 1)
+        regs[REG_A] = result & 0xFF
+        regs[REG_F] = ((result >> 8) & FLAG_C) | HALFCARRY_ADD[lookup & 0x07] | OVERFLOW_ADD[lookup >> 4] | SZ53[result & 0xFF]
 
     #def add_hl(self, pair):
     #    hl = self.get_register_pair('HL')
@@ -363,17 +442,17 @@ class baseCPUClass:
     #    self.update_flags(result, carry=True, halfcarry=True)
 
     def rotate_left_carry(self, reg):
-        value = self.registers[reg]
+        value = self.regs[reg]
         carry = value >> 7
         result = ((value << 1) | carry) & 0xFF
-        self.registers[reg] = result
+        self.regs[reg] = result
         self.update_flags(result, carry=True)
 
     def rotate_right_carry(self, reg):
-        value = self.registers[reg]
+        value = self.regs[reg]
         carry = value & 1
         result = ((value >> 1) | (carry << 7)) & 0xFF
-        self.registers[reg] = result
+        self.regs[reg] = result
         self.update_flags(result, carry=True)
 
     def exchange_de_hl(self):
@@ -381,43 +460,44 @@ class baseCPUClass:
         Обмен содержимым пар регистров DE и HL.
         Инструкция: EX DE, HL
         """
-        self.registers['D'], self.registers['H'] = self.registers['H'], self.registers['D']
-        self.registers['E'], self.registers['L'] = self.registers['L'], self.registers['E']
+        self.regs[REG_D], self.regs[REG_H] = self.regs[REG_H], self.regs[REG_D]
+        self.regs[REG_E], self.regs[REG_L] = self.regs[REG_L], self.regs[REG_E]
 
     def exchange_af(self):
         """
         Обмен содержимым основного и альтернативного набора регистров AF.
         Инструкция: EX AF, AF'
         """
-        self.registers['A'], self.registers['A_'] = self.registers['A_'], self.registers['A']
-        self.registers['F'], self.registers['F_'] = self.registers['F_'], self.registers['F']
+        self.regs[REG_A], self.regs[REG_A_] = self.regs[REG_A_], self.regs[REG_A]
+        self.regs[REG_F], self.regs[REG_F_] = self.regs[REG_F_], self.regs[REG_F]
 
     def exx(self):
         """
         Обмен содержимым регистров BC, DE, HL с их альтернативными наборами.
         Инструкция: EXX
         """
-        self.registers['B'], self.registers['B_'] = self.registers['B_'], self.registers['B']
-        self.registers['C'], self.registers['C_'] = self.registers['C_'], self.registers['C']
-        self.registers['D'], self.registers['D_'] = self.registers['D_'], self.registers['D']
-        self.registers['E'], self.registers['E_'] = self.registers['E_'], self.registers['E']
-        self.registers['H'], self.registers['H_'] = self.registers['H_'], self.registers['H']
-        self.registers['L'], self.registers['L_'] = self.registers['L_'], self.registers['L']
+        self.regs[REG_B], self.regs[REG_B_] = self.regs[REG_B_], self.regs[REG_B]
+        self.regs[REG_C], self.regs[REG_C_] = self.regs[REG_C_], self.regs[REG_C]
+        self.regs[REG_D], self.regs[REG_D_] = self.regs[REG_D_], self.regs[REG_D]
+        self.regs[REG_E], self.regs[REG_E_] = self.regs[REG_E_], self.regs[REG_E]
+        self.regs[REG_H], self.regs[REG_H_] = self.regs[REG_H_], self.regs[REG_H]
+        self.regs[REG_L], self.regs[REG_L_] = self.regs[REG_L_], self.regs[REG_L]
 
     def exchange_sp_hl(self):
         """
         Обмен содержимым HL с верхними двумя байтами стека.
         Инструкция: EX (SP), HL
         """
-        sp = self.registers['SP']
-        l = self.memory[sp]
-        h = self.memory[(sp + 1) & 0xFFFF]
+        sp = self.regs[REG_SP]
+        l = self.read_byte(sp)
+        h = self.read_byte((sp + 1) & 0xFFFF)
 
-        self.memory[sp] = self.registers['L']
-        self.memory[(sp + 1) & 0xFFFF] = self.registers['H']
+        self.access_time += 1
+        self.write_byte(sp, self.regs[REG_L])
+        self.write_byte((sp + 1) & 0xFFFF, self.regs[REG_H])
 
-        self.registers['L'] = l
-        self.registers['H'] = h
+        self.regs[REG_L] = l
+        self.regs[REG_H] = h
 
     def xor_a(self, operand):
         """
@@ -428,27 +508,14 @@ class baseCPUClass:
         """
         # Если операнд - строка, значит это имя регистра
         if isinstance(operand, str):
-            value = self.registers[operand]
+            value = self.regs[REG_INDEX[operand]]
         else:
             value = operand
 
-        # Выполняем XOR
-        result = self.registers['A'] ^ value
-
-        # Сохраняем результат в аккумуляторе
-        self.registers['A'] = result & 0xFF  # Убеждаемся, что результат 8-битный
-
-        # Устанавливаем флаги
-        self.set_flag('S', result & 0x80)  # Устанавливаем флаг знака
-        self.set_flag('Z', result == 0)    # Устанавливаем флаг нуля
-        self.set_flag('H', 0)              # Сбрасываем флаг полупереноса
-        self.set_flag('P/V', self.parity(result))  # Устанавливаем флаг четности/переполнения
-        self.set_flag('N', 0)              # Сбрасываем флаг вычитания
-        self.set_flag('C', 0)              # Сбрасываем флаг переноса
-
-        # Установка флагов 3 и 5
-        self.set_flag('3', self.registers['A'] & 0x08)
-        self.set_flag('5', self.registers['A'] & 0x20)
+        result = (self.regs[REG_A] ^ value) & 0xFF
+        self.regs[REG_A] = result
+        # H, N и C сбрасываются
+        self.regs[REG_F] = SZ53P[result]
 
     def or_a(self, operand):
         """
@@ -459,26 +526,14 @@ class baseCPUClass:
         """
         # Если операнд - строка, значит это имя регистра
         if isinstance(operand, str):
-            value = self.registers[operand]
+            value = self.regs[REG_INDEX[operand]]
         else:
             value = operand
 
-        # Выполняем OR
-        result = self.registers['A'] | value
-
-        # Сохраняем результат в аккумуляторе
-        self.registers['A'] = result & 0xFF  # Убеждаемся, что результат 8-битный
-
-        # Устанавливаем флаги
-        self.set_flag('S', result & 0x80)  # Устанавливаем флаг знака
-        self.set_flag('Z', result == 0)    # Устанавливаем флаг нуля
-        self.set_flag('H', 0)              # Сбрасываем флаг полупереноса
-        self.set_flag('P/V', self.parity(result))  # Устанавливаем флаг четности/переполнения
-        self.set_flag('N', 0)              # Сбрасываем флаг вычитания
-        self.set_flag('C', 0)              # Сбрасываем флаг переноса
-        # Установка флагов 3 и 5
-        self.set_flag('3', self.registers['A'] & 0x08)
-        self.set_flag('5', self.registers['A'] & 0x20)
+        result = (self.regs[REG_A] | value) & 0xFF
+        self.regs[REG_A] = result
+        # H, N и C сбрасываются
+        self.regs[REG_F] = SZ53P[result]
 
     def parity(self, value):
         """
@@ -488,25 +543,15 @@ class baseCPUClass:
         :param value: 8-битное значение для проверки четности
         :return: булево значение, представляющее четность
         """
-        # Убеждаемся, что значение 8-битное
-        value &= 0xFF
-
-        # Подсчитываем количество единичных битов
-        ones = 0
-        for i in range(8):
-            if value & (1 << i):
-                ones += 1
-
-        # Возвращаем True, если количество единичных битов четное
-        return ones % 2 == 0
+        return PARITY[value & 0xFF] != 0
 
     def jump(self, address):
-        self.registers['PC'] = address
+        self.regs[REG_PC] = address
 
     def halt(self):
         # В реальной реализации здесь должна быть логика остановки процессора
         """Выполняет команду HALT."""
-        print("Выполнение HALT. Процессор остановлен.")
+        #print("Выполнение HALT. Процессор остановлен.")
         self.halted = True  # Устанавливаем состояние HALT
 
         #pass
@@ -520,27 +565,18 @@ class baseCPUClass:
         """
         if isinstance(value, str):
             # Если value - строка, это имя регистра
-            operand = self.registers[value]
+            operand = self.regs[REG_INDEX[value]]
         else:
             # Иначе это непосредственное значение
             operand = value
 
-        result = (self.registers['A'] - operand) & 0xFF
-
-        # Устанавливаем флаги
-        self.set_flag('S', result & 0x80)  # Устанавливаем флаг знака
-        self.set_flag('Z', result == 0)    # Устанавливаем флаг нуля
-        self.set_flag('H', ((self.registers['A'] & 0xF) - (operand & 0xF)) & 0x10)  # Флаг полупереноса
+        a = self.regs[REG_A]
+        result = a - operand
+        lookup = ((a & 0x88) >> 3) | ((operand & 0x88) >> 2) | ((result & 0x88) >> 1)
 
-        # Флаг переполнения устанавливается, если знак результата неверен
-        self.set_flag('P/V', ((self.registers['A'] ^ operand) & (self.registers['A'] ^ result) & 0x80) != 0)
-
-        self.set_flag('N', 1)  # Всегда устанавливается, так как это операция вычитания
-        self.set_flag('C', self.registers['A'] < operand)  # Устанавливаем флаг переноса
-
-        # Установка флагов 3 и 5
-        self.set_flag('3', operand & 0x08)
-        self.set_flag('5', operand & 0x20)
+        # Биты 3 и 5 берутся из операнда, а не из результата
+        self.regs[REG_F] = ((result >> 8) & FLAG_C) | FLAG_N | HALFCARRY_SUB[lookup & 0x07] | \
+            OVERFLOW_SUB[lookup >> 4] | SZ[result & 0xFF] | (operand & (FLAG_5 | FLAG_3))
 
     def and_a(self, value):
         """
@@ -551,28 +587,15 @@ class baseCPUClass:
         """
         if isinstance(value, str):
             # Если value - строка, это имя регистра
-            operand = self.registers[value]
+            operand = self.regs[REG_INDEX[value]]
         else:
             # Иначе это непосредственное значение
             operand = value
 
-        # Выполняем операцию AND
-        result = self.registers['A'] & operand
-
-        # Сохраняем результат в аккумуляторе
-        self.registers['A'] = result
-
-        # Устанавливаем флаги
-        self.set_flag('S', result & 0x80)  # Устанавливаем флаг знака
-        self.set_flag('Z', result == 0)    # Устанавливаем флаг нуля
-        self.set_flag('H', 1)              # Флаг полупереноса всегда устанавливается
-        self.set_flag('P/V', self.parity(result))  # Устанавливаем флаг четности
-        self.set_flag('N', 0)              # Сбрасываем флаг вычитания
-        self.set_flag('C', 0)              # Сбрасываем флаг переноса
-
-        # Установка флагов 3 и 5
-        self.set_flag('3', self.registers['A'] & 0x08)
-        self.set_flag('5', self.registers['A'] & 0x20)
+        result = self.regs[REG_A] & operand
+        self.regs[REG_A] = result
+        # H всегда устанавливается, N и C сбрасываются
+        self.regs[REG_F] = SZ53P[result] | FLAG_H
 
     def push(self, rr):
         """
@@ -581,10 +604,10 @@ class baseCPUClass:
         :param rr: строка, обозначающая пару регистров ('BC', 'DE', 'HL', 'AF')
         """
         value = self.get_register_pair(rr)
-        self.registers['SP'] = (self.registers['SP'] - 1) & 0xFFFF
-        self.memory[self.registers['SP']] = (value >> 8) & 0xFF  # Сохраняем старший байт
-        self.registers['SP'] = (self.registers['SP'] - 1) & 0xFFFF
-        self.memory[self.registers['SP']] = value & 0xFF  # Сохраняем младший байт
+        self.regs[REG_SP] = (self.regs[REG_SP] - 1) & 0xFFFF
+        self.write_byte(self.regs[REG_SP], (value >> 8) & 0xFF)  # Сохраняем старший байт
+        self.regs[REG_SP] = (self.regs[REG_SP] - 1) & 0xFFFF
+        self.write_byte(self.regs[REG_SP], value & 0xFF)  # Сохраняем младший байт
 
     def pop(self, rr):
         """
@@ -592,10 +615,10 @@ class baseCPUClass:
 
         :param rr: строка, обозначающая пару регистров ('BC', 'DE', 'HL', 'AF')
         """
-        low = self.memory[self.registers['SP']]
-        self.registers['SP'] = (self.registers['SP'] + 1) & 0xFFFF
-        high = self.memory[self.registers['SP']]
-        self.registers['SP'] = (self.registers['SP'] + 1) & 0xFFFF
+        low = self.read_byte(self.regs[REG_SP])
+        self.regs[REG_SP] = (self.regs[REG_SP] + 1) & 0xFFFF
+        high = self.read_byte(self.regs[REG_SP])
+        self.regs[REG_SP] = (self.regs[REG_SP] + 1) & 0xFFFF
         value = (high << 8) | low
         self.set_register_pair(rr, value)
 
@@ -606,26 +629,16 @@ class baseCPUClass:
         :param operand: значение для вычитания (может быть регистром или непосредственным значением)
         """
         if isinstance(operand, str):
-            value = self.registers[operand]
+            value = self.regs[REG_INDEX[operand]]
         else:
             value = operand
 
-        carry = self.get_flag('C')
-        result = self.registers['A'] - value - carry
-
-        self.set_flag('H', ((self.registers['A'] & 0xF) - (value & 0xF) - carry) < 0)
-        self.set_flag('C', result < 0)
-        self.set_flag('P/V', ((self.registers['A'] ^ value) & (self.registers['A'] ^ (result & 0xFF)) & 0x80) != 0)
-
-        self.registers['A'] = result & 0xFF
-
-        self.set_flag('S', self.registers['A'] & 0x80)
-        self.set_flag('Z', self.registers['A'] == 0)
-        self.set_flag('N', 1)
-
-        # Установка флагов 3 и 5
-        self.set_flag('3', self.registers['A'] & 0x08)
-        self.set_flag('5', self.registers['A'] & 0x20)
+        regs = self.regs
+        a = regs[REG_A]
+        result = a - value - (regs[REG_F] & FLAG_C)
+        lookup = ((a & 0x88) >> 3) | ((value & 0x88) >> 2) | ((result & 0x88) >> 1)
+        regs[REG_A] = result & 0xFF
+        regs[REG_F] = ((result >> 8) & FLAG_C) | FLAG_N | HALFCARRY_SUB[lookup & 0x07] | OVERFLOW_SUB[lookup >> 4] | SZ53[result & 0xFF]
 
     def sub(self, operand):
         """
@@ -634,25 +647,16 @@ class baseCPUClass:
         :param operand: значение для вычитания (может быть регистром или непосредственным значением)
         """
         if isinstance(operand, str):
-            value = self.registers[operand]
+            value = self.regs[REG_INDEX[operand]]
         else:
             value = operand
 
-        result = self.registers['A'] - value
-
-        self.set_flag('H', ((self.registers['A'] & 0xF) - (value & 0xF)) < 0)
-        self.set_flag('C', result < 0)
-        self.set_flag('P/V', ((self.registers['A'] ^ value) & (self.registers['A'] ^ (result & 0xFF)) & 0x80) != 0)
-
-        self.registers['A'] = result & 0xFF
-
-        self.set_flag('S', self.registers['A'] & 0x80)
-        self.set_flag('Z', self.registers['A'] == 0)
-        self.set_flag('N', 1)
-
-        # Установка флагов 3 и 5
-        self.set_flag('3', self.registers['A'] & 0x08)
-        self.set_flag('5', self.registers['A'] & 0x20)
+        regs = self.regs
+        a = regs[REG_A]
+        result = a - value
+        lookup = ((a & 0x88) >> 3) | ((value & 0x88) >> 2) | ((result & 0x88) >> 1)
+        regs[REG_A] = result & 0xFF
+        regs[REG_F] = ((result >> 8) & FLAG_C) | FLAG_N | HALFCARRY_SUB[lookup & 0x07] | OVERFLOW_SUB[lookup >> 4] | SZ53[result & 0xFF]
 
     def adc(self, operand):
         """
@@ -661,23 +665,13 @@ class baseCPUClass:
         :param operand: значение для сложения (может быть регистром или непосредственным значением)
         """
         if isinstance(operand, str):
-            value = self.registers[operand]
+            value = self.regs[REG_INDEX[operand]]
         else:
             value = operand
 
-        carry = self.get_flag('C')
-        result = self.registers['A'] + value + carry
-
-        self.set_flag('H', ((self.registers['A'] & 0xF) + (value & 0xF) + carry) > 0xF)
-        self.set_flag('C', result > 0xFF)
-        self.set_flag('P/V', ((self.registers['A'] ^ ~value) & (self.registers['A'] ^ result) & 0x80) != 0)
-
-        self.registers['A'] = result & 0xFF
-
-        self.set_flag('S', self.registers['A'] & 0x80)
-        self.set_flag('Z', self.registers['A'] == 0)
-        self.set_flag('N', 0)
-
-        # Установка флагов 3 и 5
-        self.set_flag('3', self.registers['A'] & 0x08)
-        self.set_flag('5', self.registers['A'] & 0x20)
\ No newline at end of file
+        regs = self.regs
+        a = regs[REG_A]
+        result = a + value + (regs[REG_F] & FLAG_C)
+        lookup = ((a & 0x88) >> 3) | ((value & 0x88) >> 2) | ((result & 0x88) >> 1)
+        regs[REG_A] = result & 0xFF
+        regs[REG_F] = ((result >> 8) & FLAG_C) | HALFCARRY_ADD[lookup & 0x07] | OVERFLOW_ADD[lookup >> 4] | SZ53[result & 0xFF]
\ No newline at end of file
@@ -0,0 +1,511 @@
+# block_translator.py
+# Трансляция базовых блоков Z80 в функции Python
+import re
+
+from base_cpu import (REG_A, REG_F, REG_B, REG_C, REG_D, REG_E, REG_H, REG_L, REG_SP, REG_PC, REG_R,
+                      SZ, SZ53, SZ53P, INC_FLAGS, DEC_FLAGS,
+                      HALFCARRY_ADD, HALFCARRY_SUB, OVERFLOW_ADD, OVERFLOW_SUB)
+from z80_timings import MAIN_TSTATES, MAIN_TSTATES_TAKEN, M1_TSTATES
+
+# Максимальное число команд в одном блоке
+MAX_BLOCK_LENGTH = 64
+# Сколько раз блок может быть сброшен записью в свой код, прежде чем адрес навсегда уйдет интерпретатору
+SMC_LIMIT = 4
+
+# Регистры, которые сгенерированный код держит в локальных переменных
+LOCAL_SLOTS = {'A': REG_A, 'F': REG_F, 'B': REG_B, 'C': REG_C, 'D': REG_D, 'E': REG_E,
+               'H': REG_H, 'L': REG_L, 'SP': REG_SP}
+LOCAL_ORDER = ('A', 'F', 'B', 'C', 'D', 'E', 'H', 'L', 'SP')
+
+# Операнды r в кодировке команд: B, C, D, E, H, L, (HL), A
+R8 = ('B', 'C', 'D', 'E', 'H', 'L', None, 'A')
+
+# Условия переходов в кодировке команд: NZ, Z, NC, C, PO, PE, P, M
+CONDITION_CODE = ('(F & 0x40) == 0', 'F & 0x40', '(F & 0x01) == 0', 'F & 0x01',
+                  '(F & 0x04) == 0', 'F & 0x04', '(F & 0x80) == 0', 'F & 0x80')
+
+HL = '((H << 8) | L)'
+ALU_CODE = (
+    # ADD
+    ['t = A + v', 'x = ((A & 0x88) >> 3) | ((v & 0x88) >> 2) | ((t & 0x88) >> 1)', 'A = t & 0xFF',
+     'F = ((t >> 8) & 0x01) | HALFCARRY_ADD[x & 0x07] | OVERFLOW_ADD[x >> 4] | SZ53[A]'],
+    # ADC
+    ['t = A + v + (F & 0x01)', 'x = ((A & 0x88) >> 3) | ((v & 0x88) >> 2) | ((t & 0x88) >> 1)', 'A = t & 0xFF',
+     'F = ((t >> 8) & 0x01) | HALFCARRY_ADD[x & 0x07] | OVERFLOW_ADD[x >> 4] | SZ53[A]'],
+    # SUB
+    ['t = A - v', 'x = ((A & 0x88) >> 3) | ((v & 0x88) >> 2) | ((t & 0x88) >> 1)', 'A = t & 0xFF',
+     'F = ((t >> 8) & 0x01) | 0x02 | HALFCARRY_SUB[x & 0x07] | OVERFLOW_SUB[x >> 4] | SZ53[A]'],
+    # SBC
+    ['t = A - v - (F & 0x01)', 'x = ((A & 0x88) >> 3) | ((v & 0x88) >> 2) | ((t & 0x88) >> 1)', 'A = t & 0xFF',
+     'F = ((t >> 8) & 0x01) | 0x02 | HALFCARRY_SUB[x & 0x07] | OVERFLOW_SUB[x >> 4] | SZ53[A]'],
+    # AND
+    ['A &= v', 'F = SZ53P[A] | 0x10'],
+    # XOR
+    ['A ^= v', 'F = SZ53P[A]'],
+    # OR
+    ['A |= v', 'F = SZ53P[A]'],
+    # CP: биты 3 и 5 берутся из операнда
+    ['t = A - v', 'x = ((A & 0x88) >> 3) | ((v & 0x88) >> 2) | ((t & 0x88) >> 1)',
+     'F = ((t >> 8) & 0x01) | 0x02 | HALFCARRY_SUB[x & 0x07] | OVERFLOW_SUB[x >> 4] | SZ[t & 0xFF] | (v & 0x28)'],
+)
+
+# Имена, доступные сгенерированному коду
+BLOCK_GLOBALS = {
+    'SZ': SZ, 'SZ53': SZ53, 'SZ53P': SZ53P, 'INC_FLAGS': INC_FLAGS, 'DEC_FLAGS': DEC_FLAGS,
+    'HALFCARRY_ADD': HALFCARRY_ADD, 'HALFCARRY_SUB': HALFCARRY_SUB,
+    'OVERFLOW_ADD': OVERFLOW_ADD, 'OVERFLOW_SUB': OVERFLOW_SUB,
+}
+
+# Внутренний такт между обращениями к памяти; в код блока попадает только при отсчете
+# тактов обращений (см. BlockTranslator.generate)
+_INTERNAL_CYCLE = 'cpu.access_time += 1'
+
+_ASSIGN = re.compile(r'^\s*([A-Z]{1,2}(?:\s*,\s*[A-Z]{1,2})*)\s*[-+&|^]?=(?!=)')
+_LOCAL = re.compile(r'\b(A|F|B|C|D|E|H|L|SP)\b')
+
+
+class _Exit:
+    """Точка выхода из блока внутри сгенерированного кода."""
+    def __init__(self, indent, pc, extra=0):
+        self.indent = indent
+        self.pc = pc
+        self.extra = extra
+
+
+def _push(lines, value_hi, value_lo):
+    lines.append('SP = (SP - 1) & 0xFFFF')
+    lines.append(('write', 'SP', value_hi))
+    lines.append('SP = (SP - 1) & 0xFFFF')
+    lines.append(('write', 'SP', value_lo))
+
+
+def _pop(lines, hi, lo):
+    lines.append(f'{lo} = read(SP)')
+    lines.append('SP = (SP + 1) & 0xFFFF')
+    lines.append(f'{hi} = read(SP)')
+    lines.append('SP = (SP + 1) & 0xFFFF')
+
+
+def _translate_instruction(opcode, pc, fetch):
+    """
+    Переводит одну беспрефиксную команду в строки кода Python.
+
+    :param opcode: код команды
+    :param pc: адрес команды
+    :param fetch: функция чтения байта кода по адресу
+    :return: (строки, длина, завершает ли блок) или None, если команда не транслируется
+    """
+    n = fetch(pc + 1)
+    nn = n | (fetch(pc + 2) << 8)
+    e = n - 256 if n > 127 else n
+    lines = []
+    x, y, z = opcode >> 6, (opcode >> 3) & 0x07, opcode & 0x07
+
+    if opcode == 0x00:  # NOP
+        return lines, 1, False
+
+    if x == 1:
+        if opcode == 0x76:  # HALT остается интерпретатору
+            return None
+        dst, src = R8[y], R8[z]
+        if dst is None:
+            lines.append(('write', HL, src))
+        elif src is None:
+            lines.append(f'{dst} = read({HL})')
+        elif dst != src:
+            lines.append(f'{dst} = {src}')
+        return lines, 1, False
+
+    if x == 2 or (x == 3 and z == 6):  # ALU A, r / A, n
+        if x == 2:
+            lines.append('v = ' + (f'read({HL})' if R8[z] is None else R8[z]))
+            length = 1
+        else:
+            lines.append(f'v = {n}')
+            length = 2
+        lines.extend(ALU_CODE[y])
+        return lines, length, False
+
+    if x == 0:
+        if z == 6:  # LD r, n
+            if R8[y] is None:
+                lines.append(('write', HL, str(n)))
+            else:
+                lines.append(f'{R8[y]} = {n}')
+            return lines, 2, False
+        if z == 4 or z == 5:  # INC r / DEC r
+            table = 'INC_FLAGS' if z == 4 else 'DEC_FLAGS'
+            delta = '+ 1' if z == 4 else '- 1'
+            if R8[y] is None:
+                lines.append(f'u = {HL}')
+                lines.append(f't = (read(u) {delta}) & 0xFF')
+                lines.append(_INTERNAL_CYCLE)
+                lines.append(('write', 'u', 't'))
+                lines.append(f'F = (F & 0x01) | {table}[t]')
+            else:
+                r = R8[y]
+                lines.append(f'{r} = ({r} {delta}) & 0xFF')
+                lines.append(f'F = (F & 0x01) | {table}[{r}]')
+            return lines, 1, False
+        if z == 1 and not y & 1:  # LD rr, nn
+            if y == 6:
+                lines.append(f'SP = {nn}')
+            else:
+                hi, lo = ('B', 'C', 'D', 'E', 'H', 'L')[y:y + 2]
+                lines.append(f'{hi} = {nn >> 8}')
+                lines.append(f'{lo} = {nn & 0xFF}')
+            return lines, 3, False
+        if z == 1:  # ADD HL, rr
+            rr = ('(B << 8) | C', '(D << 8) | E', HL, 'SP')[y >> 1]
+            lines.append(f'u = {HL}')
+            lines.append(f'v = {rr}')
+            lines.append('t = u + v')
+            lines.append('F = (F & 0xC4) | ((t >> 16) & 0x01) | (0x10 if (u & 0xFFF) + (v & 0xFFF) > 0xFFF else 0) | ((t >> 8) & 0x28)')
+            lines.append('H = (t >> 8) & 0xFF')
+            lines.append('L = t & 0xFF')
+            return lines, 1, False
+        if z == 3:  # INC rr / DEC rr
+            delta = '+ 1' if not y & 1 else '- 1'
+            if y >> 1 == 3:
+                lines.append(f'SP = (SP {delta}) & 0xFFFF')
+            else:
+                hi, lo = (('B', 'C'), ('D', 'E'), ('H', 'L'))[y >> 1]
+                lines.append(f't = (({hi} << 8) | {lo}) {delta}')
+                lines.append(f'{hi} = (t >> 8) & 0xFF')
+                lines.append(f'{lo} = t & 0xFF')
+            return lines, 1, False
+        if opcode == 0x02:
+            lines.append(('write', '(B << 8) | C', 'A'))
+            return lines, 1, False
+        if opcode == 0x12:
+            lines.append(('write', '(D << 8) | E', 'A'))
+            return lines, 1, False
+        if opcode == 0x0A:
+            lines.append('A = read((B << 8) | C)')
+            return lines, 1, False
+        if opcode == 0x1A:
+            lines.append('A = read((D << 8) | E)')
+            return lines, 1, False
+        if opcode == 0x22:  # LD (nn), HL
+            lines.append(('write', str(nn), 'L'))
+            lines.append(('write', str((nn + 1) & 0xFFFF), 'H'))
+            return lines, 3, False
+        if opcode == 0x2A:  # LD HL, (nn)
+            lines.append(f'L = read({nn})')
+            lines.append(f'H = read({(nn + 1) & 0xFFFF})')
+            return lines, 3, False
+        if opcode == 0x32:  # LD (nn), A
+            lines.append(('write', str(nn), 'A'))
+            return lines, 3, False
+        if opcode == 0x3A:  # LD A, (nn)
+            lines.append(f'A = read({nn})')
+            return lines, 3, False
+        if opcode == 0x07:  # RLCA
+            lines.append('A = ((A << 1) | (A >> 7)) & 0xFF')
+            lines.append('F = (F & 0xC4) | (A & 0x29)')
+            return lines, 1, False
+        if opcode == 0x0F:  # RRCA
+            lines.append('A = (A >> 1) | ((A & 0x01) << 7)')
+            lines.append('F = (F & 0xC4) | (A & 0x28) | (A >> 7)')
+            return lines, 1, False
+        if opcode == 0x17:  # RLA
+            lines.append('t = (A << 1) | (F & 0x01)')
+            lines.append('A = t & 0xFF')
+            lines.append('F = (F & 0xC4) | (A & 0x28) | (t >> 8)')
+            return lines, 1, False
+        if opcode == 0x1F:  # RRA
+            lines.append('t = A & 0x01')
+            lines.append('A = (A >> 1) | ((F & 0x01) << 7)')
+            lines.append('F = (F & 0xC4) | (A & 0x28) | t')
+            return lines, 1, False
+        if opcode == 0x2F:  # CPL
+            lines.append('A ^= 0xFF')
+            lines.append('F = (F & 0xC5) | 0x12 | (A & 0x28)')
+            return lines, 1, False
+        if opcode == 0x37:  # SCF
+            lines.append('F = (F & 0xC4) | (A & 0x28) | 0x01')
+            return lines, 1, False
+        if opcode == 0x3F:  # CCF: H получает старое значение C
+            lines.append('F = (F & 0xC4) | (A & 0x28) | ((F & 0x01) << 4) | ((F & 0x01) ^ 0x01)')
+            return lines, 1, False
+        if opcode == 0x18:  # JR e
+            lines.append(_Exit(0, str((pc + 2 + e) & 0xFFFF)))
+            return lines, 2, True
+        if opcode in (0x20, 0x28, 0x30, 0x38):  # JR cc, e
+            lines.append(f'if {CONDITION_CODE[y - 4]}:')
+            lines.append(_Exit(1, str((pc + 2 + e) & 0xFFFF), MAIN_TSTATES_TAKEN[opcode]))
+            lines.append(_Exit(0, str((pc + 2) & 0xFFFF)))
+            return lines, 2, True
+        if opcode == 0x10:  # DJNZ e
+            lines.append('B = (B - 1) & 0xFF')
+            lines.append('if B:')
+            lines.append(_Exit(1, str((pc + 2 + e) & 0xFFFF), MAIN_TSTATES_TAKEN[opcode]))
+            lines.append(_Exit(0, str((pc + 2) & 0xFFFF)))
+            return lines, 2, True
+        return None
+
+    # x == 3
+    if opcode == 0xC3:  # JP nn
+        lines.append(_Exit(0, str(nn)))
+        return lines, 3, True
+    if z == 2:  # JP cc, nn
+        lines.append(f'if {CONDITION_CODE[y]}:')
+        lines.append(_Exit(1, str(nn)))
+        lines.append(_Exit(0, str((pc + 3) & 0xFFFF)))
+        return lines, 3, True
+    if opcode == 0xCD:  # CALL nn
+        ret = (pc + 3) & 0xFFFF
+        lines.append(_INTERNAL_CYCLE)
+        _push(lines, str(ret >> 8), str(ret & 0xFF))
+        lines.append(_Exit(0, str(nn)))
+        return lines, 3, True
+    if z == 4:  # CALL cc, nn
+        ret = (pc + 3) & 0xFFFF
+        lines.append(f'if {CONDITION_CODE[y]}:')
+        body = [_INTERNAL_CYCLE]
+        _push(body, str(ret >> 8), str(ret & 0xFF))
+        lines.extend(('indent', line) for line in body)
+        lines.append(_Exit(1, str(nn), MAIN_TSTATES_TAKEN[opcode]))
+        lines.append(_Exit(0, str(ret)))
+        return lines, 3, True
+    if opcode == 0xC9:  # RET
+        _pop(lines, 'hi', 'lo')
+        lines.append(_Exit(0, '(hi << 8) | lo'))
+        return lines, 1, True
+    if z == 0:  # RET cc
+        lines.append(f'if {CONDITION_CODE[y]}:')
+        body = []
+        _pop(body, 'hi', 'lo')
+        lines.extend(('indent', line) for line in body)
+        lines.append(_Exit(1, '(hi << 8) | lo', MAIN_TSTATES_TAKEN[opcode]))
+        lines.append(_Exit(0, str((pc + 1) & 0xFFFF)))
+        return lines, 1, True
+    if z == 7:  # RST p
+        ret = (pc + 1) & 0xFFFF
+        _push(lines, str(ret >> 8), str(ret & 0xFF))
+        lines.append(_Exit(0, str(y << 3)))
+        return lines, 1, True
+    if opcode == 0xE9:  # JP (HL)
+        lines.append(_Exit(0, HL))
+        return lines, 1, True
+    if opcode == 0xF9:  # LD SP, HL
+        lines.append(f'SP = {HL}')
+        return lines, 1, False
+    if opcode == 0xEB:  # EX DE, HL
+        lines.append('D, H = H, D')
+        lines.append('E, L = L, E')
+        return lines, 1, False
+    if z == 5 and not y & 1:  # PUSH rr
+        hi, lo = (('B', 'C'), ('D', 'E'), ('H', 'L'), ('A', 'F'))[y >> 1]
+        _push(lines, hi, lo)
+        return lines, 1, False
+    if z == 1 and not y & 1:  # POP rr
+        hi, lo = (('B', 'C'), ('D', 'E'), ('H', 'L'), ('A', 'F'))[y >> 1]
+        _pop(lines, hi, lo)
+        return lines, 1, False
+    # DI, EI, IN, OUT, EX (SP),HL, EXX, DAA, префиксы и пр. выполняет интерпретатор
+    return None
+
+
+def _interpret(cpu, regs, read, write):
+    cpu.execute_instruction()
+
+
+def _accesses_memory(lines):
+    """Проверяет, обращается ли команда к памяти (чтение или запись)."""
+    for line in lines:
+        if isinstance(line, tuple) and line[0] == 'indent':
+            line = line[1]
+        if isinstance(line, _Exit):
+            continue
+        if isinstance(line, tuple) or 'read(' in line:
+            return True
+    return False
+
+
+class BlockTranslator:
+    """
+    Транслятор базовых блоков: прямолинейные участки беспрефиксного кода
+    компилируются в функции Python с регистрами в локальных переменных
+    и заранее подсчитанным числом T-состояний.
+
+    Блоки кэшируются по ключу (банк, PC); для ПЗУ банк кодируется как ~номер ПЗУ.
+    Запись в 256-байтную страницу ОЗУ с транслированным кодом сбрасывает ее блоки
+    (см. Memory.mark_code / Memory.invalidate_code). Команды, которые блок не умеет,
+    и часто переписываемый код выполняет обычный интерпретатор.
+
+    С задержками спорной памяти (cpu.contended) каждая команда с обращением к памяти
+    ставит cpu.access_time на такт своего первого обращения, а код из спорных банков
+    выполняет интерпретатор: задержки выборки зависят от такта каждой команды.
+    """
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self.memory = cpu.memory
+        self.cache = {}        # (банк, PC) -> функция блока
+        self.pages = {}        # (банк, страница) -> ключи блоков
+        self.smc_counts = {}   # (банк, PC) -> число сбросов из-за записи в код
+        self.compiled = 0
+        self._read = self.memory.read  # Чтение кода при трансляции (без перехватчиков)
+        self.memory.code_listeners.append(self.invalidate)
+
+    def execute(self):
+        """Выполняет один блок с текущего PC (или одну команду интерпретатором)."""
+        cpu = self.cpu
+        regs = cpu.regs
+        pc = regs[REG_PC]
+        memory = self.memory
+        key = (memory.paged_banks[pc >> 14], pc)
+        block = self.cache.get(key)
+        if block is None:
+            block = self.translate(key)
+        block(cpu, regs, cpu.read_byte, cpu.write_byte)
+
+    def invalidate(self, bank, page):
+        """
+        Сбрасывает блоки страницы после записи в нее.
+
+        :param bank: номер банка ОЗУ или None для сброса всего кэша
+        :param page: номер 256-байтной страницы в банке
+        """
+        if bank is None:
+            self.cache.clear()
+            self.pages.clear()
+            self.smc_counts.clear()
+            return
+        for key in self.pages.pop((bank, page), ()):
+            if self.cache.pop(key, None) is not None:
+                count = self.smc_counts.get(key, 0) + 1
+                self.smc_counts[key] = count
+                if count >= SMC_LIMIT:
+                    # Самомодифицирующийся код: дальше только интерпретатор
+                    self.cache[key] = _interpret
+
+    def translate(self, key):
+        bank, start = key
+        timed = self.cpu.contended
+        if timed and bank in self.memory.contended_banks:
+            self.cache[key] = _interpret
+            return _interpret
+        source, end = self.generate(start, timed)
+        if source is None:
+            self.cache[key] = _interpret
+            return _interpret
+
+        namespace = dict(BLOCK_GLOBALS)
+        exec(compile(source, f'<block {bank}:{start:04X}>', 'exec'), namespace)
+        block = namespace['block']
+        self.cache[key] = block
+        self.compiled += 1
+
+        if bank >= 0:
+            for page in range((start & 0x3FFF) >> 8, ((end - 1) & 0x3FFF) // 256 + 1):
+                self.memory.mark_code(bank, page)
+                self.pages.setdefault((bank, page), []).append(key)
+        return block
+
+    def generate(self, start, timed=False):
+        """
+        Декодирует блок с адреса start и строит исходный текст функции.
+
+        :param timed: отсчитывать такты обращений к памяти (cpu.access_time)
+        :return: (исходный текст или None, адрес за концом блока)
+        """
+        read = self._read
+        page_end = (start & 0xC000) + 0x4000
+        body = []
+        pc = start
+        nbytes = 0
+        cost = 0
+        count = 0
+        guarded = False
+        terminated = False
+
+        while count < MAX_BLOCK_LENGTH:
+            opcode = read(pc)
+            result = _translate_instruction(opcode, pc, lambda address: read(address & 0xFFFF))
+            if result is None:
+                break
+            lines, length, terminator = result
+            if pc + length > page_end:
+                break
+            if timed and _accesses_memory(lines):
+                # Время блока добавляется при выходе: tstates здесь - начало блока плюс задержки.
+                # Первое обращение идет после цикла M1 и чтения операндов, уже подставленных в код
+                body.append((1, f'cpu.access_time = cpu.tstates + {cost + M1_TSTATES[opcode] + 3 * (length - 1)}'))
+            nbytes += length
+            cost += MAIN_TSTATES[opcode]
+            pc += length
+            count += 1
+
+            writes = False
+            for line in lines:
+                indent = 1
+                if isinstance(line, tuple) and line[0] == 'indent':
+                    indent, line = 2, line[1]
+                if line == _INTERNAL_CYCLE and not timed:
+                    continue
+                if isinstance(line, _Exit):
+                    body.append((line.indent + 1, line.pc, nbytes, cost + line.extra))
+                elif isinstance(line, tuple):  # запись в память
+                    _, address, value = line
+                    body.append((indent, f'w = {address}'))
+                    body.append((indent, f'write(w, {value})'))
+                    if not terminator:
+                        body.append((indent, f'if {start} <= w < END: hit = 1'))
+                        writes = True
+                else:
+                    body.append((indent, line))
+            if terminator:
+                terminated = True
+                break
+            if writes:
+                # Запись в собственный код: выходим, следующую команду выполнит уже новый код
+                guarded = True
+                body.append((1, 'if hit:'))
+                body.append((2, str(pc & 0xFFFF), nbytes, cost))
+
+        if count == 0:
+            return None, start
+        if not terminated:
+            body.append((1, str(pc & 0xFFFF), nbytes, cost))
+
+        # Регистры, которые блок читает и пишет
+        used, written = set(), set()
+        for item in body:
+            if len(item) == 2:
+                used.update(_LOCAL.findall(item[1]))
+                match = _ASSIGN.match(item[1])
+                if match:
+                    written.update(name.strip() for name in match.group(1).split(','))
+            else:
+                used.update(_LOCAL.findall(item[1]))
+        # Переход на начало блока (цикл) выполняется внутри функции, пока не наступит cpu.deadline
+        looped = any(len(item) == 4 and item[1] == str(start) for item in body)
+        base = 1 if looped else 0
+
+        source = ['def block(cpu, regs, read, write):']
+        for name in LOCAL_ORDER:
+            if name in used or name in written:
+                source.append(f'    {name} = regs[{LOCAL_SLOTS[name]}]')
+        if guarded:
+            source.append('    hit = 0')
+        if looped:
+            source.append('    while True:')
+        for item in body:
+            if len(item) == 2:
+                source.append('    ' * (item[0] + base) + item[1].replace('END', str(pc)))
+                continue
+            indent, pc_expr, exit_bytes, exit_cost = item
+            pad = '    ' * (indent + base)
+            source.append(f'{pad}r = regs[{REG_R}]')
+            source.append(f'{pad}regs[{REG_R}] = ((r + {exit_bytes}) & 0x7F) | (r & 0x80)')
+            source.append(f'{pad}cpu.tstates += {exit_cost}')
+            if looped and pc_expr == str(start):
+                source.append(f'{pad}if cpu.tstates < cpu.deadline:')
+                source.append(f'{pad}    continue')
+            for name in LOCAL_ORDER:
+                if name in written:
+                    source.append(f'{pad}regs[{LOCAL_SLOTS[name]}] = {name}')
+            source.append(f'{pad}regs[{REG_PC}] = {pc_expr}')
+            source.append(f'{pad}return')
+        return '\n'.join(source) + '\n', pc
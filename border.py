@@ -0,0 +1,100 @@
+# border.py
+# Бордюр по строкам развертки: журнал записей в порт FE с отметками времени
+
+from array import array
+
+import numpy as np
+
+
+class BorderLog:
+    """
+    Журнал смен цвета бордюра за кадр.
+
+    Запись в порт FE заносит в заранее выделенные массивы пару (такт, цвет), если цвет
+    изменился (запись звукового бита с тем же цветом журнал не растит). В конце кадра
+    bands() переводит журнал в полосы строк, а paint() раскрашивает бордюр одной заливкой
+    на каждую смену цвета, поэтому стоимость кадра зависит от числа смен, а не от числа строк.
+    """
+    def __init__(self, timing, capacity=8192):
+        """
+        :param timing: параметры кадра из contention.ULA_TIMINGS
+        :param capacity: размер журнала; при переполнении перезаписывается последняя запись
+        """
+        self.line_tstates = timing['line_tstates']
+        self.first_line = timing['first_line']
+        self.capacity = capacity
+        self.times = array('q', bytes(8 * capacity))  # Абсолютные значения tstates процессора
+        self.colors = bytearray(capacity)
+        self.count = 0
+        self.start_color = 0    # Цвет до первой записи журнала
+        self.last_color = 0     # Цвет после последней записи
+        self.painted = None     # Цвет, которым бордюр залит целиком (None - нужна перерисовка)
+
+    def add(self, tstate, color):
+        """
+        Заносит запись в порт FE.
+
+        :param tstate: значение tstates процессора в момент записи
+        :param color: цвет бордюра 0-7
+        """
+        if color == self.last_color:
+            return
+        self.last_color = color
+        n = self.count
+        if n < self.capacity:
+            self.count = n + 1
+        else:
+            n -= 1
+        self.times[n] = tstate
+        self.colors[n] = color
+
+    def invalidate(self):
+        """Требует полной перерисовки бордюра при следующем bands()/paint() (новая поверхность)."""
+        self.painted = None
+
+    def bands(self, frame_start, top, pixel_size, height):
+        """
+        Переводит журнал за прошедший кадр в полосы строк одного цвета и очищает журнал.
+        Записи до начала кадра (пропущенные кадры) дают только начальный цвет.
+
+        :param frame_start: значение tstates в начале кадра
+        :param top: строка изображения, на которой начинается экран
+        :param pixel_size: увеличение пикселей
+        :param height: высота изображения в строках
+        :return: список (первая строка, строка после последней, цвет) или None,
+                 если бордюр уже залит нужным цветом и перерисовка не нужна
+        """
+        count = self.count
+        if count == 0 and self.painted == self.last_color:
+            return None
+
+        times = np.frombuffer(self.times, dtype=np.int64, count=count)
+        lines = (times - frame_start) // self.line_tstates - self.first_line
+        rows = np.clip(lines * pixel_size + top, 0, height).tolist()
+        colors = [self.start_color] + list(self.colors[:count])
+        bands = [(start, end, color) for start, end, color in zip([0] + rows, rows + [height], colors)
+                 if end > start]
+
+        self.painted = self.last_color if count == 0 else None
+        self.start_color = self.last_color
+        self.count = 0
+        return bands
+
+    def paint(self, surface, frame_start, top, pixel_size, palette):
+        """
+        Раскрашивает поверхность бордюра pygame за прошедший кадр.
+
+        :param surface: поверхность бордюра
+        :param frame_start: значение tstates в начале кадра
+        :param top: строка поверхности, на которой начинается изображение экрана
+        :param pixel_size: увеличение пикселей
+        :param palette: цвета 0-7
+        :return: True, если поверхность перерисована
+        """
+        width, height = surface.get_size()
+        bands = self.bands(frame_start, top, pixel_size, height)
+        if bands is None:
+            return False
+        for start, end, color in bands:
+            surface.fill(palette[color], (0, start, width, end - start))
+        return True
@@ -0,0 +1,117 @@
+# contention.py
+# Задержки доступа к спорной памяти (ULA ZX Spectrum 48K/128K)
+
+from base_cpu import REG_PC, REG_R
+
+# Временные параметры ULA: длительность кадра и строки, номер строки кадра, с которой
+# начинается изображение экрана, первый такт спорного доступа (начало верхней строки
+# экрана, задержка 6) и банки ОЗУ, к которым ULA обращается за изображением.
+# На 48K спорное окно 4000-7FFF - это банк 5, на 128K спорны нечетные банки.
+# У Pentagon спорной памяти нет, first_tstate и contended_banks для него не используются.
+ULA_TIMINGS = {
+    '48k': {'frame_tstates': 69888, 'line_tstates': 224, 'first_line': 64, 'first_tstate': 14335,
+            'contended_banks': (5,)},
+    '128k': {'frame_tstates': 70908, 'line_tstates': 228, 'first_line': 63, 'first_tstate': 14361,
+             'contended_banks': (1, 3, 5, 7)},
+    'pentagon': {'frame_tstates': 71680, 'line_tstates': 224, 'first_line': 80, 'first_tstate': 17988,
+                 'contended_banks': ()},
+}
+
+# Задержка в пределах 8 тактов, за которые ULA читает 2 байта пикселей и 2 атрибута
+DELAY_PATTERN = (6, 5, 4, 3, 2, 1, 0, 0)
+
+
+def build_delay_table(timing):
+    """
+    Строит таблицу задержек на кадр: индекс - номер такта от начала кадра
+    (прерывания), значение - на сколько тактов задерживается обращение к спорной памяти.
+
+    :param timing: параметры ULA из ULA_TIMINGS
+    :return: bytes длиной в кадр
+    """
+    table = bytearray(timing['frame_tstates'])
+    for line in range(192):
+        start = timing['first_tstate'] + line * timing['line_tstates']
+        for tstate in range(128):
+            table[start + tstate] = DELAY_PATTERN[tstate & 7]
+    return bytes(table)
+
+
+def contended_accessors(cpu):
+    """
+    Создает методы чтения и записи памяти с задержкой спорного доступа.
+    Задержка берется одним индексом из таблицы окна (Memory.page_delay) по такту
+    самого обращения - cpu.access_time; для неспорных банков это таблица нулей,
+    поэтому проверок адреса нет. Обращение занимает 3 такта и сдвигает access_time,
+    задержка добавляется и к tstates (базовое время команды уже учтено).
+
+    :param cpu: процессор; memory.page_delay перестраивается на месте при смене банков
+    :return: (read, write)
+    """
+    memory = cpu.memory
+    read = memory.read
+    write = memory.write
+    delays = memory.page_delay
+    frame = memory.contention_frame
+
+    def contended_read(address):
+        t = cpu.access_time
+        delay = delays[address >> 14][(t - cpu.frame_start) % frame]
+        cpu.access_time = t + delay + 3
+        cpu.tstates += delay
+        return read(address)
+
+    def contended_write(address, value):
+        t = cpu.access_time
+        delay = delays[address >> 14][(t - cpu.frame_start) % frame]
+        cpu.access_time = t + delay + 3
+        cpu.tstates += delay
+        write(address, value)
+
+    return contended_read, contended_write
+
+
+def contended_fetchers(cpu):
+    """
+    Создает методы выборки операндов (fetch, fetch_word) и кода команды после префикса
+    (fetch_opcode) с задержкой спорного доступа по cpu.access_time, как у contended_accessors.
+    Чтение операнда занимает 3 такта, выборка кода команды (M1) - 4.
+
+    :param cpu: процессор
+    :return: (fetch, fetch_word, fetch_opcode)
+    """
+    regs = cpu.regs
+    pages = cpu.pages
+    delays = cpu.memory.page_delay
+    frame = cpu.memory.contention_frame
+
+    def fetch_byte(pc, cycles):
+        t = cpu.access_time
+        delay = delays[pc >> 14][(t - cpu.frame_start) % frame]
+        cpu.access_time = t + delay + cycles
+        cpu.tstates += delay
+        return pages[pc >> 14][pc & 0x3FFF]
+
+    def contended_fetch():
+        r = regs[REG_R]
+        regs[REG_R] = (r + 1) & 0x7F | (r & 0x80)
+        pc = regs[REG_PC]
+        regs[REG_PC] = (pc + 1) & 0xFFFF
+        return fetch_byte(pc, 3)
+
+    def contended_fetch_word():
+        r = regs[REG_R]
+        regs[REG_R] = (r + 2) & 0x7F | (r & 0x80)
+        pc = regs[REG_PC]
+        regs[REG_PC] = (pc + 2) & 0xFFFF
+        low = fetch_byte(pc, 3)
+        return (fetch_byte((pc + 1) & 0xFFFF, 3) << 8) | low
+
+    def contended_fetch_opcode():
+        r = regs[REG_R]
+        regs[REG_R] = (r + 1) & 0x7F | (r & 0x80)
+        pc = regs[REG_PC]
+        regs[REG_PC] = (pc + 1) & 0xFFFF
+        return fetch_byte(pc, 4)
+
+    return contended_fetch, contended_fetch_word, contended_fetch_opcode
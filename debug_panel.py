@@ -0,0 +1,157 @@
+# debug_panel.py
+# Панель отладки: текстовые поля из кэша глифов, перерисовка только изменившихся полей
+
+import time
+
+import pygame
+
+
+class GlyphAtlas:
+    """
+    Глифы шрифта, отрисованные по одному разу в общую поверхность.
+
+    Строка выводится одним вызовом blits из готовых глифов, без font.render; каждый
+    глиф сдвигает позицию на свою ширину (у моноширинного шрифта - одинаковую).
+    Место под новый символ выделяется при первом использовании.
+    """
+    def __init__(self, font, color, background, slots=256):
+        """
+        :param font: pygame.font.Font
+        :param color: цвет текста
+        :param background: цвет фона
+        :param slots: число мест под глифы; символы сверх них рисуются font.render
+        """
+        self.font = font
+        self.color = color
+        self.background = background
+        self.width, self.height = font.size('M')   # Размер места под глиф
+        self.columns = 16
+        self.slots = slots
+        self.surface = pygame.Surface((self.columns * self.width, -(-slots // self.columns) * self.height))
+        self.surface.fill(background)
+        self.rects = {}     # Символ -> место глифа в surface
+
+    def glyph(self, char):
+        """
+        :param char: символ
+        :return: (поверхность, область) глифа
+        """
+        rect = self.rects.get(char)
+        if rect is not None:
+            return self.surface, rect
+        rendered = self.font.render(char, True, self.color, self.background)
+        # Глиф шире места обрезается, чтобы не залезть на соседний
+        width = min(rendered.get_width(), self.width)
+        n = len(self.rects)
+        if n >= self.slots:
+            return rendered, pygame.Rect(0, 0, width, self.height)
+        rect = pygame.Rect((n % self.columns) * self.width, (n // self.columns) * self.height,
+                           width, self.height)
+        self.surface.blit(rendered, rect, (0, 0, width, self.height))
+        self.rects[char] = rect
+        return self.surface, rect
+
+    def draw(self, surface, text, pos, clear_width=0):
+        """
+        Выводит текст, предварительно очищая место под него.
+
+        :param surface: поверхность вывода
+        :param text: строка
+        :param pos: левый верхний угол
+        :param clear_width: ширина очищаемой области, если она больше ширины текста (прежний текст)
+        :return: (pygame.Rect измененной области, ширина текста)
+        """
+        x, y = pos
+        blits = []
+        for char in text:
+            source, rect = self.glyph(char)
+            blits.append((source, (x, y), rect))
+            x += rect.width
+        width = x - pos[0]
+        area = pygame.Rect(pos, (max(width, clear_width), self.height))
+        surface.fill(self.background, area)
+        surface.blits(blits, doreturn=False)
+        return area, width
+
+
+class DebugPanel:
+    """
+    Панель отладки из полей - строк, которые выдают функции источников
+    (Z80.register_lines, Keyboard.keyboard_lines, Memory.memory_dump_lines).
+
+    update() опрашивает источники не чаще interval, сравнивает строки с выведенными
+    и перерисовывает только изменившиеся поля. Скрытая панель источники не опрашивает.
+    """
+    def __init__(self, surface, font, interval=0.1, color=(255, 255, 255), background=(0, 0, 0)):
+        """
+        :param surface: поверхность панели
+        :param font: pygame.font.Font
+        :param interval: период обновления, секунды
+        :param color: цвет текста
+        :param background: цвет фона
+        """
+        self.surface = surface
+        self.atlas = GlyphAtlas(font, color, background)
+        self.background = background
+        self.interval = interval
+        self.line_height = 20
+        self.sections = []      # (x, y, источник, столбцов, ширина столбца)
+        self.shown = {}         # (x, y) поля -> (выведенная строка, ее ширина)
+        self.visible = True
+        self.next_time = 0.0    # Время следующего обновления (perf_counter)
+        self.cleared = True     # Поверхность нужно вывести целиком
+
+    def add_section(self, x, y, source, columns=1, column_width=0):
+        """
+        Добавляет группу полей: строки источника раскладываются по строкам и столбцам.
+
+        :param x: левый край
+        :param y: верхний край
+        :param source: функция без параметров, возвращающая список строк
+        :param columns: число столбцов
+        :param column_width: ширина столбца
+        """
+        self.sections.append((x, y, source, columns, column_width))
+
+    def set_visible(self, visible):
+        """
+        Показывает или скрывает панель. Скрытая панель залита фоном.
+
+        :param visible: True - показать
+        """
+        self.visible = visible
+        self.surface.fill(self.background)
+        self.shown.clear()
+        self.next_time = 0.0
+        self.cleared = True
+
+    def update(self, now=None):
+        """
+        Обновляет поля, если подошло время.
+
+        :param now: текущее время perf_counter (по умолчанию берется само)
+        :return: список pygame.Rect измененных областей поверхности панели
+        """
+        if self.cleared:
+            self.cleared = False
+            rects = [self.surface.get_rect()]
+        else:
+            rects = []
+        if not self.visible:
+            return rects
+        now = time.perf_counter() if now is None else now
+        if now < self.next_time:
+            return rects
+        self.next_time = now + self.interval
+
+        shown = self.shown
+        for x, y, source, columns, column_width in self.sections:
+            for i, text in enumerate(source()):
+                pos = (x + (i % columns) * column_width, y + (i // columns) * self.line_height)
+                old_text, old_width = shown.get(pos, (None, 0))
+                if text == old_text:
+                    continue
+                rect, width = self.atlas.draw(self.surface, text, pos, old_width)
+                shown[pos] = (text, width)
+                rects.append(rect)
+        return rects
@@ -7,12 +7,28 @@ from new_cpu import Z80
 from interrupt_controller import InterruptController
 from io_controller import IOController
 from graphics import ZX_Spectrum_Graphics
+from border import BorderLog
+from debug_panel import DebugPanel
+from scheduler import FrameScheduler
 from keyboard import Keyboard
+from worker import EmulationWorker
 import os
+import sys
+import time
 import const
 import zipfile
 import tempfile
 
+# Клавиши команд эмулятора (apply_command); F1 - меню, F6 - маска экрана, F9 - панель отладки
+COMMAND_KEYS = {
+    pygame.K_F2: 'reset',
+    pygame.K_F3: 'translation',
+    pygame.K_F4: 'idle_skip',
+    pygame.K_F5: 'contention',
+    pygame.K_F7: 'turbo',
+    pygame.K_F8: 'frame_skip',
+}
+
 def draw_text(surface, text, pos, font, color):
     rendered_text = font.render(text, True, color)
     surface.blit(rendered_text, pos)
@@ -53,7 +69,13 @@ def get_rom_files(directory):
                     rom_files.append((file, full_path))
     return rom_files
 
-def zx_spectrum_menu():
+def zx_spectrum_menu(message=None):
+    """
+    Меню выбора файла.
+
+    :param message: сообщение об ошибке внизу меню (None - без сообщения)
+    :return: ((имя, путь) выбранного файла, ПЗУ 48, ПЗУ 128) или None
+    """
     pygame.init()
     screen = pygame.display.set_mode((640, 480))
     pygame.display.set_caption("ZX Spectrum ROM Selector")
@@ -62,6 +84,7 @@ def zx_spectrum_menu():
     WHITE = (255, 255, 255)
     CYAN = (0, 255, 255)
     MAGENTA = (255, 0, 255)
+    RED = (255, 64, 64)
 
     font = pygame.font.Font(None, 32)
 
@@ -92,6 +115,9 @@ def zx_spectrum_menu():
                 color = MAGENTA if index == selected else WHITE
                 draw_text(screen, files[index][0], (40, rainbow_height + 90 + i * 30), font, color)
 
+        if message:
+            draw_text(screen, message, (20, rainbow_height + 90 + max_visible * 30 + 5), font, RED)
+
         pygame.display.flip()
 
         for event in pygame.event.get():
@@ -119,15 +145,20 @@ def zx_spectrum_menu():
 
 
 class ZX_Spectrum_Emulator:
-    def __init__(self):
+    def __init__(self, machine='128k'):
         self.pixel_size = 3  # Увеличение пикселей для визуализации
         self.border_size = 80
-        self.memory = Memory()
+        self.memory = Memory(machine)  # Модель памяти: '128k', 'pentagon512', 'pentagon1024', 'scorpion256'
         self.io_controller = IOController(self)
         self.cpu = Z80(self.memory, self.io_controller, 0x0000)
+        self.cpu.set_translation(True)  # F3 - переключение трансляции блоков
+        self.cpu.set_idle_skip(True)    # F4 - переключение пропуска холостых циклов
+        self.cpu.set_contention(True)   # F5 - переключение задержек спорной памяти
         self.interrupt_controller = InterruptController(self.cpu)
         self.graphics = ZX_Spectrum_Graphics(self.memory, self.pixel_size)
         self.keyboard = Keyboard(self.io_controller)
+        self.border_log = BorderLog(self.memory.timing)  # Смены цвета границы за кадр
+        self.scheduler = FrameScheduler()  # 50 Гц; F7 - турбо, F8 - пропуск вывода кадров
         self.reset_requested = False
 
     def load_rom(self, file_path, addr=0):
@@ -140,9 +171,10 @@ class ZX_Spectrum_Emulator:
         self.graphics.load_scr_file(file_path)
 
     def set_border(self, color):
-        # Визуализация установки цвета границы
+        # Визуализация установки цвета границы: смена заносится в журнал с тактом записи,
+        # бордюр раскрашивается по строкам в конце кадра
         #print(f"Цвет границы установлен на {color}")
-        pass
+        self.border_log.add(self.cpu.tstates, color)
 
     def reset(self):
         self.cpu.reset()
@@ -150,6 +182,62 @@ class ZX_Spectrum_Emulator:
         self.reset_requested = False
         print("CPU reset performed")
 
+    def load_files(self, rom_file, selected_file):
+        """
+        Загружает ПЗУ (по размеру файла: 16К или 128К) и снапшот .z80/.sna.
+
+        :param rom_file: (имя, путь) файла ПЗУ
+        :param selected_file: (имя, путь) выбранного в меню файла
+        """
+        file_name, file_path = rom_file
+        file_size = os.path.getsize(file_path)
+
+        print(f"Loading file: {file_name}")
+        print(f"File size: {file_size} bytes")
+
+        if file_size > 16 * 1024:  # Если файл больше 16 КБ
+            print("Using load_rom128 method")
+            self.load_rom128(file_path)
+        else:
+            print("Using load_rom method")
+            self.load_rom(file_path)
+
+        file_name, file_path = selected_file
+        #Если грузим снапшот, то принудительно выбираем ПЗУ 48 для загрузки
+        if file_name.lower().endswith('z80'):
+            self.memory.load_snapshot_z80(file_path, self.cpu)
+        if file_name.lower().endswith('sna'):
+            self.memory.load_snapshot_sna(file_path, self.cpu)
+
+    def apply_command(self, command):
+        """
+        Выполняет команду эмулятора (COMMAND_KEYS); в режиме worker команда
+        выполняется в процессе с машиной.
+
+        :param command: 'reset', 'translation', 'idle_skip', 'contention', 'turbo' или 'frame_skip'
+        """
+        if command == 'reset':
+            self.reset_requested = True
+        elif command == 'translation':
+            self.cpu.set_translation(self.cpu.translator is None)
+            print(f"Block translation: {'on' if self.cpu.translator else 'off'}")
+        elif command == 'idle_skip':
+            if self.cpu.idle_detector is not None:
+                print(f"Idle loop skipping: off (skipped {self.cpu.idle_detector.skipped_tstates} T-states)")
+                self.cpu.set_idle_skip(False)
+            else:
+                self.cpu.set_idle_skip(True)
+                print("Idle loop skipping: on")
+        elif command == 'contention':
+            self.cpu.set_contention(not self.cpu.contended)
+            print(f"Memory contention: {'on' if self.cpu.contended else 'off'}")
+        elif command == 'turbo':
+            self.scheduler.turbo = not self.scheduler.turbo
+            print(f"Turbo: {'on' if self.scheduler.turbo else 'off'}")
+        elif command == 'frame_skip':
+            self.scheduler.frame_skip = not self.scheduler.frame_skip
+            print(f"Frame skip: {'on' if self.scheduler.frame_skip else 'off'} (skipped {self.scheduler.skipped_total} frames)")
+
     def emulate_load_screen(self, file_path):
         pygame.init()
         # Основное окно
@@ -178,7 +266,14 @@ class ZX_Spectrum_Emulator:
             pygame.display.flip()
         pygame.quit()
 
-    def emulate(self):
+    def emulate(self, worker=None):
+        """
+        Окно эмулятора: эмуляция кадров, вывод и ввод.
+
+        :param worker: EmulationWorker - машина работает в отдельном процессе, а здесь
+                       только выводятся его кадры; None - эмуляция в этом процессе
+        :return: "OPEN_MENU", если нажата F1
+        """
         pygame.init()
 
         # Удаление файла, если он существует
@@ -213,14 +308,21 @@ class ZX_Spectrum_Emulator:
         main_screen.blit(state_window, (self.graphics.screen_width * self.pixel_size + self.border_size * 2, 0))
 
         font = pygame.font.SysFont('Courier', 18)
-        clock = pygame.time.Clock()
+        # Панель отладки: поля обновляются 10 раз в секунду, перерисовываются только изменения
+        debug_panel = DebugPanel(state_window, font)
+        debug_panel.add_section(10, 10, self.cpu.register_lines)
+        debug_panel.add_section(10, 210, self.keyboard.keyboard_lines)
+        debug_panel.add_section(10, 400, lambda: self.memory.memory_dump_lines(0x5CA6, 32), 2, 210)
+        self.border_log.invalidate()  # Новая поверхность бордюра
+        self.scheduler.restart()
+        border_rect = border.get_rect()
+        state_rect = state_window.get_rect(topleft=(border_rect.width, 0))
 
         # Загрузка .scr файла
         #self.graphics.reset_screen(0, 7, 1)
         #self.load_scr_file('example.scr')
 
         running = True
-        i = 0
         while running:
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
@@ -228,8 +330,17 @@ class ZX_Spectrum_Emulator:
                 elif event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_F1:
                         return "OPEN_MENU"  # Сигнал для открытия меню
-                    elif event.key == pygame.K_F2:
-                        self.reset_requested = True
+                    elif event.key == pygame.K_F6:
+                        modes = (None, 'scanlines', 'crt')
+                        self.graphics.set_scanlines(modes[(modes.index(self.graphics.scanlines) + 1) % len(modes)])
+                        print(f"Screen mask: {self.graphics.scanlines or 'off'}")
+                    elif event.key == pygame.K_F9:
+                        debug_panel.set_visible(not debug_panel.visible)
+                    elif event.key in COMMAND_KEYS:
+                        if worker is None:
+                            self.apply_command(COMMAND_KEYS[event.key])
+                        else:
+                            worker.send_command(COMMAND_KEYS[event.key])
 
             if self.reset_requested:
                 self.reset()
@@ -238,73 +349,67 @@ class ZX_Spectrum_Emulator:
             # Для демонстрации клавиатурного ввода:
             #print(self.keyboard.get_matrix())
 
-            #for j in range(10000):
-            #    if not self.cpu.halted:
-            #        self.cpu.execute_instruction()  # Заглушка для обработки инструкций
-            #    # Условие для вызова прерываний, например, каждые 20 мс
-            #    self.interrupt_controller.check_and_trigger_interrupt()
-
-            if not self.cpu.halted:
-                #prev_pc = self.cpu.pc
-                prev_pc = self.cpu.registers['PC']
-                self.cpu.execute_instruction()  # обработка инструкций
-
-            # Условие для вызова прерываний, например, каждые 20 мс
-            self.interrupt_controller.check_and_trigger_interrupt()
-
-
-            # Рендеринг основного окна
-            #screen.fill((0, 0, 0))
-            i += 1
-            if i > 100000:
-                i = 0
-
-            #if self.cpu.registers['PC'] == 0x0C0A: print('init')
-            #a = self.cpu.registers['A']
-            #if self.cpu.registers['PC'] == 0x0010: print(const.spectrum_characters[a])
-
-            #if self.cpu.registers['PC'] == 0x09F4:
-            #    logging.disable(logging.NOTSET)
-            #    log_on = True
-            #if prev_pc == 0x0052:
-            #    logging.disable(logging.NOTSET)
-            #    logging.info('========== Finish interrupt ==========')
-            #    logging.disable()
-            #    if log_on: logging.disable(logging.NOTSET)
-
-
-            #if self.cpu.interrupts_enabled == False and i > 0 : continue
-            if i % 10000 == 0:
-
-                if i % 10000 == 0:
-                    self.graphics.render_screen()
-
-                # Рендеринг окна состояния
-                state_window.fill((0, 0, 0))
-                self.cpu.display_registers(state_window, font, 0)
-                self.keyboard.display_keyboard(state_window, font, 200)
-                self.memory.display_memory_dump(0x5CA6, 32, state_window, font, 400)
-                #pygame.display.update(state_window.get_rect())
-
-                #заливка бордера
-                pygame.draw.rect(border, self.graphics.colors[self.io_controller.border_color] , (0, 0, border.get_width(), border.get_height()))
-
-                # Отрисовка на основном экране
-                main_screen.blit(border, (0, 0))
-                main_screen.blit(screen, (self.border_size, self.border_size))
-                main_screen.blit(state_window, (self.graphics.screen_width * self.pixel_size + self.border_size * 2, 0))
-
-                pygame.display.flip()
-            #clock.tick(50)
+            if worker is None:
+                # Один кадр (20 мс, длительность в тактах по модели): прерывание в начале кадра
+                # и команды до его конца; вывод при отставании от 50 Гц может пропускаться
+                self.cpu.run_frame()
+                present = self.scheduler.present_frame()
+            else:
+                # Кадры эмулирует worker: выводится последний опубликованный
+                worker.send_keys(self.keyboard.keyboard_matrix)
+                present = worker.receive(self)
+
+            if present:
+                # Рендеринг основного окна: список измененных участков экрана
+                self.graphics.update_flash(self.cpu.frames)
+                rects = self.graphics.render_screen()
+
+                # Окно состояния: измененные поля панели отладки
+                panel_rects = debug_panel.update()
+
+                # Отрисовка на основном экране: в окно переносятся только изменения
+                # Бордюр по строкам из журнала записей в порт FE (при смене окно обновляется целиком)
+                if self.border_log.paint(border, self.cpu.frame_start, self.border_size,
+                                         self.pixel_size, self.graphics.colors):
+                    main_screen.blit(border, (0, 0))
+                    main_screen.blit(screen, (self.border_size, self.border_size))
+                    update_rects = [border_rect]
+                else:
+                    update_rects = [rect.move(self.border_size, self.border_size) for rect in rects]
+                    for rect, window_rect in zip(rects, update_rects):
+                        main_screen.blit(screen, window_rect, rect)
+                for rect in panel_rects:
+                    window_rect = rect.move(state_rect.topleft)
+                    main_screen.blit(state_window, window_rect, rect)
+                    update_rects.append(window_rect)
+
+                pygame.display.update(update_rects)
+
+            # Ожидание следующего кадра
+            if worker is None:
+                self.scheduler.wait()
+            elif not present:
+                if not worker.is_alive():
+                    print("Emulation worker stopped")
+                    running = False
+                time.sleep(worker.poll_interval)
 
         pygame.quit()
 
 
-def main_loop():
-    zx_emulator = ZX_Spectrum_Emulator()
+def main_loop(machine='128k', use_worker=False):
+    """
+    Меню выбора файла и эмуляция выбранного.
+
+    :param machine: модель машины (memory.MACHINES)
+    :param use_worker: True - машина работает в отдельном процессе (EmulationWorker)
+    """
+    zx_emulator = ZX_Spectrum_Emulator(machine)
+    message = None
 
     while True:
-        selected_file, rom48, rom128 = zx_spectrum_menu()
+        selected_file, rom48, rom128 = zx_spectrum_menu(message)
+        message = None
 
         if selected_file:
             zx_emulator.cpu.reset()
@@ -313,8 +418,9 @@ def main_loop():
             file_name, file_path = selected_file
 
             # Проверяем, является ли файл ZIP-архивом
-            if file_name.lower().endswith('.zip'):
-                # Если это ZIP, то file_path уже будет указывать на временный распакованный .z80 файл
+            if '.zip:' in file_name.lower():
+                # Если это файл из ZIP ("архив.zip:файл"), то file_path уже будет указывать
+                # на временный распакованный .z80 файл
                 file_name = os.path.basename(file_path)
                 zx_emulator.memory.temp_files.append(("snapshot", file_path))
 
@@ -335,31 +441,29 @@ def main_loop():
                 continue
 
 
-            file_size = os.path.getsize(file_path)
-
-            print(f"Loading file: {file_name}")
-            print(f"File size: {file_size} bytes")
-
-            if file_size > 16 * 1024:  # Если файл больше 16 КБ
-                print("Using load_rom128 method")
-                zx_emulator.load_rom128(file_path)
-            else:
-                print("Using load_rom method")
-                zx_emulator.load_rom(file_path)
-
-            file_name, file_path = selected_file
-            #Если грузим снапшот, то принудительно выбираем ПЗУ 48 для загрузки
-            if file_name.lower().endswith('z80'):
-                zx_emulator.memory.load_snapshot_z80(file_path, zx_emulator.cpu)
-            if file_name.lower().endswith('sna'):
-                zx_emulator.memory.load_snapshot_sna(file_path, zx_emulator.cpu)
-
-            # Очистка временных файлов
-            for _, path in zx_emulator.memory.temp_files:
-                if os.path.exists(path):
-                    os.unlink(path)
+            # Файлы загружает процесс с машиной: этот или worker
+            worker = None
+            try:
+                if use_worker:
+                    worker = EmulationWorker(machine, (file_name, file_path), selected_file)
+                else:
+                    zx_emulator.load_files((file_name, file_path), selected_file)
+            except RuntimeError as error:
+                # Процесс эмуляции не запустился: обратно в меню с сообщением
+                message = str(error)
+                print(f"Error: {message}")
+                continue
+            finally:
+                # Очистка временных файлов
+                for _, path in zx_emulator.memory.temp_files:
+                    if os.path.exists(path):
+                        os.unlink(path)
 
-            result = zx_emulator.emulate()
+            try:
+                result = zx_emulator.emulate(worker)
+            finally:
+                if worker is not None:
+                    worker.stop()
 
 
             if result != "OPEN_MENU":
@@ -396,4 +500,7 @@ if __name__ == "__main__":
     # Запуск эмуляции
     #zx_emulator.emulate()
 
-    main_loop()
+    # Модель машины можно передать первым аргументом: python emulator.py pentagon512
+    # --worker - эмуляция в отдельном процессе: python emulator.py 128k --worker
+    args = [arg for arg in sys.argv[1:] if arg != '--worker']
+    main_loop(args[0] if args else '128k', '--worker' in sys.argv[1:])
@@ -1,6 +1,424 @@
-from base_cpu import baseCPUClass
+from base_cpu import baseCPUClass, R8_SLOTS, FLAG_C, FLAG_N, FLAG_PV, FLAG_3, FLAG_H, FLAG_5, FLAG_Z, FLAG_S, INC_FLAGS, DEC_FLAGS, SZP, RLC_TABLE, RRC_TABLE, RL_TABLE, RR_TABLE, SLA_TABLE, SRA_TABLE, SLL_TABLE, SRL_TABLE, SZ53, PARITY, HALFCARRY_SUB, REG_F, REG_A, REG_B, REG_C, REG_D, REG_E, REG_H, REG_L, REG_IX, REG_IY, REG_SP, REG_PC, REG_I, REG_R
+from z80_timings import CB_TSTATES, ED_TSTATES, INDEX_TSTATES, INDEX_CB_TSTATES, BLOCK_REPEAT_TSTATES
+
+# Условия переходов: маска флага и ожидаемое значение бита
+CONDITIONS = {
+    'NZ': (0x40, 0), 'Z': (0x40, 0x40),
+    'NC': (0x01, 0), 'C': (0x01, 0x01),
+    'PO': (0x04, 0), 'PE': (0x04, 0x04),
+    'P': (0x80, 0), 'M': (0x80, 0x80),
+}
+
+
+def _noni(cpu):
+    """Неопределенная команда: выполняется как NOP (NONI)."""
+    pass
+
+
+def _build_cb_table():
+    """
+    Таблица команд с префиксом CB: сдвиги, BIT, RES и SET.
+    Функции принимают процессор; (HL) обрабатывается отдельными вариантами.
+    """
+    shifts = ('rlc', 'rrc', 'rl', 'rr', 'sla', 'sra', 'sll', 'srl')
+
+    def shift_r(name, slot):
+        def op(cpu):
+            regs = cpu.regs
+            regs[slot] = getattr(cpu, name)(regs[slot])
+        return op
+
+    def shift_hl(name):
+        def op(cpu):
+            regs = cpu.regs
+            hl = (regs[REG_H] << 8) | regs[REG_L]
+            cpu.modify_memory(hl, getattr(cpu, name)(cpu.read_byte(hl)))
+        return op
+
+    def bit_r(bit, slot):
+        return lambda cpu: cpu.bit(bit, cpu.regs[slot])
+
+    def bit_hl(bit):
+        return lambda cpu: cpu.bit(bit, cpu.read_byte((cpu.regs[REG_H] << 8) | cpu.regs[REG_L]))
+
+    def res_r(bit, slot):
+        mask = 0xFF ^ (1 << bit)
+        def op(cpu):
+            cpu.regs[slot] &= mask
+        return op
+
+    def res_hl(bit):
+        mask = 0xFF ^ (1 << bit)
+        def op(cpu):
+            regs = cpu.regs
+            hl = (regs[REG_H] << 8) | regs[REG_L]
+            cpu.modify_memory(hl, cpu.read_byte(hl) & mask)
+        return op
+
+    def set_r(bit, slot):
+        mask = 1 << bit
+        def op(cpu):
+            cpu.regs[slot] |= mask
+        return op
+
+    def set_hl(bit):
+        mask = 1 << bit
+        def op(cpu):
+            regs = cpu.regs
+            hl = (regs[REG_H] << 8) | regs[REG_L]
+            cpu.modify_memory(hl, cpu.read_byte(hl) | mask)
+        return op
+
+    table = []
+    for opcode in range(256):
+        slot = R8_SLOTS[opcode & 0x07]
+        bit = (opcode >> 3) & 0x07
+        if opcode < 0x40:  # Сдвиги и вращения
+            name = shifts[opcode >> 3]
+            table.append(shift_hl(name) if slot is None else shift_r(name, slot))
+        elif opcode < 0x80:  # BIT
+            table.append(bit_hl(bit) if slot is None else bit_r(bit, slot))
+        elif opcode < 0xC0:  # RES
+            table.append(res_hl(bit) if slot is None else res_r(bit, slot))
+        else:  # SET
+            table.append(set_hl(bit) if slot is None else set_r(bit, slot))
+    return table
+
+
+def _build_ed_table():
+    """
+    Таблица команд с префиксом ED.
+    Незадокументированные дубли NEG/RETN/IM заполнены, остальные пустые ячейки - NONI.
+    """
+    instructions = {
+        0x40: lambda cpu: cpu.in_r_c(REG_B),
+        0x41: lambda cpu: cpu.out_c_r(REG_B),
+        0x42: lambda cpu: cpu.sbc_hl('BC'),
+        0x43: lambda cpu: cpu.store_word(cpu.fetch_word(), cpu.get_register_pair('BC')),
+        0x44: lambda cpu: cpu.neg(),
+        0x45: lambda cpu: cpu.retn(),
+        0x46: lambda cpu: cpu.im(0),
+        0x47: lambda cpu: cpu.ld_i_a(),
+        0x48: lambda cpu: cpu.in_r_c(REG_C),
+        0x49: lambda cpu: cpu.out_c_r(REG_C),
+        0x4A: lambda cpu: cpu.adc_hl('BC'),
+        0x4B: lambda cpu: cpu.load_register_pair('BC', cpu.load_word(cpu.fetch_word())),
+        0x4D: lambda cpu: cpu.reti(),
+        0x4F: lambda cpu: cpu.ld_r_a(),
+        0x50: lambda cpu: cpu.in_r_c(REG_D),
+        0x51: lambda cpu: cpu.out_c_r(REG_D),
+        0x52: lambda cpu: cpu.sbc_hl('DE'),
+        0x53: lambda cpu: cpu.store_word(cpu.fetch_word(), cpu.get_register_pair('DE')),
+        0x56: lambda cpu: cpu.im(1),
+        0x57: lambda cpu: cpu.ld_a_i(),
+        0x58: lambda cpu: cpu.in_r_c(REG_E),
+        0x59: lambda cpu: cpu.out_c_r(REG_E),
+        0x5A: lambda cpu: cpu.adc_hl('DE'),
+        0x5B: lambda cpu: cpu.load_register_pair('DE', cpu.load_word(cpu.fetch_word())),
+        0x5E: lambda cpu: cpu.im(2),
+        0x5F: lambda cpu: cpu.ld_a_r(),
+        0x60: lambda cpu: cpu.in_r_c(REG_H),
+        0x61: lambda cpu: cpu.out_c_r(REG_H),
+        0x62: lambda cpu: cpu.sbc_hl('HL'),
+        0x63: lambda cpu: cpu.store_word(cpu.fetch_word(), cpu.get_register_pair('HL')),
+        0x67: lambda cpu: cpu.rrd(),
+        0x68: lambda cpu: cpu.in_r_c(REG_L),
+        0x69: lambda cpu: cpu.out_c_r(REG_L),
+        0x6A: lambda cpu: cpu.adc_hl('HL'),
+        0x6B: lambda cpu: cpu.load_register_pair('HL', cpu.load_word(cpu.fetch_word())),
+        0x6F: lambda cpu: cpu.rld(),
+        0x72: lambda cpu: cpu.sbc_hl('SP'),
+        0x73: lambda cpu: cpu.store_word(cpu.fetch_word(), cpu.get_register_pair('SP')),
+        0x78: lambda cpu: cpu.in_r_c(REG_A),
+        0x79: lambda cpu: cpu.out_c_r(REG_A),
+        0x7A: lambda cpu: cpu.adc_hl('SP'),
+        0x7B: lambda cpu: cpu.load_register_pair('SP', cpu.load_word(cpu.fetch_word())),
+        0xA0: lambda cpu: cpu.ldi(),
+        0xA1: lambda cpu: cpu.cpi(),
+        0xA2: lambda cpu: cpu.ini(),
+        0xA3: lambda cpu: cpu.outi(),
+        0xA8: lambda cpu: cpu.ldd(),
+        0xA9: lambda cpu: cpu.cpd(),
+        0xAA: lambda cpu: cpu.ind(),
+        0xAB: lambda cpu: cpu.outd(),
+        0xB0: lambda cpu: cpu.ldir(),
+        0xB1: lambda cpu: cpu.cpir(),
+        0xB2: lambda cpu: cpu.inir(),
+        0xB3: lambda cpu: cpu.otir(),
+        0xB8: lambda cpu: cpu.lddr(),
+        0xB9: lambda cpu: cpu.cpdr(),
+        0xBA: lambda cpu: cpu.indr(),
+        0xBB: lambda cpu: cpu.otdr(),
+    }
+    # Дубли: NEG, RETN и IM повторяются в незадокументированных ячейках
+    for opcode in (0x4C, 0x54, 0x5C, 0x64, 0x6C, 0x74, 0x7C):
+        instructions[opcode] = instructions[0x44]
+    for opcode in (0x55, 0x5D, 0x65, 0x6D, 0x75, 0x7D):
+        instructions[opcode] = instructions[0x45]
+    for opcode in (0x4E, 0x66, 0x6E):
+        instructions[opcode] = instructions[0x46]
+    instructions[0x76] = instructions[0x56]
+    instructions[0x7E] = instructions[0x5E]
+
+    table = [_noni] * 256
+    for opcode, handler in instructions.items():
+        table[opcode] = handler
+    return table
+
+
+def _build_index_table(index_reg):
+    """
+    Таблица команд с префиксом DD (index_reg = REG_IX) или FD (REG_IY).
+    Команды, не использующие индексный регистр, выполняются как без префикса:
+    пустые ячейки передают управление основной таблице MAIN_TABLE.
+
+    :param index_reg: индекс индексного регистра в регистровом файле
+    """
+    name = 'IX' if index_reg == REG_IX else 'IY'
+
+    def unprefixed(opcode):
+        return lambda cpu: cpu.MAIN_TABLE[opcode](cpu)
+
+    def inc_index_h(cpu):
+        regs = cpu.regs
+        result = ((regs[index_reg] >> 8) + 1) & 0xFF
+        regs[index_reg] = (regs[index_reg] & 0x00FF) | (result << 8)
+        regs[REG_F] = (regs[REG_F] & FLAG_C) | INC_FLAGS[result]
+
+    def dec_index_h(cpu):
+        regs = cpu.regs
+        result = ((regs[index_reg] >> 8) - 1) & 0xFF
+        regs[index_reg] = (regs[index_reg] & 0x00FF) | (result << 8)
+        regs[REG_F] = (regs[REG_F] & FLAG_C) | DEC_FLAGS[result]
+
+    def inc_index(cpu):
+        cpu.regs[index_reg] = (cpu.regs[index_reg] + 1) & 0xFFFF
+
+    def dec_index(cpu):
+        cpu.regs[index_reg] = (cpu.regs[index_reg] - 1) & 0xFFFF
+
+    def ld_index_nn(cpu):
+        cpu.regs[index_reg] = cpu.fetch_word()
+
+    def ld_nn_index(cpu):
+        cpu.store_word(cpu.fetch_word(), cpu.regs[index_reg])
+
+    def ld_index_mem(cpu):
+        address = cpu.fetch_word()
+        cpu.regs[index_reg] = cpu.read_byte(address) | (cpu.read_byte(address + 1) << 8)
+
+    def ld_index_d_n(cpu):
+        offset = cpu.fetch_signed()
+        value = cpu.fetch()
+        cpu.access_time += 2
+        cpu.write_byte((cpu.regs[index_reg] + offset) & 0xFFFF, value)
+
+    def jp_index(cpu):
+        cpu.regs[REG_PC] = cpu.regs[index_reg]
+
+    def ld_sp_index(cpu):
+        cpu.regs[REG_SP] = cpu.regs[index_reg]
+
+    def pop_index(cpu):
+        regs = cpu.regs
+        regs[index_reg] = cpu.read_byte(regs[REG_SP]) | (cpu.read_byte(regs[REG_SP] + 1) << 8)
+        regs[REG_SP] = (regs[REG_SP] + 2) & 0xFFFF
+
+    def indexed_cb(cpu):
+        offset = cpu.fetch_signed()
+        opcode = cpu.fetch()
+        cpu.access_time += 2
+        cpu.tstates += INDEX_CB_TSTATES[opcode]
+        cpu.DDCB_TABLE[opcode](cpu, (cpu.regs[index_reg] + offset) & 0xFFFF)
+
+    # Загрузки r <- IXh/IXl
+    def ld_r_index_h(slot):
+        def op(cpu):
+            cpu.regs[slot] = cpu.regs[index_reg] >> 8
+        return op
+
+    def ld_r_index_l(slot):
+        def op(cpu):
+            cpu.regs[slot] = cpu.regs[index_reg] & 0xFF
+        return op
+
+    # Загрузки IXh/IXl <- r
+    def ld_index_h_r(slot):
+        def op(cpu):
+            regs = cpu.regs
+            regs[index_reg] = (regs[slot] << 8) | (regs[index_reg] & 0xFF)
+        return op
+
+    def ld_index_l_r(slot):
+        def op(cpu):
+            regs = cpu.regs
+            regs[index_reg] = (regs[index_reg] & 0xFF00) | regs[slot]
+        return op
+
+    def ld_index_h_n(cpu):
+        value = cpu.fetch()
+        cpu.regs[index_reg] = (cpu.regs[index_reg] & 0x00FF) | (value << 8)
+
+    def ld_index_l_n(cpu):
+        value = cpu.fetch()
+        cpu.regs[index_reg] = (cpu.regs[index_reg] & 0xFF00) | value
+
+    def ld_index_h_l(cpu):
+        value = cpu.regs[index_reg] & 0xFF
+        cpu.regs[index_reg] = (value << 8) | value
+
+    def ld_index_l_h(cpu):
+        value = cpu.regs[index_reg] >> 8
+        cpu.regs[index_reg] = (value << 8) | value
+
+    # LD r, (IX+d) и LD (IX+d), r
+    def ld_r_index_d(slot):
+        def op(cpu):
+            offset = cpu.fetch_displacement()
+            cpu.regs[slot] = cpu.read_byte((cpu.regs[index_reg] + offset) & 0xFFFF)
+        return op
+
+    def ld_index_d_r(slot):
+        def op(cpu):
+            offset = cpu.fetch_displacement()
+            cpu.write_byte((cpu.regs[index_reg] + offset) & 0xFFFF, cpu.regs[slot])
+        return op
+
+    # Арифметика с операндом IXh, IXl или (IX+d)
+    alu = ('add', 'adc', 'sub', 'sbc', 'and_a', 'xor_a', 'or_a', 'cp')
+
+    def alu_index_h(operation):
+        return lambda cpu: getattr(cpu, operation)(cpu.regs[index_reg] >> 8)
+
+    def alu_index_l(operation):
+        return lambda cpu: getattr(cpu, operation)(cpu.regs[index_reg] & 0xFF)
+
+    def alu_index_d(operation):
+        def op(cpu):
+            offset = cpu.fetch_displacement()
+            getattr(cpu, operation)(cpu.read_byte((cpu.regs[index_reg] + offset) & 0xFFFF))
+        return op
+
+    instructions = {
+        0x09: lambda cpu: cpu.add_index(index_reg, 'BC'),
+        0x19: lambda cpu: cpu.add_index(index_reg, 'DE'),
+        0x29: lambda cpu: cpu.add_index(index_reg, name),
+        0x39: lambda cpu: cpu.add_index(index_reg, 'SP'),
+        0x21: ld_index_nn,
+        0x22: ld_nn_index,
+        0x23: inc_index,
+        0x24: inc_index_h,
+        0x25: dec_index_h,
+        0x26: ld_index_h_n,
+        0x2A: ld_index_mem,
+        0x2B: dec_index,
+        0x2C: lambda cpu: cpu.inc_index_l(index_reg),
+        0x2D: lambda cpu: cpu.dec_index_l(index_reg),
+        0x2E: ld_index_l_n,
+        0x34: lambda cpu: cpu.inc_index_d(index_reg),
+        0x35: lambda cpu: cpu.dec_index_d(index_reg),
+        0x36: ld_index_d_n,
+        0x64: _noni,         # LD IXh,IXh
+        0x65: ld_index_h_l,  # LD IXh,IXl
+        0x6C: ld_index_l_h,  # LD IXl,IXh
+        0x6D: _noni,         # LD IXl,IXl
+        0xCB: indexed_cb,
+        0xE1: pop_index,
+        0xE3: lambda cpu: cpu.ex_sp_ix(index_reg),
+        0xE5: lambda cpu: cpu.push_index_reg(index_reg),
+        0xE9: jp_index,
+        0xF9: ld_sp_index,
+    }
+    for code in range(8):
+        slot = R8_SLOTS[code]
+        if slot is None or slot in (REG_H, REG_L):
+            continue
+        instructions[0x44 | (code << 3)] = ld_r_index_h(slot)  # LD r,IXh
+        instructions[0x45 | (code << 3)] = ld_r_index_l(slot)  # LD r,IXl
+        instructions[0x60 | code] = ld_index_h_r(slot)         # LD IXh,r
+        instructions[0x68 | code] = ld_index_l_r(slot)         # LD IXl,r
+    for code in range(8):
+        slot = R8_SLOTS[code]
+        if slot is None:
+            continue
+        instructions[0x46 | (code << 3)] = ld_r_index_d(slot)  # LD r,(IX+d)
+        instructions[0x70 | code] = ld_index_d_r(slot)         # LD (IX+d),r
+    for code, operation in enumerate(alu):
+        instructions[0x84 | (code << 3)] = alu_index_h(operation)
+        instructions[0x85 | (code << 3)] = alu_index_l(operation)
+        instructions[0x86 | (code << 3)] = alu_index_d(operation)
+
+    table = [unprefixed(opcode) for opcode in range(256)]
+    for opcode, handler in instructions.items():
+        table[opcode] = handler
+    return table
+
+
+def _build_index_cb_table():
+    """
+    Таблица команд DD CB d op / FD CB d op.
+    Функции принимают процессор и уже вычисленный адрес IX+d/IY+d, поэтому таблица общая для IX и IY.
+    Результат сдвигов, RES и SET дополнительно копируется в регистр r (недокументированное поведение).
+    """
+    shifts = ('rlc', 'rrc', 'rl', 'rr', 'sla', 'sra', 'sll', 'srl')
+
+    def shift(name, slot):
+        def op(cpu, address):
+            result = getattr(cpu, name)(cpu.read_byte(address))
+            cpu.modify_memory(address, result)
+            if slot is not None:
+                cpu.regs[slot] = result
+        return op
+
+    def bit(bit):
+        def op(cpu, address):
+            cpu.bit(bit, cpu.read_byte(address))
+            # Флаги F5 и F3 берутся из старшего байта адреса
+            cpu.regs[REG_F] = (cpu.regs[REG_F] & ~(FLAG_5 | FLAG_3)) | ((address >> 8) & (FLAG_5 | FLAG_3))
+        return op
+
+    def res(bit, slot):
+        mask = 0xFF ^ (1 << bit)
+        def op(cpu, address):
+            result = cpu.read_byte(address) & mask
+            cpu.modify_memory(address, result)
+            if slot is not None:
+                cpu.regs[slot] = result
+        return op
+
+    def set_(bit, slot):
+        mask = 1 << bit
+        def op(cpu, address):
+            result = cpu.read_byte(address) | mask
+            cpu.modify_memory(address, result)
+            if slot is not None:
+                cpu.regs[slot] = result
+        return op
+
+    table = []
+    for opcode in range(256):
+        slot = R8_SLOTS[opcode & 0x07]
+        n = (opcode >> 3) & 0x07
+        if opcode < 0x40:
+            table.append(shift(shifts[opcode >> 3], slot))
+        elif opcode < 0x80:
+            table.append(bit(n))
+        elif opcode < 0xC0:
+            table.append(res(n, slot))
+        else:
+            table.append(set_(n, slot))
+    return table
+
 
 class extCPUClass(baseCPUClass):
+    # Таблицы префиксных команд строятся один раз для класса
+    CB_TABLE = _build_cb_table()
+    ED_TABLE = _build_ed_table()
+    DD_TABLE = _build_index_table(REG_IX)
+    FD_TABLE = _build_index_table(REG_IY)
+    DDCB_TABLE = _build_index_cb_table()
+    FDCB_TABLE = DDCB_TABLE
+
     def __init__(self):
         super().__init__()
 
@@ -10,7 +428,7 @@ class extCPUClass(baseCPUClass):
 
         :param address: 16-битный адрес для перехода
         """
-        self.registers['PC'] = address & 0xFFFF
+        self.regs[REG_PC] = address & 0xFFFF
 
     def jp_cc(self, condition, address):
         """
@@ -20,7 +438,7 @@ class extCPUClass(baseCPUClass):
         :param address: 16-битный адрес для перехода
         """
         if self.check_condition(condition):
-            self.registers['PC'] = address & 0xFFFF
+            self.regs[REG_PC] = address & 0xFFFF
 
     def jr(self, offset):
         """
@@ -32,8 +450,9 @@ class extCPUClass(baseCPUClass):
         if offset > 127:
             offset -= 256
         #print('******************************************************************* JUMP ', offset)
-        #print(f"B:{self.registers['B']}")
-        self.registers['PC'] = (self.registers['PC'] + offset) & 0xFFFF
+        #print(f"B:{self.regs[REG_B]}")
+        regs = self.regs
+        regs[REG_PC] = (regs[REG_PC] + offset) & 0xFFFF
 
     def jr_cc(self, condition, offset):
         """
@@ -43,6 +462,7 @@ class extCPUClass(baseCPUClass):
         :param offset: 8-битное знаковое смещение (-128 до 127)
         """
         if self.check_condition(condition):
+            self.tstates += 5
             self.jr(offset)
 
     def djnz(self, offset):
@@ -51,8 +471,11 @@ class extCPUClass(baseCPUClass):
 
         :param offset: 8-битное знаковое смещение (-128 до 127)
         """
-        self.registers['B'] = (self.registers['B'] - 1) & 0xFF
-        if self.registers['B'] != 0:
+        regs = self.regs
+        b = (regs[REG_B] - 1) & 0xFF
+        regs[REG_B] = b
+        if b != 0:
+            self.tstates += 5
             self.jr(offset)
 
     def call(self, address):
@@ -61,15 +484,16 @@ class extCPUClass(baseCPUClass):
 
         :param address: 16-битный адрес для перехода
         """
-        # Сохраняем текущий адрес возврата (PC) в стеке
-        return_address = self.registers['PC']
-        self.registers['SP'] = (self.registers['SP'] - 1) & 0xFFFF
-        self.memory[self.registers['SP']] = (return_address >> 8) & 0xFF  # Сохраняем старший байт
-        self.registers['SP'] = (self.registers['SP'] - 1) & 0xFFFF
-        self.memory[self.registers['SP']] = return_address & 0xFF  # Сохраняем младший байт
+        # Сохраняем текущий адрес возврата (PC) в стеке; перед записью - внутренний такт
+        self.access_time += 1
+        return_address = self.regs[REG_PC]
+        self.regs[REG_SP] = (self.regs[REG_SP] - 1) & 0xFFFF
+        self.write_byte(self.regs[REG_SP], (return_address >> 8) & 0xFF)  # Сохраняем старший байт
+        self.regs[REG_SP] = (self.regs[REG_SP] - 1) & 0xFFFF
+        self.write_byte(self.regs[REG_SP], return_address & 0xFF)  # Сохраняем младший байт
 
         # Переходим по указанному адресу
-        self.registers['PC'] = address
+        self.regs[REG_PC] = address
 
     def call_cc(self, condition, address):
         """
@@ -79,6 +503,7 @@ class extCPUClass(baseCPUClass):
         :param address: 16-битный адрес для перехода
         """
         if self.check_condition(condition):
+            self.tstates += 7
             self.call(address)
 
     def check_condition(self, condition):
@@ -88,24 +513,11 @@ class extCPUClass(baseCPUClass):
         :param condition: строка, обозначающая условие ('NZ', 'Z', 'NC', 'C')
         :return: булево значение, указывающее, выполнено ли условие
         """
-        if condition == 'NZ':
-            return not self.get_flag('Z')
-        elif condition == 'Z':
-            return self.get_flag('Z')
-        elif condition == 'NC':
-            return not self.get_flag('C')
-        elif condition == 'C':
-            return self.get_flag('C')
-        elif condition == 'PO':
-            return not self.get_flag('P/V')
-        elif condition == 'PE':
-            return self.get_flag('P/V')
-        elif condition == 'P':
-            return not self.get_flag('S')
-        elif condition == 'M':
-            return self.get_flag('S')
-        else:
+        test = CONDITIONS.get(condition)
+        if test is None:
             raise ValueError(f"Неизвестное условие: {condition}")
+        mask, expected = test
+        return (self.regs[REG_F] & mask) == expected
 
     def ret(self):
         """
@@ -113,21 +525,21 @@ class extCPUClass(baseCPUClass):
         Инструкция: RET
         """
         # Извлекаем адрес возврата из стека
-        low = self.memory[self.registers['SP']]
-        self.registers['SP'] = (self.registers['SP'] + 1) & 0xFFFF
-        high = self.memory[self.registers['SP']]
-        self.registers['SP'] = (self.registers['SP'] + 1) & 0xFFFF
+        low = self.read_byte(self.regs[REG_SP])
+        self.regs[REG_SP] = (self.regs[REG_SP] + 1) & 0xFFFF
+        high = self.read_byte(self.regs[REG_SP])
+        self.regs[REG_SP] = (self.regs[REG_SP] + 1) & 0xFFFF
 
         # Устанавливаем PC на адрес возврата
-        self.registers['PC'] = (high << 8) | low
+        self.regs[REG_PC] = (high << 8) | low
 
     def retn(self):
         # Восстановление PC из стека
-        low = self.memory[self.registers['SP']]
-        self.registers['SP'] = (self.registers['SP'] + 1) & 0xFFFF
-        high = self.memory[self.registers['SP']]
-        self.registers['SP'] = (self.registers['SP'] + 1) & 0xFFFF
-        self.registers['PC'] = (high << 8) | low
+        low = self.read_byte(self.regs[REG_SP])
+        self.regs[REG_SP] = (self.regs[REG_SP] + 1) & 0xFFFF
+        high = self.read_byte(self.regs[REG_SP])
+        self.regs[REG_SP] = (self.regs[REG_SP] + 1) & 0xFFFF
+        self.regs[REG_PC] = (high << 8) | low
 
         # Копирование IFF2 в IFF1
         self.iff1 = self.iff2
@@ -136,7 +548,7 @@ class extCPUClass(baseCPUClass):
         # Это позволяет выполнить как минимум одну инструкцию после RETN
         self.interrupts_enabled = self.iff1
 
-        print("RETN выполнен. PC установлен на", hex(self.registers['PC']))
+        print("RETN выполнен. PC установлен на", hex(self.regs[REG_PC]))
         print("IFF1 установлен в", self.iff1)
 
     def ret_cc(self, condition):
@@ -147,160 +559,99 @@ class extCPUClass(baseCPUClass):
         :param condition: строка, обозначающая условие ('NZ', 'Z', 'NC', 'C')
         """
         if self.check_condition(condition):
+            self.tstates += 6
             self.ret()
         # Если условие не выполнено, продолжаем выполнение следующей инструкции
 
     # Вспомогательные методы для битовых операций
     def rlc(self, value):
-        carry = value >> 7
-        result = ((value << 1) | carry) & 0xFF
-        self.set_flag('C', carry)
-        self.update_flags(result, zero=True, sign=True, parity=True)
-
-        self.set_flag('H', 0)
-        # Установка флагов 3 и 5
-        self.set_flag('3', result & 0x08)
-        self.set_flag('5', result & 0x20)
-        return result
+        entry = RLC_TABLE[value]
+        self.regs[REG_F] = entry & 0xFF
+        return entry >> 8
 
     def rrc(self, value):
-        carry = value & 1
-        result = ((value >> 1) | (carry << 7)) & 0xFF
-        self.set_flag('C', carry)
-        self.update_flags(result, zero=True, sign=True, parity=True)
-
-        self.set_flag('H', 0)
-        # Установка флагов 3 и 5
-        self.set_flag('3', result & 0x08)
-        self.set_flag('5', result & 0x20)
-        return result
+        entry = RRC_TABLE[value]
+        self.regs[REG_F] = entry & 0xFF
+        return entry >> 8
 
     def rlca(self):
-        carry = self.registers['A'] >> 7
-        self.registers['A'] = ((self.registers['A'] << 1) | carry) & 0xFF
+        carry = self.regs[REG_A] >> 7
+        self.regs[REG_A] = ((self.regs[REG_A] << 1) | carry) & 0xFF
         self.set_flag('C', carry)
         self.set_flag('H', 0)
         self.set_flag('N', 0)
         # Установка флагов 3 и 5
-        self.set_flag('3', self.registers['A'] & 0x08)
-        self.set_flag('5', self.registers['A'] & 0x20)
+        self.set_flag('3', self.regs[REG_A] & 0x08)
+        self.set_flag('5', self.regs[REG_A] & 0x20)
 
     def rrca(self):
-        carry = self.registers['A'] & 1
-        self.registers['A'] = ((self.registers['A'] >> 1) | (carry << 7)) & 0xFF
+        carry = self.regs[REG_A] & 1
+        self.regs[REG_A] = ((self.regs[REG_A] >> 1) | (carry << 7)) & 0xFF
         self.set_flag('C', carry)
         self.set_flag('H', 0)
         self.set_flag('N', 0)
         # Установка флагов 3 и 5
-        self.set_flag('3', self.registers['A'] & 0x08)
-        self.set_flag('5', self.registers['A'] & 0x20)
+        self.set_flag('3', self.regs[REG_A] & 0x08)
+        self.set_flag('5', self.regs[REG_A] & 0x20)
 
     def rla(self):
         old_carry = self.get_flag('C')
-        new_carry = self.registers['A'] >> 7
-        self.registers['A'] = ((self.registers['A'] << 1) | old_carry) & 0xFF
+        new_carry = self.regs[REG_A] >> 7
+        self.regs[REG_A] = ((self.regs[REG_A] << 1) | old_carry) & 0xFF
         self.set_flag('C', new_carry)
         self.set_flag('H', 0)
         self.set_flag('N', 0)
         # Установка флагов 3 и 5
-        self.set_flag('3', self.registers['A'] & 0x08)
-        self.set_flag('5', self.registers['A'] & 0x20)
+        self.set_flag('3', self.regs[REG_A] & 0x08)
+        self.set_flag('5', self.regs[REG_A] & 0x20)
 
     def rra(self):
         old_carry = self.get_flag('C')
-        new_carry = self.registers['A'] & 1
-        self.registers['A'] = ((self.registers['A'] >> 1) | (old_carry << 7)) & 0xFF
+        new_carry = self.regs[REG_A] & 1
+        self.regs[REG_A] = ((self.regs[REG_A] >> 1) | (old_carry << 7)) & 0xFF
         self.set_flag('C', new_carry)
         self.set_flag('H', 0)
         self.set_flag('N', 0)
         # Установка флагов 3 и 5
-        self.set_flag('3', self.registers['A'] & 0x08)
-        self.set_flag('5', self.registers['A'] & 0x20)
+        self.set_flag('3', self.regs[REG_A] & 0x08)
+        self.set_flag('5', self.regs[REG_A] & 0x20)
 
     def rl(self, value):
-        old_carry = self.get_flag('C')
-        carry = value >> 7
-        result = ((value << 1) | old_carry) & 0xFF
-        self.set_flag('C', carry)
-        self.update_flags(result, zero=True, sign=True, parity=True)
-
-        self.set_flag('H', 0)
-        # Установка флагов 3 и 5
-        self.set_flag('3', result & 0x08)
-        self.set_flag('5', result & 0x20)
-        return result
+        regs = self.regs
+        entry = RL_TABLE[((regs[REG_F] & 0x01) << 8) | value]
+        regs[REG_F] = entry & 0xFF
+        return entry >> 8
 
     def rr(self, value):
-        old_carry = self.get_flag('C')
-        carry = value & 1
-        result = ((value >> 1) | (old_carry << 7)) & 0xFF
-        self.set_flag('C', carry)
-        self.update_flags(result, zero=True, sign=True, parity=True)
-
-        self.set_flag('H', 0)
-        # Установка флагов 3 и 5
-        self.set_flag('3', result & 0x08)
-        self.set_flag('5', result & 0x20)
-        return result
+        regs = self.regs
+        entry = RR_TABLE[((regs[REG_F] & 0x01) << 8) | value]
+        regs[REG_F] = entry & 0xFF
+        return entry >> 8
 
     def sla(self, value):
-        carry = value >> 7
-        result = (value << 1) & 0xFF
-        self.set_flag('C', carry)
-        self.update_flags(result, zero=True, sign=True, parity=True)
-
-        self.set_flag('H', 0)
-        # Установка флагов 3 и 5
-        self.set_flag('3', result & 0x08)
-        self.set_flag('5', result & 0x20)
-        return result
+        entry = SLA_TABLE[value]
+        self.regs[REG_F] = entry & 0xFF
+        return entry >> 8
 
     def sra(self, value):
-        carry = value & 1
-        result = ((value >> 1) | (value & 0x80)) & 0xFF
-        self.set_flag('C', carry)
-        self.update_flags(result, zero=True, sign=True, parity=True)
-
-        self.set_flag('H', 0)
-        # Установка флагов 3 и 5
-        self.set_flag('3', result & 0x08)
-        self.set_flag('5', result & 0x20)
-        return result
+        entry = SRA_TABLE[value]
+        self.regs[REG_F] = entry & 0xFF
+        return entry >> 8
 
     def sll(self, value):
-        carry = value >> 7
-        result = ((value << 1) | 1) & 0xFF
-        self.set_flag('C', carry)
-        self.update_flags(result, zero=True, sign=True, parity=True)
-
-        self.set_flag('H', 0)
-        # Установка флагов 3 и 5
-        self.set_flag('3', result & 0x08)
-        self.set_flag('5', result & 0x20)
-        return result
+        entry = SLL_TABLE[value]
+        self.regs[REG_F] = entry & 0xFF
+        return entry >> 8
 
     def srl(self, value):
-        carry = value & 1
-        result = (value >> 1) & 0xFF
-        self.set_flag('C', carry)
-        self.update_flags(result, zero=True, sign=True, parity=True)
-
-        self.set_flag('H', 0)
-        # Установка флагов 3 и 5
-        self.set_flag('3', result & 0x08)
-        self.set_flag('5', result & 0x20)
-        return result
+        entry = SRL_TABLE[value]
+        self.regs[REG_F] = entry & 0xFF
+        return entry >> 8
 
     def bit(self, bit, value):
-        result = value & (1 << bit)
-        self.set_flag('Z', result == 0)
-        self.set_flag('H', 1)
-        self.set_flag('N', 0)
-        self.set_flag('P/V', result == 0)
-        self.set_flag('S', bit == 7 and result != 0)
-        # Установка флагов 3 и 5
-        self.set_flag('3', value & 0x08)
-        self.set_flag('5', value & 0x20)
+        # Z и P/V - по проверяемому биту, S - только для бита 7, биты 3 и 5 из операнда, C не меняется
+        regs = self.regs
+        regs[REG_F] = (regs[REG_F] & 0x01) | 0x10 | SZP[value & (1 << bit)] | (value & 0x28)
 
     def res(self, bit, value):
         return value & ~(1 << bit)
@@ -310,10 +661,10 @@ class extCPUClass(baseCPUClass):
 
     # Методы для ввода/вывода
     def in_r_c(self, reg):
-        #port = self.registers['C']
+        #port = self.regs[REG_C]
         port = self.get_register_pair('BC')
         value = self.io_read(port)
-        self.registers[reg] = value
+        self.regs[reg] = value
         self.update_flags(value, zero=True, sign=True, parity=True)
 
         # Установка флагов
@@ -328,9 +679,9 @@ class extCPUClass(baseCPUClass):
         self.set_flag('5', value & 0x20)
 
     def out_c_r(self, reg):
-        #port = self.registers['C']
+        #port = self.regs[REG_C]
         port = self.get_register_pair('BC')
-        value = self.registers[reg]
+        value = self.regs[reg]
         self.io_write(port, value)
 
     # Методы для работы с регистровыми парами
@@ -393,9 +744,9 @@ class extCPUClass(baseCPUClass):
 
     # Специальные инструкции
     def neg(self):
-        value = self.registers['A']
+        value = self.regs[REG_A]
         result = (-value) & 0xFF
-        self.registers['A'] = result
+        self.regs[REG_A] = result
         self.set_flag('C', value != 0)
         self.set_flag('H', (value & 0xF) != 0)
         self.update_flags(result, zero=True, sign=True, parity=True)
@@ -405,105 +756,300 @@ class extCPUClass(baseCPUClass):
         self.set_flag('5', result & 0x20)
 
     def rrd(self):
-        a = self.registers['A']
+        a = self.regs[REG_A]
         hl = self.get_register_pair('HL')
-        m = self.memory[hl]
-        self.registers['A'] = (a & 0xF0) | (m & 0x0F)
+        m = self.read_byte(hl)
+        self.access_time += 4
+        self.regs[REG_A] = (a & 0xF0) | (m & 0x0F)
 
         result = ((m >> 4) | (a << 4)) & 0xFF
-        self.memory[hl] = result
-        self.update_flags(self.registers['A'], zero=True, sign=True, parity=True)
+        self.write_byte(hl, result)
+        self.update_flags(self.regs[REG_A], zero=True, sign=True, parity=True)
         self.set_flag('H', 0)
         self.set_flag('N', 0)
 
-        self.set_flag('3', self.registers['A'] & 0x08)
-        self.set_flag('5', self.registers['A'] & 0x20)
+        self.set_flag('3', self.regs[REG_A] & 0x08)
+        self.set_flag('5', self.regs[REG_A] & 0x20)
 
     def rld(self):
-        a = self.registers['A']
+        a = self.regs[REG_A]
         hl = self.get_register_pair('HL')
-        m = self.memory[hl]
-        self.registers['A'] = (a & 0xF0) | (m >> 4)
+        m = self.read_byte(hl)
+        self.access_time += 4
+        self.regs[REG_A] = (a & 0xF0) | (m >> 4)
         result = ((m << 4) | (a & 0x0F)) & 0xFF
-        self.memory[hl] = result
-        self.update_flags(self.registers['A'], zero=True, sign=True, parity=True)
+        self.write_byte(hl, result)
+        self.update_flags(self.regs[REG_A], zero=True, sign=True, parity=True)
         self.set_flag('H', 0)
         self.set_flag('N', 0)
 
-        self.set_flag('3', self.registers['A'] & 0x08)
-        self.set_flag('5', self.registers['A'] & 0x20)
+        self.set_flag('3', self.regs[REG_A] & 0x08)
+        self.set_flag('5', self.regs[REG_A] & 0x20)
 
-    # Блочные операции
+    # Блочные операции.
+    # Повторяющиеся команды выполняют за один вызов столько итераций, сколько помещается
+    # в бюджет текущего run_tstates (cpu.deadline). Если итерации остались, PC возвращается
+    # на команду, как при обычном повторе Z80, и выполнение продолжится после прерывания.
+    # Над спорной памятью с задержками итерации идут по одной (см. _contended_repeat).
     def ldi(self):
-        self._block_transfer(1)
-        self.set_flag('H', 0)
-        self.set_flag('N', 0)
-        self.set_flag('P/V', self.get_register_pair('BC') != 0)
-        # Дополнительные флаги
-        n = self.registers['A'] + self.memory[self.get_register_pair('HL') - 1]
-        self.set_flag('5', n & 0x02)
-        self.set_flag('3', n & 0x08)
+        self._transfer(1)
 
     def ldd(self):
-        self._block_transfer(-1)
-        self.set_flag('H', 0)
-        self.set_flag('N', 0)
-        self.set_flag('P/V', self.get_register_pair('BC') != 0)
-
-        # Дополнительные флаги
-        n = self.registers['A'] + self.memory[self.get_register_pair('HL') + 1]
-        self.set_flag('5', n & 0x02)
-        self.set_flag('3', n & 0x08)
+        self._transfer(-1)
 
     def ldir(self):
-        #self.ldi()
-        #if self.get_register_pair('BC') != 0:
-        #    self.registers['PC'] -= 2
-        while True:
-            self.cycles += 16
-            if self.get_register_pair('BC') == 0:
-                break
-            self.ldi()
-            # Добавляем 21 цикл за каждую итерацию
-            self.cycles += 21
-            #self.registers['PC'] -= 2
+        self._transfer_repeat(1)
 
     def lddr(self):
-        #self.ldd()
-        #if self.get_register_pair('BC') != 0:
-        #    self.registers['PC'] -= 2
-        while True:
-            self.cycles += 16
-            if self.get_register_pair('BC') == 0:
-                break
-            self.ldd()
-            # Добавляем 21 цикл за каждую итерацию
-            self.cycles += 21
-            #self.registers['PC'] -= 2
-
-    def _block_transfer(self, direction):
-        hl = self.get_register_pair('HL')
-        de = self.get_register_pair('DE')
-        bc = self.get_register_pair('BC')
+        self._transfer_repeat(-1)
+
+    def cpi(self):
+        self._compare(1)
+
+    def cpd(self):
+        self._compare(-1)
+
+    def cpir(self):
+        self._compare_repeat(1)
+
+    def cpdr(self):
+        self._compare_repeat(-1)
+
+    def ini(self):
+        self._input(1)
 
-        value = self.memory[hl]
-        self.memory[de] = value
+    def ind(self):
+        self._input(-1)
 
-        self.set_register_pair('HL', (hl + direction) )
-        self.set_register_pair('DE', (de + direction) )
-        self.set_register_pair('BC', (bc - 1) )
+    def inir(self):
+        self._io_repeat(self._input, 1)
+
+    def indr(self):
+        self._io_repeat(self._input, -1)
+
+    def outi(self):
+        self._output(1)
+
+    def outd(self):
+        self._output(-1)
+
+    def otir(self):
+        self._io_repeat(self._output, 1)
+
+    def otdr(self):
+        self._io_repeat(self._output, -1)
+
+    def _repeat_count(self, remaining):
+        """
+        Число итераций повторяющейся команды, которое помещается в бюджет T-состояний.
+        Базовое время первой итерации уже учтено по ED_TSTATES.
+
+        :param remaining: сколько итераций осталось до естественного завершения
+        """
+        if not self.deadline:
+            return remaining
+        # Первая итерация с повтором завершается через 5 T-состояний, каждая следующая - через 21
+        count = (self.deadline - self.tstates + 36) // BLOCK_REPEAT_TSTATES
+        return max(1, min(count, remaining))
+
+    def _overwrites_self(self, address, count, step):
+        """
+        Проверяет, попадает ли запись count байт с адреса address на саму команду.
+        Тогда следующая итерация выполнила бы уже новый код, и итерации идут по одной.
+        """
+        opcode_address = (self.regs[REG_PC] - 2) & 0xFFFF
+        for byte_address in (opcode_address, (opcode_address + 1) & 0xFFFF):
+            if ((byte_address - address) * step) & 0xFFFF < count:
+                return True
+        return False
+
+    def _contended_repeat(self, count, step, *addresses):
+        """
+        С задержками спорной памяти проверяет, задевает ли повторяющаяся команда спорное окно
+        своим кодом или count байтами с каждого из адресов addresses. Тогда итерации идут
+        по одной: каждая заново выбирает команду, и задержку получает каждое обращение.
+        """
+        if not self.contended:
+            return False
+        page_delay = self.memory.page_delay
+        no_delay = self.memory.no_delay
+        windows = {((self.regs[REG_PC] - 2) & 0xFFFF) >> 14}
+        for address in addresses:
+            # Окно - 16 КБ, поэтому достаточно адресов через 0x4000 и последнего
+            windows.update(((address + step * i) & 0xFFFF) >> 14 for i in range(0, count, 0x4000))
+            windows.add(((address + step * (count - 1)) & 0xFFFF) >> 14)
+        return any(page_delay[window] is not no_delay for window in windows)
+
+    def _repeat_end(self, count, done):
+        """
+        Учитывает время и регенерацию R для count итераций повторяющейся команды.
+
+        :param count: выполнено итераций
+        :param done: команда завершилась (иначе PC возвращается на нее)
+        """
+        regs = self.regs
+        extra = count - 1
+        if extra:
+            self.tstates += BLOCK_REPEAT_TSTATES * extra
+            r = regs[REG_R]
+            regs[REG_R] = (r + 2 * extra) & 0x7F | (r & 0x80)
+        if not done:
+            regs[REG_PC] = (regs[REG_PC] - 2) & 0xFFFF
+            self.tstates += BLOCK_REPEAT_TSTATES - 16
+
+    def _transfer_flags(self, value, bc):
+        regs = self.regs
+        n = regs[REG_A] + value
+        regs[REG_F] = (regs[REG_F] & (FLAG_S | FLAG_Z | FLAG_C)) | (FLAG_PV if bc else 0) | (n & FLAG_3) | ((n & 0x02) << 4)
+
+    def _transfer(self, step):
+        """Одна итерация LDI (step=1) или LDD (step=-1)."""
+        regs = self.regs
+        hl = (regs[REG_H] << 8) | regs[REG_L]
+        de = (regs[REG_D] << 8) | regs[REG_E]
+        bc = (((regs[REG_B] << 8) | regs[REG_C]) - 1) & 0xFFFF
+        value = self.read_byte(hl)
+        self.write_byte(de, value)
+        hl = (hl + step) & 0xFFFF
+        de = (de + step) & 0xFFFF
+        regs[REG_H], regs[REG_L] = hl >> 8, hl & 0xFF
+        regs[REG_D], regs[REG_E] = de >> 8, de & 0xFF
+        regs[REG_B], regs[REG_C] = bc >> 8, bc & 0xFF
+        self._transfer_flags(value, bc)
+
+    def _transfer_repeat(self, step):
+        """LDIR/LDDR: итерации в пределах бюджета выполняются одним копированием срезов памяти."""
+        regs = self.regs
+        bc = (regs[REG_B] << 8) | regs[REG_C]
+        count = self._repeat_count(bc or 0x10000)
+        hl = (regs[REG_H] << 8) | regs[REG_L]
+        de = (regs[REG_D] << 8) | regs[REG_E]
+        if count == 1 or self._overwrites_self(de, count, step) or self._contended_repeat(count, step, hl, de):
+            self._transfer(step)
+            self._repeat_end(1, (regs[REG_B] | regs[REG_C]) == 0)
+            return
+
+        value = self.copy_block(hl, de, count, step)
+        hl = (hl + step * count) & 0xFFFF
+        de = (de + step * count) & 0xFFFF
+        bc = (bc - count) & 0xFFFF
+        regs[REG_H], regs[REG_L] = hl >> 8, hl & 0xFF
+        regs[REG_D], regs[REG_E] = de >> 8, de & 0xFF
+        regs[REG_B], regs[REG_C] = bc >> 8, bc & 0xFF
+        self._transfer_flags(value, bc)
+        self._repeat_end(count, bc == 0)
+
+    def _compare_flags(self, value, bc):
+        regs = self.regs
+        a = regs[REG_A]
+        result = (a - value) & 0xFF
+        lookup = ((a & 0x08) >> 3) | ((value & 0x08) >> 2) | ((result & 0x08) >> 1)
+        f = (regs[REG_F] & FLAG_C) | FLAG_N | HALFCARRY_SUB[lookup] | (FLAG_PV if bc else 0) | (result & FLAG_S)
+        if result == 0:
+            f |= FLAG_Z
+        # Биты 3 и 5 берутся из A - (HL) - H
+        if f & FLAG_H:
+            result = (result - 1) & 0xFF
+        regs[REG_F] = f | (result & FLAG_3) | ((result & 0x02) << 4)
+
+    def _compare(self, step):
+        """Одна итерация CPI (step=1) или CPD (step=-1)."""
+        regs = self.regs
+        hl = (regs[REG_H] << 8) | regs[REG_L]
+        bc = (((regs[REG_B] << 8) | regs[REG_C]) - 1) & 0xFFFF
+        value = self.read_byte(hl)
+        hl = (hl + step) & 0xFFFF
+        regs[REG_H], regs[REG_L] = hl >> 8, hl & 0xFF
+        regs[REG_B], regs[REG_C] = bc >> 8, bc & 0xFF
+        self._compare_flags(value, bc)
+        return value
+
+    def _compare_repeat(self, step):
+        """CPIR/CPDR: поиск байта в пределах бюджета выполняется одним bytes.find."""
+        regs = self.regs
+        bc = (regs[REG_B] << 8) | regs[REG_C]
+        count = self._repeat_count(bc or 0x10000)
+        a = regs[REG_A]
+        if count == 1 or self._contended_repeat(count, step, (regs[REG_H] << 8) | regs[REG_L]):
+            value = self._compare(step)
+            self._repeat_end(1, value == a or (regs[REG_B] | regs[REG_C]) == 0)
+            return
+
+        hl = (regs[REG_H] << 8) | regs[REG_L]
+        if step > 0:
+            data = self.read_block(hl, count)
+        else:
+            data = self.read_block((hl - count + 1) & 0xFFFF, count)[::-1]
+        index = data.find(a)
+        if index >= 0:
+            count = index + 1
+        value = data[count - 1]
+        hl = (hl + step * count) & 0xFFFF
+        bc = (bc - count) & 0xFFFF
+        regs[REG_H], regs[REG_L] = hl >> 8, hl & 0xFF
+        regs[REG_B], regs[REG_C] = bc >> 8, bc & 0xFF
+        self._compare_flags(value, bc)
+        self._repeat_end(count, value == a or bc == 0)
+
+    def _io_flags(self, value, temp):
+        regs = self.regs
+        b = regs[REG_B]
+        f = SZ53[b]
+        if value & 0x80:
+            f |= FLAG_N
+        if temp < value:
+            f |= FLAG_H | FLAG_C
+        regs[REG_F] = f | PARITY[(temp & 0x07) ^ b]
+
+    def _input(self, step):
+        """Одна итерация INI (step=1) или IND (step=-1): порт читается до уменьшения B."""
+        regs = self.regs
+        # Второй цикл M1 удлинен на такт, чтение порта занимает 4 такта
+        self.access_time += 5
+        value = self.io_read((regs[REG_B] << 8) | regs[REG_C])
+        hl = (regs[REG_H] << 8) | regs[REG_L]
+        self.write_byte(hl, value)
+        regs[REG_B] = (regs[REG_B] - 1) & 0xFF
+        hl = (hl + step) & 0xFFFF
+        regs[REG_H], regs[REG_L] = hl >> 8, hl & 0xFF
+        self._io_flags(value, (value + regs[REG_C] + step) & 0xFF)
+
+    def _output(self, step):
+        """Одна итерация OUTI (step=1) или OUTD (step=-1): порт выбирается уже уменьшенным B."""
+        regs = self.regs
+        hl = (regs[REG_H] << 8) | regs[REG_L]
+        self.access_time += 1     # Второй цикл M1 удлинен на такт
+        value = self.read_byte(hl)
+        regs[REG_B] = (regs[REG_B] - 1) & 0xFF
+        self.io_write((regs[REG_B] << 8) | regs[REG_C], value)
+        hl = (hl + step) & 0xFFFF
+        regs[REG_H], regs[REG_L] = hl >> 8, hl & 0xFF
+        self._io_flags(value, (value + regs[REG_L]) & 0xFF)
+
+    def _io_repeat(self, operation, step):
+        """INIR/INDR/OTIR/OTDR: каждый байт проходит через порт, поэтому итерации идут циклом."""
+        regs = self.regs
+        count = self._repeat_count(regs[REG_B] or 0x100)
+        hl = (regs[REG_H] << 8) | regs[REG_L]
+        if operation == self._input and self._overwrites_self(hl, count, step):
+            count = 1
+        elif self._contended_repeat(count, step, hl):
+            count = 1
+        for _ in range(count):
+            operation(step)
+        self._repeat_end(count, regs[REG_B] == 0)
 
     def dec_index_d(self, index_reg):
         # Получаем смещение
-        offset = self.fetch_signed()
+        offset = self.fetch_displacement()
         # Вычисляем эффективный адрес
-        address = (self.registers[index_reg] + offset) & 0xFFFF
+        address = (self.regs[index_reg] + offset) & 0xFFFF
         # Получаем значение из памяти
-        value = self.memory[address]
+        value = self.read_byte(address)
         # Уменьшаем значение на 1
         result = (value - 1) & 0xFF
         # Записываем результат обратно в память
-        self.memory[address] = result
+        self.modify_memory(address, result)
         # Обновляем флаги
         self.update_flags(result, zero=True, sign=True, halfcarry=True)
         self.set_flag('S', result & 0x80)  # Устанавливаем флаг знака
@@ -517,15 +1063,15 @@ class extCPUClass(baseCPUClass):
 
     def inc_index_d(self, index_reg):
         # Получаем смещение
-        offset = self.fetch_signed()
+        offset = self.fetch_displacement()
         # Вычисляем эффективный адрес
-        address = (self.registers[index_reg] + offset) & 0xFFFF
+        address = (self.regs[index_reg] + offset) & 0xFFFF
         # Получаем значение из памяти
-        value = self.memory[address]
+        value = self.read_byte(address)
         # Увеличиваем значение на 1
         result = (value + 1) & 0xFF
         # Записываем результат обратно в память
-        self.memory[address] = result
+        self.modify_memory(address, result)
         # Обновляем флаги
         self.update_flags(result, zero=True, sign=True, halfcarry=True)
 
@@ -539,10 +1085,10 @@ class extCPUClass(baseCPUClass):
         self.set_flag('3', result & 0x08)
 
     def add_index(self, index_reg, rr):
-        index_value = self.registers[index_reg]
+        index_value = self.regs[index_reg]
         rr_value = self.get_register_pair(rr)
         result = (index_value + rr_value) & 0xFFFF
-        self.registers[index_reg] = result
+        self.regs[index_reg] = result
 
         # Update flags
         self.set_flag('N', 0)
@@ -555,402 +1101,54 @@ class extCPUClass(baseCPUClass):
         self.set_flag('3', result_high & 0x08)  # Бит 3 старшего байта результата
 
    # Реализация инструкций с префиксами DD и FD
+    # Выборка префикса уже учтена в MAIN_TSTATES, здесь добавляется время самой команды
     def execute_dd(self):
-        # Implement IX-related instructions
-        # This is a placeholder and should be expanded with actual IX instructions
-        opcode = self.fetch()
-        self._execute_indexed('IX', opcode)
+        opcode = self.fetch_opcode()
+        self.tstates += INDEX_TSTATES[opcode]
+        self.DD_TABLE[opcode](self)
 
     def execute_fd(self):
-        # Implement IY-related instructions
-        # This is a placeholder and should be expanded with actual IY instructions
-        opcode = self.fetch()
-        self._execute_indexed('IY', opcode)
-
-    def _execute_indexed(self, index_reg, opcode):
-        if opcode == 0x00:  # DD 00
-            # NOP - No operation
-            pass  # Просто игнорируем, как обычный NO
-        elif opcode == 0x23:  # DD 23 (INC IX)
-                self.registers[index_reg] = (self.registers[index_reg] + 1) & 0xFFFF
-        elif opcode == 0x24:  # DD 24: INC IXh
-            high_byte = (self.registers[index_reg] >> 8) & 0xFF
-            result = (high_byte + 1) & 0xFF
-            self.registers[index_reg] = (self.registers[index_reg] & 0x00FF) | (result << 8)
-            # Установка флагов
-            self.set_flag('S', result & 0x80)
-            self.set_flag('Z', result == 0)
-            self.set_flag('H', (high_byte & 0x0F) == 0x0F)
-            self.set_flag('P/V', result == 0x80)
-            self.set_flag('N', 0)
-            self.set_flag('5', result & 0x20)
-            self.set_flag('3', result & 0x08)
-        elif opcode == 0x25:  # DD 25 - DEC IXh
-            value = self.registers[index_reg]
-            high_byte = (self.registers[index_reg] >> 8) & 0xFF
-            #value = high_byte
-            result = (high_byte - 1) & 0xFF
-            self.registers[index_reg] = (self.registers[index_reg] & 0x00FF) | (result << 8)
-
-            # Установка флагов
-            self.set_flag('N', 1)
-
-            # Флаги H, S, Z, P/V устанавливаются на основе старшего байта результата
-            result_high = (result) & 0xFF
-            prev_high = (value >> 8) & 0xFF
-
-            self.set_flag('H', (result_high & 0x0F) == 0x0F)
-            self.set_flag('S', result_high & 0x80)
-            self.set_flag('Z', result_high == 0)
-            self.set_flag('P/V', prev_high == 0x80 and result_high == 0x7F)
-
-            # Установка флагов 5 и 3
-            self.set_flag('5', result_high & 0x20)
-            self.set_flag('3', result_high & 0x08)
-
-        elif opcode in [0x09, 0x19, 0x29, 0x39]:  # ADD IX/IY, rr
-            rr = {0x09: 'BC', 0x19: 'DE', 0x29: index_reg, 0x39: 'SP'}[opcode]
-            self.add_index(index_reg, rr)
-        elif opcode in [0x21, 0x22, 0x26, 0x2A, 0x2B, 0x2C, 0x2D, 0x2E, 0x34, 0x35, 0x36, 0xE9, 0xF9]:
-            # Специальные случаи для LD IX/IY, nn и LD (nn), IX/IY
-            if opcode == 0x21:  # LD IX/IY, nn
-                self.registers[index_reg] = self.fetch_word()
-            elif opcode == 0x22:  # LD (nn), IX/IY
-                address = self.fetch_word()
-                self.store_word(address, self.registers[index_reg])
-            elif opcode == 0x26:  # ld ixh,*
-                value = self.fetch()
-                self.registers[index_reg] = (self.registers[index_reg] & 0x00FF) | (value << 8)
-            elif opcode == 0x2A:  # LD IX/IY, (nn)
-                address = self.fetch_word()
-                self.registers[index_reg] = self.memory[address] | (self.memory[address + 1] << 8)
-            elif opcode == 0x2B:  # DEC IX/IY
-                # Уменьшаем значение IX на 1
-                self.registers[index_reg] = (self.registers[index_reg] - 1) & 0xFFFF
-            elif opcode == 0x2C: # INC IXl/IYl
-                self.inc_index_l(index_reg)
-            elif opcode == 0x2D: # DEC IXl/IYl
-                self.dec_index_l(index_reg)
-            elif opcode == 0x2E:  # ld ixl,*
-                value = self.fetch()
-                self.registers[index_reg] = (self.registers[index_reg] & 0xFF00) | value
-            elif opcode == 0x34:  # INC (IX/IY+d)
-                self.inc_index_d(index_reg)
-            elif opcode == 0x35:  # DEC (IX/IY+d)
-                self.dec_index_d(index_reg)
-            elif opcode == 0x36:  # LD (IX/IY+d), n
-                offset = self.fetch_signed()
-                value = self.fetch()
-                address = (self.registers[index_reg] + offset) & 0xFFFF
-                self.memory[address] = value
-            elif opcode == 0xE9:  # JP (IX/IY)
-                self.registers['PC'] = self.registers[index_reg]
-            elif opcode == 0xF9:  # LD SP, IX/IY
-                self.registers['SP'] = self.registers[index_reg]
-        elif opcode == 0x44:  # LD B,IXH
-            high_byte = (self.registers[index_reg] >> 8) & 0xFF
-            self.registers['B'] = high_byte
-        elif opcode == 0x45:  # LD B,IXL
-            low_byte = self.registers[index_reg] & 0xFF
-            self.registers['B'] = low_byte
-        elif opcode == 0x4C:  # LD C,IXH
-            high_byte = (self.registers[index_reg] >> 8) & 0xFF
-            self.registers['C'] = high_byte
-        elif opcode == 0x4D:  # LD C,IXL
-            low_byte = self.registers[index_reg] & 0xFF
-            self.registers['C'] = low_byte
-        elif opcode == 0x54:  # LD D,IXH
-            high_byte = (self.registers[index_reg] >> 8) & 0xFF
-            self.registers['D'] = high_byte
-        elif opcode == 0x55:  # LD D,IXL
-            low_byte = self.registers[index_reg] & 0xFF
-            self.registers['D'] = low_byte
-        elif opcode == 0x5C:  # LD C,IXH
-            high_byte = (self.registers[index_reg] >> 8) & 0xFF
-            self.registers['E'] = high_byte
-        elif opcode == 0x5D:  # LD C,IXL
-            low_byte = self.registers[index_reg] & 0xFF
-            self.registers['E'] = low_byte
-        elif opcode == 0x60:  # LD IXh,B
-            self.registers[index_reg] = ( self.registers['B'] << 8 ) | (self.registers[index_reg] & 0xFF)
-        elif opcode == 0x61:  # LD IXh,C
-            self.registers[index_reg] = ( self.registers['C'] << 8 ) | (self.registers[index_reg] & 0xFF)
-        elif opcode == 0x62:  # LD IXh,D
-            self.registers[index_reg] = ( self.registers['D'] << 8 ) | (self.registers[index_reg] & 0xFF)
-        elif opcode == 0x63:  # LD IXh,E
-            self.registers[index_reg] = ( self.registers['E'] << 8 ) | (self.registers[index_reg] & 0xFF)
-        elif opcode == 0x64:  # LD IXh,IXh
-            pass
-        elif opcode == 0x65:  # LD IXh,IXl
-            self.registers[index_reg] = ( (self.registers[index_reg] & 0xFF) << 8 ) | (self.registers[index_reg] & 0xFF)
-        elif opcode == 0x67:  # LD IXh,A
-            self.registers[index_reg] = ( self.registers['A'] << 8 ) | (self.registers[index_reg] & 0xFF)
-
-        elif opcode == 0x68:  # LD IXl,B
-            self.registers[index_reg] = (self.registers[index_reg] & 0xFF00) | (self.registers['B'] & 0xFF)
-        elif opcode == 0x69:  # LD IXl,C
-            self.registers[index_reg] = (self.registers[index_reg] & 0xFF00) | (self.registers['C'] & 0xFF)
-        elif opcode == 0x6A:  # LD IXl,D
-            self.registers[index_reg] = (self.registers[index_reg] & 0xFF00) | (self.registers['D'] & 0xFF)
-        elif opcode == 0x6B:  # LD IXl,E
-            self.registers[index_reg] = (self.registers[index_reg] & 0xFF00) | (self.registers['E'] & 0xFF)
-        elif opcode == 0x6C:  # LD IXl,IXh
-            self.registers[index_reg] = (self.registers[index_reg] & 0xFF00) | ((self.registers[index_reg] >> 8) & 0xFF)
-            pass
-        elif opcode == 0x6D:  # LD IXl,IXl
-            pass
-        elif opcode == 0x6F:  # LD IXl,A
-            self.registers[index_reg] = (self.registers[index_reg] & 0xFF00) | (self.registers['A'] & 0xFF)
-
-        elif opcode == 0x7C:  # LD A,IXH
-            high_byte = (self.registers[index_reg] >> 8) & 0xFF
-            self.registers['A'] = high_byte
-        elif opcode == 0x7D:  # LD A,IXL
-            low_byte = self.registers[index_reg] & 0xFF
-            self.registers['A'] = low_byte
-        elif opcode & 0xC0 == 0x40:  # LD instructions
-            self._indexed_load(index_reg, opcode)
-        elif opcode & 0xC0 == 0x80:  # Arithmetic instructions
-            self._indexed_arithmetic(index_reg, opcode)
-        elif opcode == 0xCB:  # CB-prefixed instructions
-            self._execute_indexed_cb(index_reg)
-        elif opcode == 0xE1: # POP (IX/IY)
-            self.registers[index_reg] = self.memory[self.registers['SP']] | (self.memory[self.registers['SP'] + 1] << 8)
-            self.registers['SP'] = (self.registers['SP'] + 2) & 0xFFFF
-        elif opcode == 0xE3: # EX (SP), IX/IY
-            self.ex_sp_ix(index_reg)
-        elif opcode == 0xE5: # PUSH IX/IY
-            self.push_index_reg(index_reg)
-        else:
-            raise ValueError(f"Unsupported {index_reg} instruction: {opcode:02X}")
-
-    def _indexed_load(self, index_reg, opcode):
-        #print(f"reg {reg}")
-        if opcode & 0x07 == 0x06:  # LD r, (IX/IY+d)
-            reg_index = (opcode & 0x38) >> 3
-            reg = ['B', 'C', 'D', 'E', 'H', 'L', '(HL)', 'A'][reg_index]
-            offset = self.fetch_signed()
-            #if reg == '(HL)':
-            #    if opcode & 0x38 == 0x30:  # Check if it's a store operation
-            #    self.memory[address] = self.registers['A']  # Only 'A' can be stored
-            #else:
-            address = (self.registers[index_reg] + offset) & 0xFFFF
-            self.registers[reg] = self.memory[address]
-        elif (opcode & 0x38) == 0x30:  # LD (IX/IY+d), r
-            reg_index = (opcode & 0x07)
-            reg = ['B', 'C', 'D', 'E', 'H', 'L', '(HL)', 'A'][reg_index]
-            offset = self.fetch_signed()
-            address = (self.registers[index_reg] + offset) & 0xFFFF
-            self.memory[address] = self.registers[reg]
-
-    def _indexed_arithmetic(self, index_reg, opcode):
-        operation = (opcode & 0x38) >> 3
-        #operation = (opcode & 0x1C) >> 2
-        operand =  (opcode & 0x03)
-        #print(f"operation {operation}")
-        #print(f"operand {operand}")
-        if operand == 0:
-            high_byte = (self.registers[index_reg] >> 8) & 0xFF
-            value = high_byte
-        elif operand == 1:
-            low_byte = self.registers[index_reg] & 0xFF
-            value = low_byte
-        elif operand == 2:
-            offset = self.fetch_signed()
-            address = (self.registers[index_reg] + offset) & 0xFFFF
-            value = self.memory[address]
-
-        if operation == 0:  # ADD A, (IX/IY+d)
-            self.add(value)
-        elif operation == 1:  # ADC A, (IX/IY+d)
-            self.adc(value)
-        elif operation == 2:  # SUB (IX/IY+d)
-            self.sub(value)
-        elif operation == 3:  # SBC A, (IX/IY+d)
-            self.sbc(value)
-        elif operation == 4:  # AND (IX/IY+d)
-            self.and_a(value)
-        elif operation == 5:  # XOR (IX/IY+d)
-            self.xor_a(value)
-        elif operation == 6:  # OR (IX/IY+d)
-            self.or_a(value)
-        elif operation == 7:  # CP (IX/IY+d)
-            self.cp(value)
-
+        opcode = self.fetch_opcode()
+        self.tstates += INDEX_TSTATES[opcode]
+        self.FD_TABLE[opcode](self)
 
     def execute_cb(self):
-        opcode = self.fetch()
-        #if self.debug:
-            #print(f"{self.registers['PC']-1:04X}: {z80_to_asm[opcode]}")
-            #print(f"cb opcode: {opcode:02X}")
-
-        r = ['B', 'C', 'D', 'E', 'H', 'L', '(HL)', 'A']
-
-        if opcode < 0x40:  # Rotation and shift instructions
-            operation = [self.rlc, self.rrc, self.rl, self.rr, self.sla, self.sra, self.sll, self.srl][opcode >> 3]
-            operand = r[opcode & 0x07]
-            if operand == '(HL)':
-                value = self.memory[self.get_register_pair('HL')]
-                result = operation(value)
-                self.store_memory(self.get_register_pair('HL'), result)
-            else:
-                self.registers[operand] = operation(self.registers[operand])
-        elif opcode < 0x80:  # Bit test instructions
-            bit = (opcode >> 3) & 0x07
-            operand = r[opcode & 0x07]
-            if operand == '(HL)':
-                value = self.memory[self.get_register_pair('HL')]
-            else:
-                value = self.registers[operand]
-            self.bit(bit, value)
-        elif opcode < 0xC0:  # Bit reset instructions
-            bit = (opcode >> 3) & 0x07
-            operand = r[opcode & 0x07]
-            if operand == '(HL)':
-                value = self.memory[self.get_register_pair('HL')]
-                result = self.res(bit, value)
-                self.store_memory(self.get_register_pair('HL'), result)
-            else:
-                self.registers[operand] = self.res(bit, self.registers[operand])
-        else:  # Bit set instructions
-            bit = (opcode >> 3) & 0x07
-            operand = r[opcode & 0x07]
-            if operand == '(HL)':
-                value = self.memory[self.get_register_pair('HL')]
-                result = self.set(bit, value)
-                self.store_memory(self.get_register_pair('HL'), result)
-            else:
-                self.registers[operand] = self.set(bit, self.registers[operand])
+        opcode = self.fetch_opcode()
+        self.tstates += CB_TSTATES[opcode]
+        self.CB_TABLE[opcode](self)
 
     def execute_ed(self):
-        opcode = self.fetch()
-        ed_instructions = {
-            0x40: lambda: self.in_r_c('B'),
-            0x41: lambda: self.out_c_r('B'),
-            0x42: lambda: self.sbc_hl('BC'),
-            0x43: lambda: self.store_word(self.fetch_word(), self.get_register_pair('BC')),
-            0x44: lambda: self.neg(),
-            0x45: lambda: self.retn(),
-            0x46: lambda: self.im(0),
-            0x47: lambda: self.ld_i_a(),
-            0x48: lambda: self.in_r_c('C'),
-            0x49: lambda: self.out_c_r('C'),
-            0x4A: lambda: self.adc_hl('BC'),
-            0x4B: lambda: self.load_register_pair('BC', self.load_word(self.fetch_word())),
-            0x4C: lambda: self.neg(), #*
-            0x4D: lambda: self.reti(),
-            0x4F: lambda: self.ld_r_a(),
-            0x50: lambda: self.in_r_c('D'),
-            0x51: lambda: self.out_c_r('D'),
-            0x52: lambda: self.sbc_hl('DE'),
-            0x53: lambda: self.store_word(self.fetch_word(), self.get_register_pair('DE')),
-            0x56: lambda: self.im(1),
-            0x57: lambda: self.ld_a_i(),
-            0x58: lambda: self.in_r_c('E'),
-            0x59: lambda: self.out_c_r('E'),
-            0x5A: lambda: self.adc_hl('DE'),
-            0x5B: lambda: self.load_register_pair('DE', self.load_word(self.fetch_word())),
-            0x5E: lambda: self.im(2),
-            0x5F: lambda: self.ld_a_r(),
-            0x60: lambda: self.in_r_c('H'),
-            0x61: lambda: self.out_c_r('H'),
-            0x62: lambda: self.sbc_hl('HL'),
-            0x63: lambda: self.store_word(self.fetch_word(), self.get_register_pair('HL')),
-            0x67: lambda: self.rrd(),
-            0x68: lambda: self.in_r_c('L'),
-            0x69: lambda: self.out_c_r('L'),
-            0x6A: lambda: self.adc_hl('HL'),
-            0x6B: lambda: self.load_register_pair('HL', self.load_word(self.fetch_word())),
-            0x6F: lambda: self.rld(),
-            0x72: lambda: self.sbc_hl('SP'),
-            0x73: lambda: self.store_word(self.fetch_word(), self.get_register_pair('SP')),
-            0x78: lambda: self.in_r_c('A'),
-            0x79: lambda: self.out_c_r('A'),
-            0x7A: lambda: self.adc_hl('SP'),
-            0x7B: lambda: self.load_register_pair('SP', self.load_word(self.fetch_word())),
-            0xA0: lambda: self.ldi(),
-            0xA1: lambda: self.cpi(),
-            0xA2: lambda: self.ini(),
-            0xA3: lambda: self.outi(),
-            0xA8: lambda: self.ldd(),
-            0xA9: lambda: self.cpd(),
-            0xAA: lambda: self.ind(),
-            0xAB: lambda: self.outd(),
-            0xB0: lambda: self.ldir(),
-            0xB1: lambda: self.cpir(),
-            0xB2: lambda: self.inir(),
-            0xB3: lambda: self.otir(),
-            0xB8: lambda: self.lddr(),
-            0xB9: lambda: self.cpdr(),
-            0xBA: lambda: self.indr(),
-            0xBB: lambda: self.otdr(),
-        }
-        if opcode in ed_instructions:
-            ed_instructions[opcode]()
-        else:
-            raise ValueError(f"Unknown ED-prefixed opcode: {opcode:02X}")
-
-    def _execute_indexed_cb(self, index_reg):
-        offset = self.fetch_signed()
-        opcode = self.fetch()
-        address = (self.registers[index_reg] + offset) & 0xFFFF
-        value = self.memory[address]
-
-        if opcode < 0x40:  # Rotate and Shift instructions
-            operation = [self.rlc, self.rrc, self.rl, self.rr, self.sla, self.sra, self.sll, self.srl][opcode >> 3]
-            result = operation(value)
-            self.memory[address] = result
-            if opcode & 7 != 6:  # If not (HL), store result in register
-                reg = ['B', 'C', 'D', 'E', 'H', 'L', None, 'A'][opcode & 7]
-                self.registers[reg] = result
-        elif opcode < 0x80:  # BIT instructions
-            bit = (opcode >> 3) & 7
-            self.bit(bit, value)
-            # Установка флагов F5 и F3 на основе старшего байта адреса
-            high_byte = (address >> 8) & 0xFF
-            self.set_flag('5', high_byte & 0x20)
-            self.set_flag('3', high_byte & 0x08)
-        elif opcode < 0xC0:  # RES instructions
-            bit = (opcode >> 3) & 7
-            result = self.res(bit, value)
-            self.memory[address] = result
-            if opcode & 7 != 6:  # If not (HL), store result in register
-                reg = ['B', 'C', 'D', 'E', 'H', 'L', None, 'A'][opcode & 7]
-                self.registers[reg] = result
-        else:  # SET instructions
-            bit = (opcode >> 3) & 7
-            result = self.set(bit, value)
-            self.memory[address] = result
-            if opcode & 7 != 6:  # If not (HL), store result in register
-                reg = ['B', 'C', 'D', 'E', 'H', 'L', None, 'A'][opcode & 7]
-                self.registers[reg] = result
+        opcode = self.fetch_opcode()
+        self.tstates += ED_TSTATES[opcode]
+        self.ED_TABLE[opcode](self)
 
     def rst(self, address):
         # Push the current PC onto the stack
-        self.registers['SP'] = (self.registers['SP'] - 1) & 0xFFFF
-        self.memory[self.registers['SP']] = (self.registers['PC'] >> 8) & 0xFF
-        self.registers['SP'] = (self.registers['SP'] - 1) & 0xFFFF
-        self.memory[self.registers['SP']] = self.registers['PC'] & 0xFF
+        self.regs[REG_SP] = (self.regs[REG_SP] - 1) & 0xFFFF
+        self.write_byte(self.regs[REG_SP], (self.regs[REG_PC] >> 8) & 0xFF)
+        self.regs[REG_SP] = (self.regs[REG_SP] - 1) & 0xFFFF
+        self.write_byte(self.regs[REG_SP], self.regs[REG_PC] & 0xFF)
 
         # Jump to the restart address
-        self.registers['PC'] = address
+        self.regs[REG_PC] = address
 
     def ex_sp_ix(self, index_reg):
         # Получаем значение из стека
-        sp = self.registers['SP']
-        low = self.memory[sp]
-        high = self.memory[(sp + 1) & 0xFFFF]
+        sp = self.regs[REG_SP]
+        low = self.read_byte(sp)
+        high = self.read_byte((sp + 1) & 0xFFFF)
         stack_value = (high << 8) | low
+        self.access_time += 1
 
         # Получаем значение IX
-        ix_value = self.registers[index_reg]
+        ix_value = self.regs[index_reg]
 
         # Меняем местами значения
-        self.registers[index_reg] = stack_value
+        self.regs[index_reg] = stack_value
 
         # Записываем значение IX в стек
-        self.memory[sp] = ix_value & 0xFF
-        self.memory[(sp + 1) & 0xFFFF] = (ix_value >> 8) & 0xFF
+        self.write_byte(sp, ix_value & 0xFF)
+        self.write_byte((sp + 1) & 0xFFFF, (ix_value >> 8) & 0xFF)
 
         # Обновляем флаги
         #self.set_flag('3', high & 0x08)  # Бит 3 старшего байта нового значения IX
@@ -959,24 +1157,26 @@ class extCPUClass(baseCPUClass):
         # Другие флаги не изменяются
 
     def push_index_reg(self,index_reg):
+        # Цикл выборки кода команды удлинен на такт
+        self.access_time += 1
         # Уменьшаем указатель стека
-        self.registers['SP'] = (self.registers['SP'] - 1) & 0xFFFF
+        self.regs[REG_SP] = (self.regs[REG_SP] - 1) & 0xFFFF
 
         # Сохраняем старший байт IX
-        self.memory[self.registers['SP']] = (self.registers[index_reg] >> 8) & 0xFF
+        self.write_byte(self.regs[REG_SP], (self.regs[index_reg] >> 8) & 0xFF)
 
         # Снова уменьшаем указатель стека
-        self.registers['SP'] = (self.registers['SP'] - 1) & 0xFFFF
+        self.regs[REG_SP] = (self.regs[REG_SP] - 1) & 0xFFFF
 
         # Сохраняем младший байт IX
-        self.memory[self.registers['SP']] = self.registers[index_reg] & 0xFF
+        self.write_byte(self.regs[REG_SP], self.regs[index_reg] & 0xFF)
 
     def ld_a_r(self):
         # Загрузка значения R в A
-        self.registers['A'] = self.registers['R']
+        self.regs[REG_A] = self.regs[REG_R]
 
         # Установка флагов
-        result = self.registers['A']
+        result = self.regs[REG_A]
 
         # Флаг S устанавливается, если результат отрицательный
         self.set_flag('S', result & 0x80 != 0)
@@ -1001,23 +1201,23 @@ class extCPUClass(baseCPUClass):
 
     def ld_r_a(self):
         # Загрузка значения A в R
-        self.registers['R'] = self.registers['A']
+        self.regs[REG_R] = self.regs[REG_A]
 
         # Обратите внимание, что только 7 младших битов R изменяются
         # Бит 7 R сохраняет свое предыдущее значение
-        self.registers['R'] &= 0x7F  # Очищаем бит 7
-        self.registers['R'] |= self.registers['R'] & 0x80  # Восстанавливаем бит 7
+        self.regs[REG_R] &= 0x7F  # Очищаем бит 7
+        self.regs[REG_R] |= self.regs[REG_R] & 0x80  # Восстанавливаем бит 7
 
         # Эта инструкция не влияет на флаги
 
     def ld_a_i(self):
         # Загрузка значения из регистра I в регистр A
-        self.registers['A'] = self.registers['I']
+        self.regs[REG_A] = self.regs[REG_I]
 
         # Установка флагов
-        self.set_flag('S', self.registers['A'] & 0x80)  # Устанавливаем, если бит 7 установлен
+        self.set_flag('S', self.regs[REG_A] & 0x80)  # Устанавливаем, если бит 7 установлен
 
-        self.set_flag('Z', self.registers['A'] == 0)    # Устанавливаем, если A == 0
+        self.set_flag('Z', self.regs[REG_A] == 0)    # Устанавливаем, если A == 0
         self.set_flag('H', 0)  # Всегда сбрасывается
         self.set_flag('N', 0)  # Всегда сбрасывается
 
@@ -1025,17 +1225,17 @@ class extCPUClass(baseCPUClass):
         self.set_flag('P/V', self.iff2)
 
         # Флаги 3 и 5 копируются из соответствующих битов в A
-        self.set_flag('3', self.registers['A'] & 0x08)
-        self.set_flag('5', self.registers['A'] & 0x20)
+        self.set_flag('3', self.regs[REG_A] & 0x08)
+        self.set_flag('5', self.regs[REG_A] & 0x20)
 
     def reti(self):
         # Восстанавливаем PC из стека
-        low = self.memory[self.registers['SP']]
-        self.registers['SP'] = (self.registers['SP'] + 1) & 0xFFFF
-        high = self.memory[self.registers['SP']]
-        self.registers['SP'] = (self.registers['SP'] + 1) & 0xFFFF
+        low = self.read_byte(self.regs[REG_SP])
+        self.regs[REG_SP] = (self.regs[REG_SP] + 1) & 0xFFFF
+        high = self.read_byte(self.regs[REG_SP])
+        self.regs[REG_SP] = (self.regs[REG_SP] + 1) & 0xFFFF
 
-        self.registers['PC'] = (high << 8) | low
+        self.regs[REG_PC] = (high << 8) | low
 
         # Восстанавливаем прерывания
         self.interrupts_enabled = True
@@ -1044,18 +1244,15 @@ class extCPUClass(baseCPUClass):
         # Это может быть реализовано различными способами в зависимости от вашей архитектуры
         #self.signal_end_of_interrupt()
 
-        # Обновляем счетчик циклов
-        self.cycles += 14  # RETI занимает 14 T-циклов
-
     def inc_index_l(self, index_reg):
         # Получаем текущее значение IYl (младший байт IY)
-        value = self.registers[index_reg] & 0xFF
+        value = self.regs[index_reg] & 0xFF
 
         # Увеличиваем значение на 1
         result = (value + 1) & 0xFF
 
         # Обновляем младший байт IY, сохраняя старший байт неизменным
-        self.registers[index_reg] = (self.registers[index_reg] & 0xFF00) | result
+        self.regs[index_reg] = (self.regs[index_reg] & 0xFF00) | result
 
         # Устанавливаем флаги
         self.set_flag('S', result & 0x80)  # Устанавливаем, если результат отрицательный
@@ -1070,13 +1267,13 @@ class extCPUClass(baseCPUClass):
 
     def dec_index_l(self, index_reg):
         # Получаем текущее значение IYl (младший байт IY)
-        value = self.registers[index_reg] & 0xFF
+        value = self.regs[index_reg] & 0xFF
 
         # Увеличиваем значение на 1
         result = (value - 1) & 0xFF
 
         # Обновляем младший байт IY, сохраняя старший байт неизменным
-        self.registers[index_reg] = (self.registers[index_reg] & 0xFF00) | result
+        self.regs[index_reg] = (self.regs[index_reg] & 0xFF00) | result
 
         # Устанавливаем флаги
         self.set_flag('S', result & 0x80)  # Устанавливаем, если результат отрицательный
@@ -1088,191 +1285,3 @@ class extCPUClass(baseCPUClass):
         # Устанавливаем флаги 3 и 5 в соответствии с результатом
         self.set_flag('3', result & 0x08)
         self.set_flag('5', result & 0x20)
-
-    def cpir(self):
-        while True:
-            # Получаем текущие значения
-            hl = self.get_register_pair('HL')
-            bc = self.get_register_pair('BC')
-
-            self.cycles += 16
-            if bc == 0: break
-
-            a = self.registers['A']
-
-            # Сравниваем значение в памяти по адресу (HL) с A
-            value = self.memory[hl]
-            result = (a - value) & 0xFF
-
-            # Увеличиваем HL
-            hl = (hl + 1) & 0xFFFF
-            self.set_register_pair('HL', hl)
-
-            # Уменьшаем BC
-            bc = (bc - 1) & 0xFFFF
-            self.set_register_pair('BC', bc)
-
-            # Устанавливаем флаги
-            self.set_flag('S', result & 0x80)
-            self.set_flag('Z', result == 0)
-            self.set_flag('H', ((a & 0x0F) - (value & 0x0F)) & 0x10)
-            self.set_flag('P/V', bc != 0)
-            self.set_flag('N', 1)
-
-            # Устанавливаем флаги 3 и 5 на основе результата
-            self.set_flag('3', result & 0x08)
-            self.set_flag('5', result & 0x20)
-
-            # Если BC != 0 и Z = 0, повторяем операцию
-            #if bc != 0 and result != 0:
-                #self.registers['PC'] -= 2  # Возвращаемся к началу инструкции
-                #self.cycles += 21  # CPIR занимает 21 цикл при повторении
-            #else:
-            #    self.cycles += 16  # CPIR занимает 16 циклов при завершении
-
-            # Обновляем флаг переноса
-            #self.set_flag('C', a < value)
-
-            if result == 0: break
-
-    def outd(self):
-        # Получаем значение из памяти по адресу (HL)
-        value = self.memory[self.get_register_pair('HL')]
-
-        # Выводим значение в порт (C)
-        port = self.registers['C']
-        self.io_write(port, value)
-
-        # Уменьшаем HL
-        hl = self.get_register_pair('HL')
-        self.set_register_pair('HL', (hl - 1) & 0xFFFF)
-
-        # Уменьшаем B
-        self.registers['B'] = (self.registers['B'] - 1) & 0xFF
-
-        # Устанавливаем флаги
-        self.set_flag('N', 1)
-        self.set_flag('Z', self.registers['B'] == 0)
-
-        # Обновляем флаг H (не совсем ясно, как он должен обновляться для OUTD)
-        # Обычно оставляют его без изменений
-
-        # Обновляем флаг C (зависит от реализации)
-        # В некоторых реализациях он не меняется, в других - устанавливается по определенным правилам
-
-        # Увеличиваем счетчик циклов
-        self.cycles += 16
-
-    def outi(self):
-        # Получаем значение из памяти по адресу (HL)
-        value = self.memory[self.get_register_pair('HL')]
-
-        # Выводим значение в порт (C)
-        port = self.registers['C']
-        self.io_write(port, value)
-
-        # Уменьшаем HL
-        hl = self.get_register_pair('HL')
-        self.set_register_pair('HL', (hl + 1) & 0xFFFF)
-
-        # Уменьшаем B
-        self.registers['B'] = (self.registers['B'] - 1) & 0xFF
-
-        # Устанавливаем флаги
-        self.set_flag('N', 0)
-        self.set_flag('Z', self.registers['B'] == 0)
-
-        # Обновляем флаг H (не совсем ясно, как он должен обновляться для OUTD)
-        # Обычно оставляют его без изменений
-
-        # Обновляем флаг C (зависит от реализации)
-        # В некоторых реализациях он не меняется, в других - устанавливается по определенным правилам
-
-        # Увеличиваем счетчик циклов
-        self.cycles += 16
-
-    def cpi(self):
-        hl = self.get_register_pair('HL')
-        bc = self.get_register_pair('BC')
-        a = self.registers['A']
-        value = self.memory[hl]
-        
-        result = a - value
-        
-        self.set_register_pair('HL', hl + 1 & 0xFFFF)
-        self.set_register_pair('BC', bc - 1 & 0xFFFF)
-        
-        self.set_flag('S', result & 0x80)
-        self.set_flag('Z', result == 0)
-        self.set_flag('H', (a & 0xF) - (value & 0xF) < 0)
-        self.set_flag('P/V', bc != 1)  # Set P/V if BC-1 != 0
-        self.set_flag('N', 1)
-        
-        self.set_flag('3', result & 0x08)
-        self.set_flag('5', result & 0x20)
-        
-        self.cycles += 16
-
-    def cpd(self):
-        a = self.registers['A']
-        hl = self.get_register_pair('HL')
-        memory_value = self.memory[hl]
-        result = a - memory_value
-
-        # Обновляем флаги
-        self.set_flag('S', (result & 0x80) != 0)  # Знаковый флаг
-        self.set_flag('Z', (result & 0xFF) == 0)  # Нулевой флаг
-        self.set_flag('H', ((a & 0xF) - (memory_value & 0xF)) < 0)  # Полузаем
-        self.set_flag('P/V', self.get_register_pair('BC') - 1 != 0)  # Переполнение/Паритет (BC != 1)
-        self.set_flag('N', 1)  # Вычитание
-        # Устанавливаем флаги 3 и 5 на основе результата
-        self.set_flag('3', result & 0x08)
-        self.set_flag('5', result & 0x20)
-
-        # Обновляем регистры HL и BC
-        self.set_register_pair('HL', hl - 1)
-        self.set_register_pair('BC', self.get_register_pair('BC') - 1)
-
-
-    def cpdr(self):
-        while True:
-            # Выполняем операцию сравнения
-            hl = self.get_register_pair('HL')
-            bc = self.get_register_pair('BC')
-            self.cycles += 16
-            if bc == 0: break
-
-            a = self.registers['A']
-            value = self.memory[hl]
-            result = a - value
-
-            # Уменьшаем HL и BC
-            hl = (hl - 1) & 0xFFFF
-            bc = (bc - 1) & 0xFFFF
-            self.set_register_pair('HL', hl)
-            self.set_register_pair('BC', bc)
-
-            # Устанавливаем флаги
-            self.set_flag('S', result & 0x80)
-            self.set_flag('Z', result == 0)
-            self.set_flag('H', (a & 0xF) - (value & 0xF) < 0)
-            self.set_flag('P/V', bc != 0)
-            self.set_flag('N', 1)
-            
-            # Устанавливаем флаги 3 и 5 на основе результата
-            self.set_flag('3', result & 0x08)
-            self.set_flag('5', result & 0x20)
-
-            # Добавляем 21 цикл за каждую итерацию
-            self.cycles += 21
-
-            # Проверяем условие выхода
-            if result == 0: break
-
-        # Устанавливаем флаг переноса
-        #self.set_flag('C', a < value)
-
-        # Если BC != 0 и результат не равен 0, уменьшаем PC на 2
-        #if bc != 0 and result != 0:
-        #    self.registers['PC'] = (self.registers['PC'] - 2) & 0xFFFF
-        #    self.cycles += 5  # Добавляем 5 циклов, если происходит повтор
\ No newline at end of file
@@ -0,0 +1,201 @@
+# framebuffer.py
+# Кадр ZX Spectrum в массиве NumPy индексов палитры, без pygame и окна
+
+import numpy as np
+
+SCREEN_WIDTH = 256
+SCREEN_HEIGHT = 192
+SCREEN_SIZE = 6912      # 6144 байта пикселей и 768 байт атрибутов
+BORDER_SIZE = 32        # Ширина бордюра в кадре с бордюром (320x256)
+
+COLORS = [
+    (0, 0, 0),      # 0: Black
+    (0, 0, 200),    # 1: Blue
+    (200, 0, 0),    # 2: Red
+    (200, 0, 200),  # 3: Magenta
+    (0, 200, 0),    # 4: Green
+    (0, 200, 200),  # 5: Cyan
+    (200, 200, 0),  # 6: Yellow
+    (200, 200, 200)  # 7: White
+]
+BRIGHT_COLORS = [
+    (0, 0, 0),      # 0: Black
+    (0, 0, 255),    # 1: Bright Blue
+    (255, 0, 0),    # 2: Bright Red
+    (255, 0, 255),  # 3: Bright Magenta
+    (0, 255, 0),    # 4: Bright Green
+    (0, 255, 255),  # 5: Bright Cyan
+    (255, 255, 0),  # 6: Bright Yellow
+    (255, 255, 255)  # 7: Bright White
+]
+# Палитра кадра: индекс bright * 8 + цвет
+PALETTE = np.array(COLORS + BRIGHT_COLORS, dtype=np.uint8)
+
+
+class Framebuffer:
+    """
+    Кадр в массиве pixels [x, y] индексов palette: 256x192 или 320x256 с бордюром.
+
+    Экран читается прямо из показываемого банка памяти. render() строит весь кадр,
+    render_changed() заново раскладывает только знакоместа, помеченные записью в память
+    (Memory.take_screen_dirty). Вывод в окно, файл или сеть - дело потребителя кадра,
+    цвета индексов он берет из palette (set_palette меняет ее для всех потребителей).
+    """
+    def __init__(self, memory, border=False):
+        """
+        :param memory: Memory
+        :param border: True - кадр 320x256 с бордюром (render_border)
+        """
+        self.memory = memory
+        self.border = border
+        offset = BORDER_SIZE if border else 0
+        self.top = offset       # Строка кадра, с которой начинается экран
+        self.pixels = np.zeros((SCREEN_WIDTH + 2 * offset, SCREEN_HEIGHT + 2 * offset), dtype=np.uint8)
+        self.screen = self.pixels[offset:offset + SCREEN_WIDTH, offset:offset + SCREEN_HEIGHT]
+        # Экран по знакоместам: [столбец, x в знакоместе, строка, y в знакоместе] (без копирования)
+        self.cells = self.screen.view()
+        self.cells.shape = (32, 8, 24, 8)
+        self.palette = PALETTE.copy()   # Цвета (r, g, b) индексов кадра, включая бордюр
+        self.border_rows = np.zeros(self.pixels.shape[1], dtype=np.uint8)  # Цвет бордюра по строкам
+        self.full_render_cells = 384  # Изменилось больше знакомест - кадр строится целиком
+        self.flash_phase = 0    # Фаза FLASH: 1 - ink и paper мигающих знакомест меняются местами
+        self.shown_flash = 0    # Фаза FLASH, с которой построен кадр
+        self.shown_bank = None  # Банк, с которого построен кадр (None - построить весь кадр)
+        self.clean = bytes(768)  # Флаги знакомест без изменений
+        self.no_cells = np.zeros((32, 24), dtype=bool)   # Результат render_changed без изменений
+        self.no_cells.flags.writeable = False
+        self.fill_screen_index()
+
+    def fill_screen_index(self):
+        """
+        Готовит таблицы: смещения байтов пикселей и атрибутов в экранной области
+        (в порядке [столбец байта, строка]) и индексы цветов ink/paper для каждого
+        значения атрибута. Таблиц ink/paper две, по фазам FLASH: во второй у мигающих
+        атрибутов цвета переставлены.
+        """
+        y = np.arange(SCREEN_HEIGHT)
+        column = np.arange(SCREEN_WIDTH // 8)[:, np.newaxis]
+        line = ((y & 0b11000000) << 5) | ((y & 0b00111000) << 2) | ((y & 0b00000111) << 8)
+        self.pixel_index = (line + column).astype(np.intp)
+        self.cell_pixel_index = self.pixel_index.reshape(32, 24, 8)   # [столбец, строка, y]
+        self.attr_index = (6144 + (y >> 3) * 32 + column).astype(np.intp)
+
+        attribute = np.arange(256)
+        bright = (attribute & 0x40) >> 3
+        ink = bright | (attribute & 0x07)
+        paper = bright | ((attribute & 0x38) >> 3)
+        flash = (attribute & 0x80) != 0
+        self.ink_luts = np.array([ink, np.where(flash, paper, ink)], dtype=np.uint8)
+        self.paper_luts = np.array([paper, np.where(flash, ink, paper)], dtype=np.uint8)
+
+    def update_flash(self, frames):
+        """
+        Обновляет фазу FLASH: ULA меняет ее каждые 16 кадров.
+
+        :param frames: счетчик кадров (прерываний)
+        """
+        self.flash_phase = (frames >> 4) & 1
+
+    def set_palette(self, colors, bright_colors):
+        """
+        Меняет цвета индексов. Кадр хранит индексы, поэтому он не перестраивается.
+
+        :param colors: 8 цветов (r, g, b) без яркости
+        :param bright_colors: 8 ярких цветов
+        """
+        self.palette[:] = list(colors) + list(bright_colors)
+
+    def invalidate(self):
+        """Требует построения всего кадра при следующем render_changed()."""
+        self.shown_bank = None
+
+    def screen_bytes(self):
+        # 6912 байт показываемого экрана без копирования
+        return np.frombuffer(self.memory.memory[self.memory.screen_bank], dtype=np.uint8, count=SCREEN_SIZE)
+
+    def render(self):
+        """
+        Строит весь экран: перестановка строк по готовым индексам, один unpackbits
+        на все пиксели, цвета - по таблицам текущей фазы FLASH.
+
+        :return: pixels
+        """
+        bank = self.memory.screen_bank
+        self.memory.take_screen_dirty(bank)     # Кадр строится целиком, флаги не нужны
+        self.render_bytes(self.screen_bytes())
+        self.shown_bank = bank
+        return self.pixels
+
+    def render_bytes(self, screen):
+        bits = np.unpackbits(screen[self.pixel_index], axis=0)   # [x, y], 256 x 192
+        # Цвета ink/paper ищутся по байтам знакомест (32 x 192), а не по каждому пикселю
+        attributes = screen[self.attr_index]
+        ink = np.repeat(self.ink_luts[self.flash_phase][attributes], 8, axis=0)
+        paper = np.repeat(self.paper_luts[self.flash_phase][attributes], 8, axis=0)
+        np.copyto(self.screen, np.where(bits, ink, paper))
+        self.shown_flash = self.flash_phase
+
+    def render_changed(self):
+        """
+        Обновляет только знакоместа, измененные с прошлого кадра: помеченные записью
+        в экранный банк (Memory.take_screen_dirty), а при смене фазы FLASH - мигающие.
+        Без изменений возвращается сразу, не трогая байты экрана.
+
+        :return: массив bool [столбец, строка] 32 x 24 обновленных знакомест (только для чтения)
+        """
+        bank = self.memory.screen_bank
+        dirty = self.memory.take_screen_dirty(bank)
+        flash = self.flash_phase != self.shown_flash
+        if bank == self.shown_bank and not flash and dirty == self.clean:
+            return self.no_cells
+
+        screen = self.screen_bytes()
+        if bank != self.shown_bank:
+            # Первый кадр, invalidate() или смена показываемого экрана
+            self.render_bytes(screen)
+            self.shown_bank = bank
+            return np.ones((32, 24), dtype=bool)
+
+        cells = np.frombuffer(dirty, dtype=np.uint8).reshape(24, 32).T != 0
+        if flash:
+            self.shown_flash = self.flash_phase
+            cells |= (screen[6144:] & 0x80).reshape(24, 32).T != 0
+        count = np.count_nonzero(cells)
+        if count == 0:
+            return self.no_cells
+        if count > self.full_render_cells:
+            # Изменилась большая часть экрана: целиком быстрее
+            self.render_bytes(screen)
+            return cells
+
+        column, row = np.nonzero(cells)
+        bits = np.unpackbits(screen[self.cell_pixel_index[column, row]][:, :, np.newaxis], axis=2)   # [знакоместо, y, x]
+        attributes = screen[6144 + row * 32 + column][:, np.newaxis, np.newaxis]
+        colors = np.where(bits, self.ink_luts[self.flash_phase][attributes],
+                          self.paper_luts[self.flash_phase][attributes])
+        self.cells[column, :, row] = colors.transpose(0, 2, 1)
+        return cells
+
+    def render_border(self, border_log, frame_start):
+        """
+        Раскрашивает бордюр кадра 320x256 по журналу записей в порт FE.
+
+        :param border_log: BorderLog
+        :param frame_start: значение tstates в начале кадра
+        :return: True, если бордюр перерисован
+        """
+        if not self.border:
+            raise ValueError("Кадр без бордюра")
+        rows = self.border_rows
+        bands = border_log.bands(frame_start, self.top, 1, len(rows))
+        if bands is None:
+            return False
+        for start, end, color in bands:
+            rows[start:end] = color
+        top = self.top
+        bottom = top + SCREEN_HEIGHT
+        self.pixels[:top] = rows
+        self.pixels[top + SCREEN_WIDTH:] = rows
+        self.pixels[top:top + SCREEN_WIDTH, :top] = rows[:top]
+        self.pixels[top:top + SCREEN_WIDTH, bottom:] = rows[bottom:]
+        return True
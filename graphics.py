@@ -1,6 +1,7 @@
 import numpy as np
 import pygame
 import sys
+from framebuffer import Framebuffer, COLORS, BRIGHT_COLORS
 
 
 class ZX_Spectrum_Graphics:
@@ -14,37 +15,157 @@ class ZX_Spectrum_Graphics:
         self.scr_base_address = 16384  # 0x4000
         self.scr_addr = np.zeros(
             (self.screen_width, self.screen_height, 3), dtype=np.uint16)
-        self.buffer = np.zeros((self.screen_width, self.screen_height, 3), dtype=np.uint8)
-
-        self.colors = [
-            (0, 0, 0),      # 0: Black
-            (0, 0, 200),    # 1: Blue
-            (200, 0, 0),    # 2: Red
-            (200, 0, 200),  # 3: Magenta
-            (0, 200, 0),    # 4: Green
-            (0, 200, 200),  # 5: Cyan
-            (200, 200, 0),  # 6: Yellow
-            (200, 200, 200)  # 7: White
-        ]
-        self.bright_colors = [
-            (0, 0, 0),      # 0: Black
-            (0, 0, 255),    # 1: Bright Blue
-            (255, 0, 0),    # 2: Bright Red
-            (255, 0, 255),  # 3: Bright Magenta
-            (0, 255, 0),    # 4: Bright Green
-            (0, 255, 255),  # 5: Bright Cyan
-            (255, 255, 0),  # 6: Bright Yellow
-            (255, 255, 255)  # 7: Bright White
-        ]
+        self.buffer = np.zeros((self.screen_width, self.screen_height, 3), dtype=np.uint8)  # RGB для fast-fast4
+        self.shown_bank = None  # Банк, по которому построен buffer (при смене - полная перерисовка)
+        self.scanlines = None   # Маска поверх изображения: None, 'scanlines' или 'crt'
+        self.max_rects = 64     # Больше измененных участков - выводится весь кадр
+        self.padded = np.zeros((24, 34), dtype=np.int8)  # Знакоместа с пустыми краями строк (cell_rects)
+        self.flash_phase = 0    # Фаза FLASH: 1 - ink и paper мигающих знакомест меняются местами
+        self.repaint = True     # Вывести весь кадр заново (новая поверхность, маска, палитра)
+        self.indexed = None     # 8-битная поверхность кадра с палитрой (создается в set_screen)
+
+        self.colors = list(COLORS)
+        self.bright_colors = list(BRIGHT_COLORS)
         #self.screen = pygame.display.set_mode((self.screen_width * self.pixel_size, self.screen_height * self.pixel_size))
 
         # Заполняем массив с заранее посчитанными адресами экрана
         self.fill_scr_addr()
-
-        pygame.display.set_caption("ZX Spectrum Emulator")
+        # Кадр в индексах палитры (без pygame); окно - один из его потребителей
+        self.framebuffer = Framebuffer(memory)
+        self.palette = self.framebuffer.palette     # Общая с Framebuffer, не копия
+
+    def update_flash(self, frames):
+        """
+        Обновляет фазу FLASH: ULA меняет ее каждые 16 кадров.
+
+        :param frames: счетчик кадров (прерываний)
+        """
+        self.flash_phase = (frames >> 4) & 1
+        self.framebuffer.update_flash(frames)
+
+    def set_palette(self, colors, bright_colors):
+        """
+        Меняет палитру. Кадр хранится в индексах цветов, поэтому он не перестраивается:
+        палитра меняется в Framebuffer (для всех потребителей кадра, включая бордюр
+        render_border), обновляется палитра 8-битной поверхности и кадр выводится заново.
+        colors и bright_colors меняются для рендеров fast-fast4 и бордюра окна.
+
+        :param colors: 8 цветов (r, g, b) без яркости
+        :param bright_colors: 8 ярких цветов
+        """
+        self.colors[:] = colors
+        self.bright_colors[:] = bright_colors
+        self.framebuffer.set_palette(self.colors, self.bright_colors)
+        if self.indexed is not None:
+            self.indexed.set_palette([tuple(color) for color in self.palette.tolist()])
+        self.repaint = True
 
     def set_screen(self, screen):
+        """
+        Задает поверхность вывода и заранее создает все буферы вывода кадра:
+        8-битную поверхность 256x192 с палитрой для индексов Framebuffer, поверхность
+        256x192 формата screen и маску строк развертки.
+
+        :param screen: поверхность pygame размером 256*pixel_size x 192*pixel_size
+        """
+        if not 1 <= self.pixel_size <= 4:
+            raise ValueError(f"Неподдерживаемый размер пикселя: {self.pixel_size}")
         self.screen = screen
+        self.indexed = pygame.Surface((self.screen_width, self.screen_height), 0, 8)
+        self.indexed.set_palette([tuple(color) for color in self.palette.tolist()])
+        self.frame = pygame.Surface((self.screen_width, self.screen_height), 0, screen)
+        self.set_scanlines(self.scanlines)
+
+    def set_scanlines(self, mode):
+        """
+        Включает маску поверх изображения. Маска строится один раз и накладывается
+        умножением цветов при выводе кадра. При pixel_size 1 маске некуда ложиться,
+        она не применяется.
+
+        :param mode: None - без маски, 'scanlines' - последняя строка каждого пикселя
+                     затемнена вдвое, 'crt' - то же и затемнен последний столбец пикселя
+        """
+        if mode not in (None, 'scanlines', 'crt'):
+            raise ValueError(f"Неизвестная маска: {mode}")
+        self.scanlines = mode
+        self.mask = None
+        self.repaint = True
+        if mode is None or self.pixel_size == 1:
+            return
+        size = self.pixel_size
+        mask = np.full(self.screen.get_size() + (3,), 255, dtype=np.uint8)   # [x, y, rgb]
+        if mode == 'crt':
+            mask[size - 1::size] = 192
+        mask[:, size - 1::size] //= 2
+        self.mask = pygame.Surface(self.screen.get_size(), 0, self.screen)
+        pygame.surfarray.blit_array(self.mask, mask)
+
+    def present(self, rects=None):
+        """
+        Выводит кадр Framebuffer на поверхность screen с увеличением и маской.
+        Индексы (байт на пиксель) копируются в 8-битную поверхность, в цвета их переводит
+        SDL при переносе в поверхность формата screen, затем кадр масштабируется.
+        Поверхности кадра и маска созданы в set_screen, буферы размером с кадр за кадр
+        не выделяются. При выводе части кадра на каждый прямоугольник создаются мелкие
+        объекты (Rect и две subsurface без копирования пикселей), их не больше max_rects.
+
+        :param rects: прямоугольники кадра для вывода; None - весь кадр
+        :return: выведенные прямоугольники в координатах screen
+        """
+        pygame.surfarray.blit_array(self.indexed, self.framebuffer.screen)
+        if rects is None:
+            self.frame.blit(self.indexed, (0, 0))
+        else:
+            for rect in rects:
+                self.frame.blit(self.indexed, rect, rect)
+        return self.scale_frame(rects)
+
+    def present_rgb(self, buffer):
+        """
+        Выводит кадр 256x192 в цветах (массив [x, y, rgb]) - для рендеров fast-fast4.
+
+        :param buffer: кадр
+        :return: выведенные прямоугольники в координатах screen
+        """
+        pygame.surfarray.blit_array(self.frame, buffer)
+        return self.scale_frame(None)
+
+    def scale_frame(self, rects):
+        # Масштабирование frame в screen и наложение маски (весь кадр или прямоугольники)
+        if rects is None:
+            pygame.transform.scale(self.frame, self.screen.get_size(), self.screen)
+            if self.mask is not None:
+                self.screen.blit(self.mask, (0, 0), special_flags=pygame.BLEND_MULT)
+            return [self.screen.get_rect()]
+
+        size = self.pixel_size
+        scaled_rects = []
+        for rect in rects:
+            scaled = pygame.Rect(rect.x * size, rect.y * size, rect.width * size, rect.height * size)
+            pygame.transform.scale(self.frame.subsurface(rect), scaled.size, self.screen.subsurface(scaled))
+            if self.mask is not None:
+                self.screen.blit(self.mask, scaled, scaled, special_flags=pygame.BLEND_MULT)
+            scaled_rects.append(scaled)
+        return scaled_rects
+
+    def cell_rects(self, cells):
+        """
+        Собирает измененные знакоместа в прямоугольники: подряд идущие знакоместа
+        одной строки объединяются. Если прямоугольников или знакомест слишком много,
+        выводится весь кадр.
+
+        :param cells: массив bool [столбец, строка] 32 x 24
+        :return: список pygame.Rect в координатах кадра или None (весь кадр)
+        """
+        padded = self.padded
+        padded[:, 1:33] = cells.T
+        edges = np.diff(padded.ravel())
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+        if len(starts) > self.max_rects or np.count_nonzero(cells) > self.framebuffer.full_render_cells:
+            return None
+        return [pygame.Rect(start % 34 * 8, start // 34 * 8, (end - start) * 8, 8)
+                for start, end in zip(starts.tolist(), ends.tolist())]
 
     def fill_scr_addr(self):
         for y in range(self.screen_height):
@@ -135,6 +256,8 @@ class ZX_Spectrum_Graphics:
         bright = (attribute & 0x40) >> 6
         ink = attribute & 0x07
         paper = (attribute & 0x38) >> 3
+        if attribute & 0x80 and self.flash_phase:
+            ink, paper = paper, ink
 
         if pixel_value:
             return self.bright_colors[ink] if bright else self.colors[ink]
@@ -156,6 +279,8 @@ class ZX_Spectrum_Graphics:
         bright = (attribute & 0x40) >> 6
         ink = attribute & 0x07
         paper = (attribute & 0x38) >> 3
+        if attribute & 0x80 and self.flash_phase:
+            ink, paper = paper, ink
 
         if pixel_value:
             return self.bright_colors[ink] if bright else self.colors[ink]
@@ -187,6 +312,8 @@ class ZX_Spectrum_Graphics:
                 bright = (attribute & 0x40) >> 6
                 ink = attribute & 0x07
                 paper = (attribute & 0x38) >> 3
+                if attribute & 0x80 and self.flash_phase:
+                    ink, paper = paper, ink
 
                 for x_offs in range(8):
                     xs = x + x_offs
@@ -197,18 +324,30 @@ class ZX_Spectrum_Graphics:
                     else:
                         buffer[xs, y] = self.bright_colors[paper] if bright else self.colors[paper]
 
-        pygame.surfarray.blit_array(self.screen, np.kron(buffer, np.ones(
-            (self.pixel_size, self.pixel_size, 1), dtype=np.uint8)))
+        self.present_rgb(buffer)
 
     def render_screen_fast4(self):
+        # Перерисовываются только знакоместа, измененные с прошлого кадра.
+        # Экран читается прямо из показываемого банка (5 или 7, бит 3 порта 7FFD).
+        bank = self.memory.screen_bank
+        screen = self.memory.memory[bank]
+        dirty = self.memory.take_screen_dirty(bank)
+        if bank != self.shown_bank:
+            dirty = b'\x01' * len(dirty)
+            self.shown_bank = bank
+
         #buffer = np.zeros((self.screen_width, self.screen_height, 3), dtype=np.uint8)
         for y in range(0, self.screen_height, 8):
             for x in range(0, self.screen_width, 8):
+                if not dirty[(y >> 3) * 32 + (x >> 3)]:
+                    continue
                 attribute_address = self.scr_addr[x, y][1]
-                attribute = self.memory.read(attribute_address)
+                attribute = screen[attribute_address - self.scr_base_address]
                 bright = (attribute & 0x40) >> 6
                 ink    = (attribute & 0x07)
                 paper  = (attribute & 0x38) >> 3
+                if attribute & 0x80 and self.flash_phase:
+                    ink, paper = paper, ink
 
                 color_ink = self.bright_colors[ink] if bright else self.colors[ink]
                 color_paper = self.bright_colors[paper] if bright else self.colors[paper]
@@ -216,7 +355,7 @@ class ZX_Spectrum_Graphics:
                 for y_offs in range(8):
                     ys = y + y_offs
                     address = self.scr_addr[x, ys][0]
-                    value = self.memory.read(address)
+                    value = screen[address - self.scr_base_address]
                     # Создаем массив цветов для 8 пикселей сразу
                     bits = np.unpackbits(np.array([value], dtype=np.uint8))[:8]
                     # Создаем массив цветов для 8 пикселей
@@ -224,7 +363,29 @@ class ZX_Spectrum_Graphics:
                     # Копируем весь массив цветов в буфер
                     self.buffer[x:x+8, ys] = pixel_colors
 
-        pygame.surfarray.blit_array(self.screen, np.kron(self.buffer, np.ones((self.pixel_size, self.pixel_size, 1), dtype=np.uint8)))
+        self.present_rgb(self.buffer)
+
+    def render_screen_fast5(self):
+        # Весь экран строится в Framebuffer одним проходом numpy (без циклов на Python)
+        # и выводится через 8-битную поверхность с палитрой.
+        self.framebuffer.render()
+        self.shown_bank = self.memory.screen_bank
+        self.repaint = False
+        self.present()
+
+    def render_screen_fast6(self):
+        # Кэш знакомест: Framebuffer заново раскладывает только знакоместа, помеченные
+        # записью в экранный банк (Memory.take_screen_dirty), и мигающие при смене фазы
+        # FLASH; выводятся только они. Возвращает измененные прямоугольники screen, чтобы
+        # окно обновлялось через pygame.display.update(rects).
+        cells = self.framebuffer.render_changed()
+        self.shown_bank = self.memory.screen_bank
+        if self.repaint:
+            self.repaint = False
+            return self.present()
+        if not cells.any():
+            return []
+        return self.present(rects=self.cell_rects(cells))
 
     def render_screen_fast(self):
         buffer = np.zeros((self.screen_width, self.screen_height, 3), dtype=np.uint8)
@@ -235,6 +396,8 @@ class ZX_Spectrum_Graphics:
                 bright = (attribute & 0x40) >> 6
                 ink    = (attribute & 0x07)
                 paper  = (attribute & 0x38) >> 3
+                if attribute & 0x80 and self.flash_phase:
+                    ink, paper = paper, ink
 
                 address = self.scr_addr[x, y][0]
                 for bit in range(8):
@@ -250,7 +413,7 @@ class ZX_Spectrum_Graphics:
                     #                                      y * self.pixel_size, self.pixel_size, self.pixel_size))
                     buffer[xs, y] = color
 
-        pygame.surfarray.blit_array(self.screen, np.kron(buffer, np.ones((self.pixel_size, self.pixel_size, 1), dtype=np.uint8)))
+        self.present_rgb(buffer)
 
     def render_screen_fast3(self):
         buffer = np.zeros((self.screen_height, self.screen_width, 3), dtype=np.uint8)
@@ -268,6 +431,8 @@ class ZX_Spectrum_Graphics:
         bright = (attributes & 0x40) >> 6
         ink = attributes & 0x07
         paper = (attributes & 0x38) >> 3
+        flash = (attributes & 0x80).astype(bool) & bool(self.flash_phase)
+        ink, paper = np.where(flash, paper, ink), np.where(flash, ink, paper)
 
         # Создаем массивы цветов
         ink_colors = np.where(bright[:, np.newaxis], self.bright_colors[ink], self.colors[ink])
@@ -278,11 +443,8 @@ class ZX_Spectrum_Graphics:
             mask = (pixels >> (7 - i)) & 1
             buffer[:, i::8] = np.where(mask[:, np.newaxis], ink_colors, paper_colors).reshape(self.screen_height, -1, 3)
 
-        # Увеличиваем буфер до нужного размера
-        scaled_buffer = np.kron(buffer, np.ones((self.pixel_size, self.pixel_size, 1), dtype=np.uint8))
-
-        # Отображаем буфер на экран
-        pygame.surfarray.blit_array(self.screen, scaled_buffer)
+        # Увеличиваем буфер до нужного размера и отображаем на экран (buffer здесь [y, x])
+        self.present_rgb(buffer.swapaxes(0, 1))
 
     def render_screen_slow(self):
         #screen = np.zeros((self.screen_height, self.screen_width, 3), dtype=np.uint8)
@@ -315,7 +477,9 @@ class ZX_Spectrum_Graphics:
         #self.render_screen_fast()
         #self.render_screen_fast2()
         #self.render_screen_fast3()
-        self.render_screen_fast4()
+        #self.render_screen_fast4()
+        #self.render_screen_fast5()
+        return self.render_screen_fast6()
         # Обновление окна
         # обновляется в цикле эмулятора
         #pygame.display.flip()
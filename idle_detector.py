@@ -0,0 +1,155 @@
+# idle_detector.py
+# Обнаружение и пропуск холостых циклов ожидания
+from base_cpu import REG_PC, REG_R
+
+# Шаг проверки: после каждого участка выполнения проверяется, не стоит ли процессор в цикле.
+# При неудачной проверке шаг удваивается, чтобы занятый код платил за проверки как можно меньше.
+MIN_SLICE_TSTATES = 1024
+MAX_SLICE_TSTATES = 16384
+# Наибольшая длина прохода цикла ожидания в командах. Адреса не ограничиваются:
+# ожидание клавиши в ПЗУ 48K проходит через вызовы KEY-INPUT по каналу (23 команды).
+MAX_LOOP_INSTRUCTIONS = 32
+# Порты, чтение которых не меняется до следующего кадра (младший байт адреса): клавиатура
+STABLE_PORTS = (0xFE,)
+
+
+class IdleLoopDetector:
+    """
+    Детектор холостых циклов: коротких циклов опроса, которые ничего не меняют
+    до следующего прерывания (ожидание клавиши в ПЗУ, опрос FRAMES в играх и т.п.).
+
+    Периодически один проход цикла выполняется под наблюдением. Если процессор вернулся
+    на тот же адрес с теми же регистрами, ничего не записал в память, а порты читались
+    только клавиатурные, все следующие проходы до конца бюджета будут такими же - их время
+    и приращение R добавляются сразу, без выполнения.
+
+    С задержками спорной памяти время прохода зависит от его места в кадре, поэтому
+    проходы пропускаются только на участке кадра без задержек (бордюр и обратный ход луча).
+    """
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self.slice = MIN_SLICE_TSTATES
+        self.skipped_tstates = 0  # Сколько T-состояний пропущено всего
+        self._clean = True      # Проход не писал в память и порты и читал только STABLE_PORTS
+        self._write = None      # cpu.write_byte и cpu.copy_block, подмененные на время прохода
+        self._copy = None
+
+    def run(self, deadline):
+        """
+        Выполняет команды до deadline, пропуская обнаруженные циклы ожидания.
+
+        :param deadline: значение tstates, до которого нужно выполнить команды
+        """
+        cpu = self.cpu
+        while cpu.tstates < deadline:
+            cpu.run_until(min(deadline, cpu.tstates + self.slice))
+            if cpu.tstates >= deadline or cpu.halted:
+                continue
+            if self.probe(deadline):
+                self.slice = MIN_SLICE_TSTATES
+            else:
+                self.slice = min(self.slice * 2, MAX_SLICE_TSTATES)
+
+    def probe(self, deadline):
+        """
+        Выполняет один проход возможного цикла ожидания и, если он холостой,
+        пропускает все целые проходы до deadline.
+
+        :return: True, если цикл оказался холостым
+        """
+        cpu = self.cpu
+        if cpu.hooks.active:
+            return False  # Перехватчики чтения могут подменять значения: проход не повторяем
+        regs = cpu.regs
+        memory = cpu.memory
+        start_pc = regs[REG_PC]
+        start_tstates = cpu.tstates
+        before = list(regs)
+        interrupts = (cpu.interrupts_enabled, cpu.interrupt_mode)
+        paging = list(memory.paged_banks)
+
+        # Запись в память перехватывается на время прохода, как и обращения к портам
+        self._clean = True
+        write_byte, copy_block = cpu.write_byte, cpu.copy_block
+        self._write, self._copy = write_byte, copy_block
+        cpu.write_byte = self._write_byte
+        cpu.copy_block = self._copy_block
+        cpu.io_read = self._io_read
+        cpu.io_write = self._io_write
+        cpu.deadline = deadline  # Блочные команды внутри прохода не должны выйти за бюджет
+        try:
+            for _ in range(MAX_LOOP_INSTRUCTIONS):
+                cpu.execute_instruction()
+                if regs[REG_PC] == start_pc or cpu.halted or cpu.tstates >= deadline or not self._clean:
+                    break
+        finally:
+            cpu.deadline = 0
+            cpu.write_byte, cpu.copy_block = write_byte, copy_block
+            del cpu.io_read
+            del cpu.io_write
+
+        if regs[REG_PC] != start_pc or cpu.halted or not self._clean:
+            return False
+        after = list(regs)
+        after[REG_R] = before[REG_R]
+        if after != before or (cpu.interrupts_enabled, cpu.interrupt_mode) != interrupts:
+            return False
+        if memory.paged_banks != paging:
+            return False
+
+        if cpu.contended:
+            limit = self._delay_free_end(start_tstates, cpu.tstates)
+            if limit is None:
+                # Цикл холостой, но проход задел задержки: пропуск - на участке кадра без них
+                return True
+            deadline = min(deadline, limit)
+        cost = cpu.tstates - start_tstates
+        count = (deadline - cpu.tstates) // cost
+        if count > 0:
+            # Оставшийся неполный проход выполнится обычным образом, как и без пропуска
+            cpu.tstates += cost * count
+            r = regs[REG_R]
+            regs[REG_R] = (r + ((r - before[REG_R]) & 0x7F) * count) & 0x7F | (r & 0x80)
+            self.skipped_tstates += cost * count
+        return True
+
+    def _delay_free_end(self, start, end):
+        """
+        Находит участок кадра без задержек спорной памяти, в котором целиком лежит проход.
+
+        :param start: такт начала прохода
+        :param end: такт конца прохода
+        :return: такт конца участка или None, если проход задевает строки экрана с задержками
+        """
+        cpu = self.cpu
+        timing = cpu.memory.timing
+        frame = timing['frame_tstates']
+        first = timing['first_tstate']
+        last = first + 191 * timing['line_tstates'] + 128   # За последним тактом с задержкой
+        position = (start - cpu.frame_start) % frame
+        frame_start = start - position
+        length = end - start
+        if position + length <= first:
+            return frame_start + first
+        if position >= last and position + length <= frame + first:
+            return frame_start + frame + first
+        return None
+
+    def _write_byte(self, address, value):
+        # Запись того же значения памяти не меняет
+        if self.cpu.memory.read(address) != value & 0xFF:
+            self._clean = False
+        self._write(address, value)
+
+    def _copy_block(self, source, destination, length, step=1):
+        self._clean = False
+        return self._copy(source, destination, length, step)
+
+    def _io_read(self, port):
+        if port & 0xFF not in STABLE_PORTS:
+            self._clean = False
+        return self.cpu.io_controller.read_port(port)
+
+    def _io_write(self, port, value):
+        self._clean = False
+        self.cpu.io_controller.write_port(port, value)
@@ -3,7 +3,6 @@ class IOController:
     def __init__(self, emulator):
         self.emulator = emulator
         self.border_color = 0  # Цвет границы
-        self.last_7ffd_value = 0
 
     def write_port(self, port, value):
         #print(f"Output to port {port:04X}: {value:02X}")
@@ -12,18 +11,16 @@ class IOController:
             self.border_color = value & 0x07
             #print(f"Установлен цвет границы: {self.border_color}")
             self.emulator.set_border(self.border_color)
-        elif port == 0x7FFD:
+        elif port == 0x7FFD and self.emulator.memory.machine['port_7ffd']:
             self.handle_7ffd_write(value)
+        elif port == 0x1FFD and self.emulator.memory.machine['port_1ffd']:
+            self.emulator.memory.write_port_1ffd(value)
 
     def handle_7ffd_write(self, value):
-        if not (self.last_7ffd_value & 0x20):  # Проверяем бит блокировки
-            self.last_7ffd_value = value
-            ram_bank = value & 0x07
-            self.emulator.memory.paged_banks[3] = ram_bank
-            self.emulator.memory.current_rom = (value >> 4) & 0x01
-            screen_bank = 5 if (value & 0x08) else 7
-            self.emulator.memory.paged_banks[1] = screen_bank
-            print(f"Memory configuration changed: RAM bank {ram_bank}, ROM {self.emulator.memory.current_rom}, Screen bank {screen_bank}")
+        # Разбор битов (банк, ПЗУ, экран, блокировка) зависит от модели и выполняется в Memory
+        memory = self.emulator.memory
+        memory.write_port_7ffd(value)
+        #print(f"Memory configuration changed: RAM bank {memory.paged_banks[3]}, ROM {memory.current_rom}, Screen bank {memory.screen_bank}")
 
     def read_port(self, port):
         if (port & 0xFF) == 0xFE:
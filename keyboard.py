@@ -55,16 +55,22 @@ class Keyboard:
     def get_matrix(self):
         return self.keyboard_matrix
 
-    def display_keyboard(self, screen, font, offset):
-        x, y = 10, 10 + offset
-        row_text = "KEYBOARD (ZX Spectrum 128)"
-        text = font.render(row_text, True, (255, 255, 255))
-        screen.blit(text, (x, y))
-        y += 20
-        
+    def keyboard_lines(self):
+        """
+        Строки панели отладки с матрицей клавиатуры (debug_panel.DebugPanel).
+
+        :return: заголовок и строка на каждый ряд матрицы
+        """
+        lines = ["KEYBOARD (ZX Spectrum 128)"]
         for row_index, row in enumerate(self.keyboard_matrix):
             row_text = f"Row {row_index}: " + " ".join("P" if pressed else "." for pressed in row)
             row_text += f' {self.port[row_index]:04X} {self.read_port_fe(self.port[row_index]):08b}'
+            lines.append(row_text)
+        return lines
+
+    def display_keyboard(self, screen, font, offset):
+        x, y = 10, 10 + offset
+        for row_text in self.keyboard_lines():
             text = font.render(row_text, True, (255, 255, 255))
             screen.blit(text, (x, y))
             y += 20
\ No newline at end of file
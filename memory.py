@@ -1,22 +1,223 @@
 import const
 import struct
+from contention import ULA_TIMINGS, build_delay_table
+
+BANK_SIZE = 16 * 1024  # Размер банка ОЗУ/ПЗУ и окна адресного пространства
+
+# Экран: 6144 байта пикселей и 768 байт атрибутов в начале банка 5 (или 7 на 128K).
+# SCREEN_CELLS[смещение] - номер знакоместа 8x8 (строка * 32 + столбец), к которому
+# относится байт: у пикселей строка знакомест собирается из битов 11-12 и 5-7 смещения.
+SCREEN_SIZE = 6912
+SCREEN_BANKS = (5, 7)
+SCREEN_CELLS = [(((offset >> 8) & 0x18) | ((offset >> 5) & 0x07)) * 32 + (offset & 0x1F)
+                for offset in range(6144)] + list(range(768))
+
+# Модели машин.
+# ram_banks/rom_banks - число банков ОЗУ и ПЗУ по 16KB;
+# port_7ffd - есть ли порт страниц 7FFD (на 48K банки 5, 2, 0 подключены постоянно);
+# bank_bits - биты порта 7FFD, из которых собирается номер банка для C000-FFFF
+# (первым - младший бит номера); lock - бит блокировки 7FFD (0 - блокировки нет);
+# port_1ffd - порт 1FFD Scorpion: бит 0 - банк 0 ОЗУ вместо ПЗУ, бит 1 - ПЗУ 2,
+# бит 4 - старший (третий) бит номера банка;
+# timing - временные параметры кадра из contention.ULA_TIMINGS;
+# contention - есть ли спорная память.
+MACHINES = {
+    '48k': {'ram_banks': 8, 'rom_banks': 2, 'port_7ffd': False, 'bank_bits': (0, 1, 2), 'lock': 0x20,
+            'port_1ffd': False, 'timing': '48k', 'contention': True},
+    '128k': {'ram_banks': 8, 'rom_banks': 2, 'port_7ffd': True, 'bank_bits': (0, 1, 2), 'lock': 0x20,
+             'port_1ffd': False, 'timing': '128k', 'contention': True},
+    'pentagon512': {'ram_banks': 32, 'rom_banks': 2, 'port_7ffd': True, 'bank_bits': (0, 1, 2, 6, 7), 'lock': 0x20,
+                    'port_1ffd': False, 'timing': 'pentagon', 'contention': False},
+    'pentagon1024': {'ram_banks': 64, 'rom_banks': 2, 'port_7ffd': True, 'bank_bits': (0, 1, 2, 6, 7, 5), 'lock': 0,
+                     'port_1ffd': False, 'timing': 'pentagon', 'contention': False},
+    'scorpion256': {'ram_banks': 16, 'rom_banks': 4, 'port_7ffd': True, 'bank_bits': (0, 1, 2), 'lock': 0x20,
+                    'port_1ffd': True, 'timing': '48k', 'contention': False},
+}
+BASE_BANKS = 8  # Банки 0-7 есть всегда, остальные выделяются при первом подключении
 
 class Memory:
-    def __init__(self, total_size=128 * 1024):
-        self.total_size = total_size
-        self.rom = [bytearray(16 * 1024) for _ in range(2)]  # 2 ROM банка по 16KB
+    def __init__(self, machine='128k'):
+        self.machine = MACHINES[machine]
+        self.bank_count = self.machine['ram_banks']
+        self.total_size = self.bank_count * BANK_SIZE
+        # Номер банка для C000-FFFF по значению порта 7FFD
+        self.bank_7ffd = [sum(((value >> bit) & 1) << n for n, bit in enumerate(self.machine['bank_bits']))
+                          for value in range(256)]
+        # Банки 0-7 и ПЗУ - один bytearray.
+        # memory[n] и rom[n] - постоянные окна memoryview в него: загрузка снапшота
+        # и сброс пишут на месте, поэтому ссылки на банки (таблица страниц,
+        # отрисовка экрана) остаются действительными.
+        # Дополнительные банки Pentagon/Scorpion выделяются по отдельности при первом
+        # обращении (ram_bank), пока они не нужны - в memory[n] None.
+        base_size = BASE_BANKS * BANK_SIZE
+        self.store = bytearray(base_size + self.machine['rom_banks'] * BANK_SIZE)
+        view = memoryview(self.store)
+        self.memory = [view[bank * BANK_SIZE:(bank + 1) * BANK_SIZE] for bank in range(BASE_BANKS)]
+        self.memory += [None] * (self.bank_count - BASE_BANKS)
+        self.rom = [view[base_size + n * BANK_SIZE:base_size + (n + 1) * BANK_SIZE]
+                    for n in range(self.machine['rom_banks'])]
+        self.code_pages = [bytearray(64) for _ in range(self.bank_count)]  # Флаги 256-байтных страниц с кодом
+        # Флаги измененных знакомест экранных банков, сбрасываются отрисовкой (take_screen_dirty)
+        self.screen_dirty = {bank: bytearray(768) for bank in SCREEN_BANKS}
+        self.code_listeners = []  # Подписчики на запись в страницы с транслированным кодом
+        # Таблица страниц: окна 0000-3FFF, 4000-7FFF, 8000-BFFF, C000-FFFF
+        # по paged_banks (номер банка ОЗУ, для ПЗУ - ~номер ПЗУ).
+        # Пятая запись повторяет первую - адреса 10000-13FFF (слово по адресу FFFF, (IX+d))
+        # попадают в ПЗУ, как при переходе через 0xFFFF. Списки не пересоздаются:
+        # процессор держит ссылку на pages.
+        self.pages = [None] * 5
+        self.page_writable = [False] * 5  # Флаг разрешения записи (ПЗУ защищено)
+        self.page_code = [None] * 5  # Флаги страниц с кодом для банка в окне
+        self.page_dirty = [None] * 5  # Флаги знакомест, если в окне экранный банк
+        # Таблицы задержек спорного доступа для окон (таблица нулей для неспорных банков).
+        # Используются только процессором с включенной задержкой (Z80.set_contention).
+        self.page_delay = [None] * 5
+        self.timing = ULA_TIMINGS[self.machine['timing']]  # Длительность кадра и строк (ULA)
+        if self.machine['contention']:
+            self.delay_table = build_delay_table(self.timing)
+            self.no_delay = bytes(len(self.delay_table))
+            self.contended_banks = self.timing['contended_banks']
+            self.contention_frame = self.timing['frame_tstates']
+        else:
+            self.delay_table = None
+        self.paged_banks = [~0, 5, 2, 0]
         self.reset()
         self.temp_files = []
 
     def reset(self):
-        self.memory = [bytearray(16 * 1024) for _ in range(8)]  # 8 банков по 16KB
-        self.current_rom = 0
-        self.paged_banks = [0, 5, 2, 0]  # Начальная конфигурация банков
+        base_size = BASE_BANKS * BANK_SIZE
+        self.store[:base_size] = bytes(base_size)  # ОЗУ обнуляется, ПЗУ сохраняется
+        self.memory[BASE_BANKS:] = [None] * (self.bank_count - BASE_BANKS)
+        self.paging_locked = False
+        self.set_paging(0)
+        self.invalidate_code()
+        self.mark_screen_dirty()
+
+    def set_paging(self, port_7ffd, port_1ffd=0):
+        """
+        Подключает банки по значениям портов 7FFD и 1FFD (Scorpion).
+        Бит 3 порта 7FFD выбирает показываемый экран (банк 5 или 7), окно 4000-7FFF
+        всегда занимает банк 5.
+
+        :param port_7ffd: значение порта 7FFD
+        :param port_1ffd: значение порта 1FFD
+        """
+        self.port_7ffd = port_7ffd
+        self.port_1ffd = port_1ffd
+        self.current_rom = 2 if port_1ffd & 0x02 else (port_7ffd >> 4) & 0x01
+        self.screen_bank = 7 if port_7ffd & 0x08 else 5
+        self.paged_banks[:] = [0 if port_1ffd & 0x01 else ~self.current_rom, 5, 2,
+                               self.bank_7ffd[port_7ffd] | ((port_1ffd & 0x10) >> 1)]
+        self.update_pages()
+
+    def write_port_7ffd(self, value):
+        """
+        Запись в порт 7FFD. После установки бита блокировки порт не меняется до сброса.
+
+        :param value: записанное значение
+        """
+        if self.paging_locked:
+            return
+        self.paging_locked = bool(value & self.machine['lock'])
+        self.set_paging(value, self.port_1ffd)
+
+    def write_port_1ffd(self, value):
+        """
+        Запись в порт 1FFD (Scorpion).
+
+        :param value: записанное значение
+        """
+        self.set_paging(self.port_7ffd, value)
+
+    def ram_bank(self, bank):
+        """
+        Возвращает окно банка ОЗУ, выделяя память дополнительного банка при первом обращении.
+
+        :param bank: номер банка ОЗУ
+        """
+        window = self.memory[bank]
+        if window is None:
+            window = self.memory[bank] = memoryview(bytearray(BANK_SIZE))
+        return window
+
+    def update_pages(self):
+        """
+        Перестраивает таблицу страниц по paged_banks.
+        Вызывается только при смене конфигурации (запись в порты 7FFD/1FFD, сброс, загрузка снапшота).
+        """
+        banks = self.paged_banks + self.paged_banks[:1]
+        self.pages[:] = [self.rom[~bank] if bank < 0 else self.ram_bank(bank) for bank in banks]
+        self.page_writable[:] = [bank >= 0 for bank in banks]
+        self.page_code[:] = [self.code_pages[bank] if bank >= 0 else None for bank in banks]
+        self.page_dirty[:] = [self.screen_dirty.get(bank) for bank in banks]
+        if self.delay_table is not None:
+            self.page_delay[:] = [self.delay_table if bank in self.contended_banks else self.no_delay for bank in banks]
+
+    def mark_screen_dirty(self, bank=None):
+        """
+        Помечает весь экран как измененный (загрузка снапшота, сброс, смена палитры).
+
+        :param bank: экранный банк (5 или 7), None - оба
+        """
+        for number, dirty in self.screen_dirty.items():
+            if bank is None or bank == number:
+                dirty[:] = b'\x01' * len(dirty)
+
+    def take_screen_dirty(self, bank):
+        """
+        Возвращает флаги измененных с прошлого вызова знакомест и сбрасывает их.
+        Отрисовка (Framebuffer.render_changed) вызывает раз в кадр и перерисовывает
+        только помеченные знакоместа.
+
+        :param bank: экранный банк (5 или 7)
+        :return: bytes из 768 флагов, индекс - строка знакомест * 32 + столбец
+        """
+        dirty = self.screen_dirty[bank]
+        flags = bytes(dirty)
+        dirty[:] = bytes(len(dirty))
+        return flags
+
+    def update_screen_bank(self, bank, data):
+        """
+        Копирует содержимое экранного банка на месте и помечает только знакоместа,
+        байты которых изменились (кадр из процесса worker, см. worker.SharedFrame).
+
+        :param bank: экранный банк (5 или 7)
+        :param data: 16384 байта банка
+        """
+        window = self.memory[bank]
+        old = window[:SCREEN_SIZE].tobytes()
+        new = bytes(data[:SCREEN_SIZE])
+        if old != new:
+            dirty = self.screen_dirty[bank]
+            # Сначала сравниваются строки экрана по 32 байта, побайтно - только изменившиеся
+            for line in range(0, SCREEN_SIZE, 32):
+                if old[line:line + 32] != new[line:line + 32]:
+                    for offset in range(line, line + 32):
+                        if old[offset] != new[offset]:
+                            dirty[SCREEN_CELLS[offset]] = 1
+        window[:] = data
+
+    def load_bank(self, bank, data):
+        """
+        Копирует данные в банк ОЗУ на месте. Короткий блок дополняется нулями,
+        лишние байты отбрасываются.
+
+        :param bank: номер банка ОЗУ
+        :param data: содержимое банка
+        """
+        window = self.ram_bank(bank)
+        size = min(len(data), BANK_SIZE)
+        window[:size] = data[:size]
+        window[size:] = bytes(BANK_SIZE - size)
+        if bank in self.screen_dirty:
+            self.mark_screen_dirty(bank)
 
     def load_rom(self, file_path, rom_number):
         with open(file_path, 'rb') as f:
             rom_data = f.read(16 * 1024)
             self.rom[rom_number][:len(rom_data)] = rom_data
+        self.invalidate_code()
 
     def load_rom128(self, file_path):
         with open(file_path, 'rb') as f:
@@ -28,6 +229,12 @@ class Memory:
             rom_48_data = f.read(16 * 1024)
             self.rom[1][:len(rom_48_data)] = rom_48_data
 
+            # Остальные банки ПЗУ модели (Scorpion: ПЗУ 2 и 3)
+            for rom_number in range(2, len(self.rom)):
+                rom_data = f.read(16 * 1024)
+                self.rom[rom_number][:len(rom_data)] = rom_data
+
+        self.invalidate_code()
         print(f"ROM 128K loaded: {len(rom_128_data)} bytes")
         print(f"ROM 48K loaded: {len(rom_48_data)} bytes")
 
@@ -38,18 +245,120 @@ class Memory:
         self.write(address, value)
 
     def read(self, address):
-        offset = address % 16384
-        if address < 16384:
-            return self.rom[self.current_rom][offset]
-        bank = self.get_bank(address)
-        return self.memory[bank][offset]
+        return self.pages[address >> 14][address & 0x3FFF]
 
     def write(self, address, value):
-        if address >= 16384:  # Запрещаем запись в ROM
-        #if address >= 0:  # Запрещаем запись в ROM
-            bank = self.get_bank(address)
+        slot = address >> 14
+        if self.page_writable[slot]:  # Запись в ROM игнорируется
+            offset = address & 0x3FFF
+            self.pages[slot][offset] = value
+            if self.page_code[slot][offset >> 8]:
+                self.invalidate_code(self.paged_banks[slot], offset >> 8)
+            if offset < SCREEN_SIZE:
+                dirty = self.page_dirty[slot]
+                if dirty is not None:
+                    dirty[SCREEN_CELLS[offset]] = 1
+
+    def read_block(self, address, length):
+        """
+        Читает непрерывный участок памяти срезами банков.
+
+        :param address: начальный адрес (после 0xFFFF чтение продолжается с 0x0000)
+        :param length: число байт
+        :return: bytearray с данными
+        """
+        result = bytearray()
+        while length > 0:
             offset = address % 16384
-            self.memory[bank][offset] = value
+            chunk = min(length, 16384 - offset)
+            result += self.pages[address >> 14][offset:offset + chunk]
+            address = (address + chunk) & 0xFFFF
+            length -= chunk
+        return result
+
+    def write_block(self, address, data):
+        """
+        Записывает непрерывный участок памяти срезами банков.
+        Запись в ПЗУ игнорируется, как и в write().
+
+        :param address: начальный адрес (после 0xFFFF запись продолжается с 0x0000)
+        :param data: байты для записи
+        """
+        position = 0
+        length = len(data)
+        while position < length:
+            offset = address % 16384
+            chunk = min(length - position, 16384 - offset)
+            if self.page_writable[address >> 14]:
+                bank = self.get_bank(address)
+                self.pages[address >> 14][offset:offset + chunk] = data[position:position + chunk]
+                flags = self.code_pages[bank]
+                for page in range(offset >> 8, ((offset + chunk - 1) >> 8) + 1):
+                    if flags[page]:
+                        self.invalidate_code(bank, page)
+                dirty = self.screen_dirty.get(bank)
+                if dirty is not None and offset < SCREEN_SIZE:
+                    for cell in SCREEN_CELLS[offset:offset + chunk]:
+                        dirty[cell] = 1
+            address = (address + chunk) & 0xFFFF
+            position += chunk
+
+    def copy_block(self, source, destination, length, step=1):
+        """
+        Копирует участок памяти так же, как LDIR (step=1) или LDDR (step=-1):
+        побайтно, поэтому при перекрытии приемника с источником байты повторяются
+        с периодом, равным расстоянию между ними (заливка LD (HL),n / LDIR).
+
+        :param source: адрес источника (HL)
+        :param destination: адрес приемника (DE)
+        :param length: число байт (BC)
+        :param step: 1 - по возрастанию адресов, -1 - по убыванию
+        :return: последний скопированный байт
+        """
+        low = destination if step > 0 else (destination - length + 1) & 0xFFFF
+        distance = ((destination - source) * step) & 0xFFFF
+        if 0 < distance < length and (low < 16384 or low + length > 0x10000):
+            # Приемник задевает ПЗУ: повторно читаемые байты могут не записаться, копируем побайтно
+            for _ in range(length):
+                value = self.read(source)
+                self.write(destination, value)
+                source = (source + step) & 0xFFFF
+                destination = (destination + step) & 0xFFFF
+            return value
+
+        if step > 0:
+            data = self.read_block(source, length)
+        else:
+            data = self.read_block((source - length + 1) & 0xFFFF, length)[::-1]
+        if 0 < distance < length:
+            data = (data[:distance] * (length // distance + 1))[:length]
+        self.write_block(low, data if step > 0 else data[::-1])
+        return data[-1]
+
+    def mark_code(self, bank, page):
+        """
+        Помечает страницу ОЗУ как содержащую транслированный код.
+
+        :param bank: номер банка ОЗУ
+        :param page: номер 256-байтной страницы внутри банка
+        """
+        self.code_pages[bank][page] = 1
+
+    def invalidate_code(self, bank=None, page=None):
+        """
+        Сообщает подписчикам, что код в странице изменился.
+        Без аргументов - сброс всего кода (перезагрузка ПЗУ, снапшота, сброс).
+
+        :param bank: номер банка ОЗУ
+        :param page: номер 256-байтной страницы внутри банка
+        """
+        if bank is None:
+            for flags in self.code_pages:
+                flags[:] = bytes(len(flags))
+        else:
+            self.code_pages[bank][page] = 0
+        for listener in self.code_listeners:
+            listener(bank, page)
 
     def get_bank(self, address):
         if address < 16384:
@@ -62,24 +371,29 @@ class Memory:
             return self.paged_banks[3]
 
     def get_memory_dump(self, start_address, length):
-        result = bytearray()
-        for i in range(length):
-            result.append(self.read(start_address + i))
-        return result
+        return self.read_block(start_address & 0xFFFF, length)
+
+    def memory_dump_lines(self, start_address, num_words):
+        """
+        Строки панели отладки с дампом памяти (debug_panel.DebugPanel).
+
+        :param start_address: начальный адрес
+        :param num_words: число слов
+        :return: строка на каждое слово: адрес, слово и символы его байтов
+        """
+        memory_dump = self.get_memory_dump(start_address, num_words * 2)
+        characters = const.spectrum_characters
+        return [f"{(start_address + i) & 0xFFFF:04X}: {memory_dump[i] | (memory_dump[i + 1] << 8):04X} "
+                f"{characters[memory_dump[i]]} {characters[memory_dump[i + 1]]}"
+                for i in range(0, num_words * 2, 2)]
 
     def display_memory_dump(self, start_address, num_words, screen, font, offset):
-        word_size = 2
-        dump_size = num_words * word_size
-
-        memory_dump = self.get_memory_dump(start_address, dump_size)
-
         x, y = 10, offset
-        for i in range(0, dump_size, word_size):
+        for line in self.memory_dump_lines(start_address, num_words):
             if x > 300:
                 x = 10
                 y += 20
-            word = (memory_dump[i + 1] << 8) | memory_dump[i]
-            text = font.render(f"{start_address + i:04X}: {word:04X} {const.spectrum_characters[memory_dump[i]]} {const.spectrum_characters[memory_dump[i+1]]}", True, (255, 255, 255))
+            text = font.render(line, True, (255, 255, 255))
             screen.blit(text, (x, y))
             x += 210
 
@@ -93,7 +407,7 @@ class Memory:
              iff1, r, af, sp, im, border) = struct.unpack('<B H H H H H H H H H B B H H B B', header)
 
             # Установка регистров CPU
-            cpu.registers['I'] = i
+            cpu.set_register('I', i)
             cpu.set_register_pair('HL_', hl_)
             cpu.set_register_pair('DE_', de_)
             cpu.set_register_pair('BC_', bc_)
@@ -104,23 +418,17 @@ class Memory:
             cpu.set_register_pair('IY', iy)
             cpu.set_register_pair('IX', ix)
             cpu.iff1 = cpu.iff2 = bool(iff1 & 0x04)
-            cpu.registers['R'] = r
+            cpu.set_register('R', r)
             cpu.set_register_pair('AF', af)
             cpu.set_register_pair('SP', sp)
             cpu.interrupt_mode = im
 
-            # Чтение 48KB памяти
-            memory_data = file.read(48 * 1024)
-            memory_data = bytearray(memory_data)
-
-            # Загрузка памяти в соответствующие банки
-            self.memory[5] = memory_data[:16384]  # Bank 5 (16384-32767)
-            self.memory[2] = memory_data[16384:32768]  # Bank 2 (32768-49151)
-            self.memory[0] = memory_data[32768:]  # Bank 0 (49152-65535)
+            # Чтение 48KB памяти прямо в банки 5 (16384-32767), 2 (32768-49151), 0 (49152-65535)
+            for bank in (5, 2, 0):
+                self.load_bank(bank, file.read(16384))
 
             # Установка начальной конфигурации банков памяти
-            self.paged_banks = [0, 5, 2, 0]
-            self.current_rom = 0  # SNA всегда загружается в режиме 48K
+            self.set_paging(0)  # SNA всегда загружается в режиме 48K: ПЗУ 0, банки 5, 2, 0
 
             # Восстановление PC из стека
             pc_low = self.read(sp)
@@ -130,6 +438,7 @@ class Memory:
 
             # Корректировка SP
             cpu.set_register_pair('SP', sp + 2)
+            self.invalidate_code()
 
             print("SNA snapshot loaded successfully.")
             print("Registers after loading snapshot:")
@@ -209,8 +518,8 @@ class Memory:
             cpu.set_register_pair('HL', hl)
             cpu.set_register_pair('PC', pc)
             cpu.set_register_pair('SP', sp)
-            cpu.registers['I'] = i
-            cpu.registers['R'] = r
+            cpu.set_register('I', i)
+            cpu.set_register('R', r)
             cpu.iff1 = bool(iff1)
             cpu.iff2 = bool(iff2)
             cpu.interrupt_mode = im & 3
@@ -220,8 +529,8 @@ class Memory:
             cpu.set_register_pair('DE_', de_)
             cpu.set_register_pair('HL_', hl_)
             #cpu.set_register_pair('AF_', af_)
-            cpu.registers['A_'] = a_
-            cpu.registers['F_'] = f_
+            cpu.set_register('A_', a_)
+            cpu.set_register('F_', f_)
             cpu.set_register_pair('IY', iy)
             cpu.set_register_pair('IX', ix)
             border_color = (flags >> 1) & 0x07
@@ -320,9 +629,9 @@ class Memory:
                 #    memory_data = memory_data[:48 * 1024]
                 #elif len(memory_data) < 48 * 1024:
                 #    memory_data.extend([0] * (48 * 1024 - len(memory_data)))
-                self.memory[5] = memory_data[:16384]  # Bank 5 (16384-32767)
-                self.memory[2] = memory_data[16384:32768]  # Bank 2 (32768-49151)
-                self.memory[0] = memory_data[32768:]  # Bank 0 (49152-65535)
+                self.load_bank(5, memory_data[:16384])  # Bank 5 (16384-32767)
+                self.load_bank(2, memory_data[16384:32768])  # Bank 2 (32768-49151)
+                self.load_bank(0, memory_data[32768:])  # Bank 0 (49152-65535)
             else:
                 while True:
                     block_header = file.read(3)
@@ -358,11 +667,11 @@ class Memory:
 
 
                     if load48k:
-                        if page == 4:   self.memory[5] = block_data[:16384]
-                        elif page == 5: self.memory[2] = block_data[:16384]
-                        elif page == 8: self.memory[0] = block_data[:16384]
+                        if page == 4:   self.load_bank(5, block_data)
+                        elif page == 5: self.load_bank(2, block_data)
+                        elif page == 8: self.load_bank(0, block_data)
                     else:
-                        self.memory[page-3] = block_data[:16384]
+                        self.load_bank(page - 3, block_data)
 
 
                     #if page <= 7:
@@ -376,6 +685,9 @@ class Memory:
 
                     print(f"Loaded block: Page={page}, Size={len(block_data)}")
 
+            self.update_pages()
+            self.invalidate_code()
+
             #Цвет бордюра
             # Установка начальной конфигурации банков памяти
             cpu.io_controller.write_port(0xFE, border_color)
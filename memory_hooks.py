@@ -0,0 +1,147 @@
+# memory_hooks.py
+# Перехват обращений процессора к памяти: отладка, поиск читов, эмуляция устройств
+
+
+class MemoryHook:
+    """
+    Перехватчик обращений к диапазону адресов.
+
+    callback(address, value) вызывается после чтения (value - прочитанный байт;
+    если вернуть число, процессор получит его вместо байта из памяти)
+    или перед записью (value - записываемый байт, результат не используется).
+    """
+    def __init__(self, kind, callback, start, end, bank):
+        self.kind = kind          # 'read' или 'write'
+        self.callback = callback
+        self.start = start        # Диапазон адресов start..end включительно
+        self.end = end
+        self.bank = bank          # Банк, который должен быть подключен по адресу, или None
+
+    def matches(self, memory, address):
+        if not self.start <= address <= self.end:
+            return False
+        return self.bank is None or self.bank == memory.paged_banks[address >> 14]
+
+
+class MemoryHooks:
+    """
+    Реестр перехватчиков памяти процессора.
+
+    Пока перехватчиков нет, процессор работает с прямыми методами Memory и реестр
+    ничего не стоит. Установка первого перехватчика подменяет read_byte/write_byte
+    (через них же работают транслированные блоки) и read_block/copy_block блочных
+    команд на версии с проверкой; удаление последнего возвращает прямые методы.
+    Выборка кода команд идет через таблицу страниц и не перехватывается.
+    """
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self.memory = cpu.memory
+        self.read_hooks = []
+        self.write_hooks = []
+        # Карты адресов с перехватчиками: быстрый отсев остальных обращений
+        self.read_map = bytearray(0x10000)
+        self.write_map = bytearray(0x10000)
+        self.active = False
+
+    def add_read_hook(self, callback, start, end=None, bank=None):
+        """
+        Устанавливает перехватчик чтения.
+
+        :param callback: функция (address, value) -> None или подменное значение
+        :param start: начальный адрес диапазона
+        :param end: конечный адрес диапазона включительно (по умолчанию start)
+        :param bank: номер банка ОЗУ (~номер ПЗУ для 0000-3FFF), который должен быть
+                     подключен по адресу; None - любой
+        :return: объект перехватчика для remove()
+        """
+        return self._add('read', callback, start, end, bank)
+
+    def add_write_hook(self, callback, start, end=None, bank=None):
+        """
+        Устанавливает перехватчик записи. Параметры - как у add_read_hook,
+        результат callback не используется.
+        """
+        return self._add('write', callback, start, end, bank)
+
+    def remove(self, hook):
+        """
+        Удаляет перехватчик.
+
+        :param hook: объект, возвращенный add_read_hook/add_write_hook
+        """
+        hooks = self.read_hooks if hook.kind == 'read' else self.write_hooks
+        hooks.remove(hook)
+        self._rebuild()
+
+    def clear(self):
+        """Удаляет все перехватчики."""
+        self.read_hooks.clear()
+        self.write_hooks.clear()
+        self._rebuild()
+
+    def _add(self, kind, callback, start, end, bank):
+        end = start if end is None else end
+        if not 0 <= start <= end <= 0xFFFF:
+            raise ValueError(f"Неверный диапазон адресов {start:#06x}-{end:#06x}")
+        hook = MemoryHook(kind, callback, start, end, bank)
+        (self.read_hooks if kind == 'read' else self.write_hooks).append(hook)
+        self._rebuild()
+        return hook
+
+    def _rebuild(self):
+        """Перестраивает карты адресов и подключает к процессору нужные методы доступа."""
+        for hooks, address_map in ((self.read_hooks, self.read_map), (self.write_hooks, self.write_map)):
+            address_map[:] = bytes(0x10000)
+            for hook in hooks:
+                address_map[hook.start:hook.end + 1] = b'\x01' * (hook.end - hook.start + 1)
+        self.active = bool(self.read_hooks or self.write_hooks)
+        self.refresh()
+
+    def refresh(self):
+        """Подключает к процессору методы доступа: с перехватом или базовые (cpu.base_read/base_write)."""
+        cpu = self.cpu
+        memory = self.memory
+        if self.active:
+            cpu.read_byte = self.read
+            cpu.write_byte = self.write
+            cpu.read_block = self.read_block
+            cpu.copy_block = self.copy_block
+        else:
+            cpu.read_byte = cpu.base_read
+            cpu.write_byte = cpu.base_write
+            cpu.read_block = memory.read_block
+            cpu.copy_block = memory.copy_block
+
+    def read(self, address):
+        value = self.cpu.base_read(address)
+        address &= 0xFFFF
+        if self.read_map[address]:
+            for hook in self.read_hooks:
+                if hook.matches(self.memory, address):
+                    result = hook.callback(address, value)
+                    if result is not None:
+                        value = result & 0xFF
+        return value
+
+    def write(self, address, value):
+        if self.write_map[address & 0xFFFF]:
+            for hook in self.write_hooks:
+                if hook.matches(self.memory, address & 0xFFFF):
+                    hook.callback(address & 0xFFFF, value)
+        self.cpu.base_write(address, value)
+
+    def read_block(self, address, length):
+        """Как Memory.read_block, но побайтно через перехватчики."""
+        read = self.read
+        return bytearray(read((address + i) & 0xFFFF) for i in range(length))
+
+    def copy_block(self, source, destination, length, step=1):
+        """Как Memory.copy_block, но побайтно через перехватчики."""
+        read = self.read
+        write = self.write
+        for _ in range(length):
+            value = read(source)
+            write(destination, value)
+            source = (source + step) & 0xFFFF
+            destination = (destination + step) & 0xFFFF
+        return value
@@ -1,257 +1,553 @@
+from base_cpu import REG_INDEX, PAIR_INDEX, REG_A, REG_H, REG_L, REG_SP, REG_PC, REG_I, REG_R
 from ext_cpu import extCPUClass
+from block_translator import BlockTranslator
+from idle_detector import IdleLoopDetector
+from memory_hooks import MemoryHooks
+from contention import contended_accessors, contended_fetchers
+from z80_timings import MAIN_TSTATES, M1_TSTATES
 from z80_asm import z80_to_asm
 import logging
 
+def _nop(cpu):
+    pass
+
+
+def _build_main_table():
+    """
+    Строит таблицу основных (беспрефиксных) команд.
+    Таблица - список из 256 функций, принимающих процессор; строится один раз для класса.
+    """
+    def ld_r_r(r1, r2):
+        i1, i2 = REG_INDEX[r1], REG_INDEX[r2]
+        def op(cpu):
+            regs = cpu.regs
+            regs[i1] = regs[i2]
+        return op
+
+    def ld_r_n(r):
+        i = REG_INDEX[r]
+        def op(cpu):
+            cpu.regs[i] = cpu.fetch()
+        return op
+
+    def ld_r_hl(r):
+        i = REG_INDEX[r]
+        def op(cpu):
+            regs = cpu.regs
+            regs[i] = cpu.read_byte((regs[REG_H] << 8) | regs[REG_L])
+        return op
+
+    def ld_hl_r(r):
+        i = REG_INDEX[r]
+        def op(cpu):
+            regs = cpu.regs
+            cpu.store_memory((regs[REG_H] << 8) | regs[REG_L], regs[i])
+        return op
+
+    def ld_a_rr(rr):
+        high, low = PAIR_INDEX[rr]
+        return lambda cpu: cpu.load_register(REG_A, cpu.read_byte((cpu.regs[high] << 8) | cpu.regs[low]))
+
+    def ld_rr_a(rr):
+        high, low = PAIR_INDEX[rr]
+        def op(cpu):
+            regs = cpu.regs
+            cpu.store_memory((regs[high] << 8) | regs[low], regs[REG_A])
+        return op
+
+    def add_a_r(r):
+        i = REG_INDEX[r]
+        return lambda cpu: cpu.add(cpu.regs[i])
+
+    def adc_a_r(r):
+        i = REG_INDEX[r]
+        return lambda cpu: cpu.adc(cpu.regs[i])
+
+    def sub_r(r):
+        i = REG_INDEX[r]
+        return lambda cpu: cpu.sub(cpu.regs[i])
+
+    def sbc_a_r(r):
+        i = REG_INDEX[r]
+        return lambda cpu: cpu.sbc(cpu.regs[i])
+
+    def and_r(r):
+        i = REG_INDEX[r]
+        return lambda cpu: cpu.and_a(cpu.regs[i])
+
+    def xor_r(r):
+        i = REG_INDEX[r]
+        return lambda cpu: cpu.xor_a(cpu.regs[i])
+
+    def or_r(r):
+        i = REG_INDEX[r]
+        return lambda cpu: cpu.or_a(cpu.regs[i])
+
+    def cp_r(r):
+        i = REG_INDEX[r]
+        return lambda cpu: cpu.cp(cpu.regs[i])
+
+    def inc_r(r):
+        i = REG_INDEX[r]
+        return lambda cpu: cpu.inc_register(i)
+
+    def dec_r(r):
+        i = REG_INDEX[r]
+        return lambda cpu: cpu.dec_register(i)
+
+    def add_hl_rr(rr):
+        return lambda cpu: cpu.add_hl(rr)
+
+    def inc_rr(rr):
+        if rr == 'SP':
+            def op(cpu):
+                cpu.regs[REG_SP] = (cpu.regs[REG_SP] + 1) & 0xFFFF
+            return op
+        high, low = PAIR_INDEX[rr]
+        def op(cpu):
+            regs = cpu.regs
+            value = regs[low] + 1
+            regs[low] = value & 0xFF
+            if value > 0xFF:
+                regs[high] = (regs[high] + 1) & 0xFF
+        return op
+
+    def dec_rr(rr):
+        if rr == 'SP':
+            def op(cpu):
+                cpu.regs[REG_SP] = (cpu.regs[REG_SP] - 1) & 0xFFFF
+            return op
+        high, low = PAIR_INDEX[rr]
+        def op(cpu):
+            regs = cpu.regs
+            value = regs[low] - 1
+            regs[low] = value & 0xFF
+            if value < 0:
+                regs[high] = (regs[high] - 1) & 0xFF
+        return op
+
+    instructions = {
+        # 8-bit load group
+        0x40: ld_r_r('B', 'B'), 0x41: ld_r_r('B', 'C'), 0x42: ld_r_r('B', 'D'), 0x43: ld_r_r('B', 'E'),
+        0x44: ld_r_r('B', 'H'), 0x45: ld_r_r('B', 'L'), 0x46: ld_r_hl('B'), 0x47: ld_r_r('B', 'A'),
+        0x48: ld_r_r('C', 'B'), 0x49: ld_r_r('C', 'C'), 0x4A: ld_r_r('C', 'D'), 0x4B: ld_r_r('C', 'E'),
+        0x4C: ld_r_r('C', 'H'), 0x4D: ld_r_r('C', 'L'), 0x4E: ld_r_hl('C'), 0x4F: ld_r_r('C', 'A'),
+        0x50: ld_r_r('D', 'B'), 0x51: ld_r_r('D', 'C'), 0x52: ld_r_r('D', 'D'), 0x53: ld_r_r('D', 'E'),
+        0x54: ld_r_r('D', 'H'), 0x55: ld_r_r('D', 'L'), 0x56: ld_r_hl('D'), 0x57: ld_r_r('D', 'A'),
+        0x58: ld_r_r('E', 'B'), 0x59: ld_r_r('E', 'C'), 0x5A: ld_r_r('E', 'D'), 0x5B: ld_r_r('E', 'E'),
+        0x5C: ld_r_r('E', 'H'), 0x5D: ld_r_r('E', 'L'), 0x5E: ld_r_hl('E'), 0x5F: ld_r_r('E', 'A'),
+        0x60: ld_r_r('H', 'B'), 0x61: ld_r_r('H', 'C'), 0x62: ld_r_r('H', 'D'), 0x63: ld_r_r('H', 'E'),
+        0x64: ld_r_r('H', 'H'), 0x65: ld_r_r('H', 'L'), 0x66: ld_r_hl('H'), 0x67: ld_r_r('H', 'A'),
+        0x68: ld_r_r('L', 'B'), 0x69: ld_r_r('L', 'C'), 0x6A: ld_r_r('L', 'D'), 0x6B: ld_r_r('L', 'E'),
+        0x6C: ld_r_r('L', 'H'), 0x6D: ld_r_r('L', 'L'), 0x6E: ld_r_hl('L'), 0x6F: ld_r_r('L', 'A'),
+        0x70: ld_hl_r('B'), 0x71: ld_hl_r('C'), 0x72: ld_hl_r('D'), 0x73: ld_hl_r('E'),
+        0x74: ld_hl_r('H'), 0x75: ld_hl_r('L'), 0x77: ld_hl_r('A'),
+        0x78: ld_r_r('A', 'B'), 0x79: ld_r_r('A', 'C'), 0x7A: ld_r_r('A', 'D'), 0x7B: ld_r_r('A', 'E'),
+        0x7C: ld_r_r('A', 'H'), 0x7D: ld_r_r('A', 'L'), 0x7E: ld_r_hl('A'), 0x7F: ld_r_r('A', 'A'),
+        0x06: ld_r_n('B'), 0x0E: ld_r_n('C'), 0x16: ld_r_n('D'), 0x1E: ld_r_n('E'),
+        0x26: ld_r_n('H'), 0x2E: ld_r_n('L'), 0x36: lambda cpu: cpu.store_memory((cpu.regs[REG_H] << 8) | cpu.regs[REG_L], cpu.fetch()),
+        0x3E: ld_r_n('A'),
+        0x0A: ld_a_rr('BC'), 0x1A: ld_a_rr('DE'), 0x3A: lambda cpu: cpu.load_register(REG_A, cpu.read_byte(cpu.fetch_word())),
+        0x02: ld_rr_a('BC'), 0x12: ld_rr_a('DE'), 0x32: lambda cpu: cpu.store_memory(cpu.fetch_word(), cpu.regs[REG_A]),
+
+        # 16-bit load group
+        0x01: lambda cpu: cpu.load_register_pair('BC', cpu.fetch_word()),
+        0x11: lambda cpu: cpu.load_register_pair('DE', cpu.fetch_word()),
+        0x21: lambda cpu: cpu.load_register_pair('HL', cpu.fetch_word()),
+        0x31: lambda cpu: cpu.load_register_pair('SP', cpu.fetch_word()),
+        0x2A: lambda cpu: cpu.load_register_pair('HL', cpu.load_word(cpu.fetch_word())),
+        0x22: lambda cpu: cpu.store_word(cpu.fetch_word(), (cpu.regs[REG_H] << 8) | cpu.regs[REG_L]),
+        0xF9: lambda cpu: cpu.load_register_pair('SP', (cpu.regs[REG_H] << 8) | cpu.regs[REG_L]),
+        0xC5: lambda cpu: cpu.push('BC'), 0xD5: lambda cpu: cpu.push('DE'),
+        0xE5: lambda cpu: cpu.push('HL'), 0xF5: lambda cpu: cpu.push('AF'),
+        0xC1: lambda cpu: cpu.pop('BC'), 0xD1: lambda cpu: cpu.pop('DE'),
+        0xE1: lambda cpu: cpu.pop('HL'), 0xF1: lambda cpu: cpu.pop('AF'),
+
+        # Exchange, Block Transfer, and Search Group
+        0xEB: lambda cpu: cpu.exchange_de_hl(),
+        0x08: lambda cpu: cpu.exchange_af(),
+        0xD9: lambda cpu: cpu.exx(),
+        0xE3: lambda cpu: cpu.exchange_sp_hl(),
+
+        # 8-bit arithmetic group
+        0x80: add_a_r('B'), 0x81: add_a_r('C'), 0x82: add_a_r('D'), 0x83: add_a_r('E'),
+        0x84: add_a_r('H'), 0x85: add_a_r('L'), 0x86: lambda cpu: cpu.add(cpu.read_byte((cpu.regs[REG_H] << 8) | cpu.regs[REG_L])),
+        0x87: add_a_r('A'), 0xC6: lambda cpu: cpu.add(cpu.fetch()),
+        0x88: adc_a_r('B'), 0x89: adc_a_r('C'), 0x8A: adc_a_r('D'), 0x8B: adc_a_r('E'),
+        0x8C: adc_a_r('H'), 0x8D: adc_a_r('L'), 0x8E: lambda cpu: cpu.adc(cpu.read_byte((cpu.regs[REG_H] << 8) | cpu.regs[REG_L])),
+        0x8F: adc_a_r('A'), 0xCE: lambda cpu: cpu.adc(cpu.fetch()),
+        0x90: sub_r('B'), 0x91: sub_r('C'), 0x92: sub_r('D'), 0x93: sub_r('E'),
+        0x94: sub_r('H'), 0x95: sub_r('L'), 0x96: lambda cpu: cpu.sub(cpu.read_byte((cpu.regs[REG_H] << 8) | cpu.regs[REG_L])),
+        0x97: sub_r('A'), 0xD6: lambda cpu: cpu.sub(cpu.fetch()),
+        0x98: sbc_a_r('B'), 0x99: sbc_a_r('C'), 0x9A: sbc_a_r('D'), 0x9B: sbc_a_r('E'),
+        0x9C: sbc_a_r('H'), 0x9D: sbc_a_r('L'), 0x9E: lambda cpu: cpu.sbc(cpu.read_byte((cpu.regs[REG_H] << 8) | cpu.regs[REG_L])),
+        0x9F: sbc_a_r('A'), 0xDE: lambda cpu: cpu.sbc(cpu.fetch()),
+        0xA0: and_r('B'), 0xA1: and_r('C'), 0xA2: and_r('D'), 0xA3: and_r('E'),
+        0xA4: and_r('H'), 0xA5: and_r('L'), 0xA6: lambda cpu: cpu.and_a(cpu.read_byte((cpu.regs[REG_H] << 8) | cpu.regs[REG_L])),
+        0xA7: and_r('A'), 0xE6: lambda cpu: cpu.and_a(cpu.fetch()),
+        0xA8: xor_r('B'), 0xA9: xor_r('C'), 0xAA: xor_r('D'), 0xAB: xor_r('E'),
+        0xAC: xor_r('H'), 0xAD: xor_r('L'), 0xAE: lambda cpu: cpu.xor_a(cpu.read_byte((cpu.regs[REG_H] << 8) | cpu.regs[REG_L])),
+        0xAF: xor_r('A'), 0xEE: lambda cpu: cpu.xor_a(cpu.fetch()),
+        0xB0: or_r('B'), 0xB1: or_r('C'), 0xB2: or_r('D'), 0xB3: or_r('E'),
+        0xB4: or_r('H'), 0xB5: or_r('L'), 0xB6: lambda cpu: cpu.or_a(cpu.read_byte((cpu.regs[REG_H] << 8) | cpu.regs[REG_L])),
+        0xB7: or_r('A'), 0xF6: lambda cpu: cpu.or_a(cpu.fetch()),
+        0xB8: cp_r('B'), 0xB9: cp_r('C'), 0xBA: cp_r('D'), 0xBB: cp_r('E'),
+        0xBC: cp_r('H'), 0xBD: cp_r('L'), 0xBE: lambda cpu: cpu.cp(cpu.read_byte((cpu.regs[REG_H] << 8) | cpu.regs[REG_L])),
+        0xBF: cp_r('A'), 0xFE: lambda cpu: cpu.cp(cpu.fetch()),
+        0x04: inc_r('B'), 0x0C: inc_r('C'), 0x14: inc_r('D'), 0x1C: inc_r('E'),
+        0x24: inc_r('H'), 0x2C: inc_r('L'), 0x34: lambda cpu: cpu.inc_memory((cpu.regs[REG_H] << 8) | cpu.regs[REG_L]),
+        0x3C: inc_r('A'),
+        0x05: dec_r('B'), 0x0D: dec_r('C'), 0x15: dec_r('D'), 0x1D: dec_r('E'),
+        0x25: dec_r('H'), 0x2D: dec_r('L'), 0x35: lambda cpu: cpu.dec_memory((cpu.regs[REG_H] << 8) | cpu.regs[REG_L]),
+        0x3D: dec_r('A'),
+
+        # General-purpose arithmetic and CPU control groups
+        0x27: lambda cpu: cpu.daa(),
+        0x2F: lambda cpu: cpu.cpl(),
+        0x3F: lambda cpu: cpu.ccf(),
+        0x37: lambda cpu: cpu.scf(),
+        0x00: _nop,  # NOP
+        0x76: lambda cpu: cpu.halt(),
+        0xF3: lambda cpu: cpu.di(),
+        0xFB: lambda cpu: cpu.ei(),
+
+        # 16-bit arithmetic group
+        0x09: add_hl_rr('BC'), 0x19: add_hl_rr('DE'),
+        0x29: add_hl_rr('HL'), 0x39: add_hl_rr('SP'),
+        0x03: inc_rr('BC'), 0x13: inc_rr('DE'),
+        0x23: inc_rr('HL'), 0x33: inc_rr('SP'),
+        0x0B: dec_rr('BC'), 0x1B: dec_rr('DE'),
+        0x2B: dec_rr('HL'), 0x3B: dec_rr('SP'),
+
+        # Rotate and Shift group
+        0x07: lambda cpu: cpu.rlca(),
+        0x0F: lambda cpu: cpu.rrca(),
+        # Rotate and Shift group (продолжение)
+        0x17: lambda cpu: cpu.rla(),
+        0x1F: lambda cpu: cpu.rra(),
+
+        # Jump group
+        0xC3: lambda cpu: cpu.jp(cpu.fetch_word()),
+        0xC2: lambda cpu: cpu.jp_cc('NZ', cpu.fetch_word()),
+        0xCA: lambda cpu: cpu.jp_cc('Z', cpu.fetch_word()),
+        0xD2: lambda cpu: cpu.jp_cc('NC', cpu.fetch_word()),
+        0xDA: lambda cpu: cpu.jp_cc('C', cpu.fetch_word()),
+
+        0xE2: lambda cpu: cpu.jp_cc('PO', cpu.fetch_word()),  # JP PO, nn
+        0xEA: lambda cpu: cpu.jp_cc('PE', cpu.fetch_word()),  # JP PE, nn
+        0xF2: lambda cpu: cpu.jp_cc('P', cpu.fetch_word()),   # JP P, nn
+        0xFA: lambda cpu: cpu.jp_cc('M', cpu.fetch_word()),   # JP M, nn
+
+        0xE9: lambda cpu: cpu.jp((cpu.regs[REG_H] << 8) | cpu.regs[REG_L]),
+        0x18: lambda cpu: cpu.jr(cpu.fetch_signed()),
+        0x20: lambda cpu: cpu.jr_cc('NZ', cpu.fetch_signed()),
+        0x28: lambda cpu: cpu.jr_cc('Z', cpu.fetch_signed()),
+        0x30: lambda cpu: cpu.jr_cc('NC', cpu.fetch_signed()),
+        0x38: lambda cpu: cpu.jr_cc('C', cpu.fetch_signed()),
+        0x10: lambda cpu: cpu.djnz(cpu.fetch_signed()),
+
+        # Call and Return group
+        0xCD: lambda cpu: cpu.call(cpu.fetch_word()),
+        0xC4: lambda cpu: cpu.call_cc('NZ', cpu.fetch_word()),
+        0xCC: lambda cpu: cpu.call_cc('Z', cpu.fetch_word()),
+        0xD4: lambda cpu: cpu.call_cc('NC', cpu.fetch_word()),
+        0xDC: lambda cpu: cpu.call_cc('C', cpu.fetch_word()),
+
+        0xE4: lambda cpu: cpu.call_cc('PO', cpu.fetch_word()),  # CALL PO, nn
+        0xEC: lambda cpu: cpu.call_cc('PE', cpu.fetch_word()),  # CALL PE, nn
+        0xF4: lambda cpu: cpu.call_cc('P', cpu.fetch_word()),   # CALL P, nn
+        0xFC: lambda cpu: cpu.call_cc('M', cpu.fetch_word()),   # CALL M, nn
+
+        0xC9: lambda cpu: cpu.ret(),
+        0xC0: lambda cpu: cpu.ret_cc('NZ'),
+        0xC8: lambda cpu: cpu.ret_cc('Z'),
+        0xD0: lambda cpu: cpu.ret_cc('NC'),
+        0xD8: lambda cpu: cpu.ret_cc('C'),
+        0xE0: lambda cpu: cpu.ret_cc('PO'),  # RET PO
+        0xE8: lambda cpu: cpu.ret_cc('PE'),  # RET PE
+        0xF0: lambda cpu: cpu.ret_cc('P'),  # RET P
+        0xF8: lambda cpu: cpu.ret_cc('M'),  # RET M
+        0xC7: lambda cpu: cpu.rst(0x00), 0xCF: lambda cpu: cpu.rst(0x08),
+        0xD7: lambda cpu: cpu.rst(0x10), 0xDF: lambda cpu: cpu.rst(0x18),
+        0xE7: lambda cpu: cpu.rst(0x20), 0xEF: lambda cpu: cpu.rst(0x28),
+        0xF7: lambda cpu: cpu.rst(0x30), 0xFF: lambda cpu: cpu.rst(0x38),
+
+        # Input and Output group
+        0xDB: lambda cpu: cpu.in_a_n(),
+        0xD3: lambda cpu: cpu.out_n_a(),
+
+        # Prefix Instructions
+        0xCB: lambda cpu: cpu.execute_cb(),
+        0xDD: lambda cpu: cpu.execute_dd(),
+        0xED: lambda cpu: cpu.execute_ed(),
+        0xFD: lambda cpu: cpu.execute_fd(),
+    }
+
+    table = [_nop] * 256
+    for opcode, handler in instructions.items():
+        table[opcode] = handler
+    return table
+
+
 class Z80(extCPUClass):
+    MAIN_TABLE = _build_main_table()
+
     def __init__(self, memory, io_controller, start_addr=0x0000):
         super().__init__()
-        self.instructions = self.create_instruction_table()
+        self.instructions = self.MAIN_TABLE
 
         # Память на 128KB (банки памяти ZX Spectrum 128)
         #self.memory = [0] * 128 * 1024  # 128KB памяти
         #self.memory = memory.memory
         self.memory = memory
         self.mem_class = memory
+        # Прямой доступ к памяти без __getitem__/__setitem__:
+        # pages - таблица страниц Memory (перестраивается на месте), read/write - связанные методы.
+        # base_read/base_write - доступ без перехватчиков (с задержкой спорной памяти, если
+        # она включена); пока установлены перехватчики, hooks подменяет read_byte/write_byte.
+        self.pages = memory.pages
+        self.base_read = self.read_byte = memory.read
+        self.base_write = self.write_byte = memory.write
+        self.read_block = memory.read_block
+        self.copy_block = memory.copy_block
+        self.hooks = MemoryHooks(self)
         self.io_controller = io_controller
 
+        self.translator = None  # Транслятор базовых блоков (включается set_translation)
+        self.idle_detector = None  # Пропуск холостых циклов (включается set_idle_skip)
+        self.frame_start = 0    # Значение tstates в начале текущего кадра (прерывание)
+        self.contended = False  # Учитываются задержки спорной памяти (включается set_contention)
+        self.frame_end = 0      # Значение tstates, на котором заканчивается текущий кадр
+        # Длительность кадра (50 Гц) по модели: 48K - 69888, 128K - 70908, Pentagon - 71680
+        self.frame_tstates = memory.timing['frame_tstates']
+        self.frames = 0         # Счетчик кадров (как у ULA: от него фаза FLASH)
+
+    def set_translation(self, enabled):
+        """
+        Включает или выключает трансляцию базовых блоков.
+
+        :param enabled: True - выполнять код блоками, False - только интерпретатор
+        """
+        if enabled and self.translator is None:
+            self.translator = BlockTranslator(self)
+        elif not enabled and self.translator is not None:
+            self.memory.code_listeners.remove(self.translator.invalidate)
+            self.memory.invalidate_code()
+            self.translator = None
+
+    def set_idle_skip(self, enabled):
+        """
+        Включает или выключает пропуск холостых циклов ожидания.
+
+        :param enabled: True - обнаруживать и пропускать циклы ожидания
+        """
+        if enabled and self.idle_detector is None:
+            self.idle_detector = IdleLoopDetector(self)
+        elif not enabled:
+            self.idle_detector = None
+
+    def set_contention(self, enabled):
+        """
+        Включает или выключает задержки доступа к спорной памяти.
+        На моделях без спорной памяти (Pentagon, Scorpion) ничего не меняет.
+
+        :param enabled: True - учитывать задержки ULA при выборке команд и обращениях к данным
+        """
+        self.contended = enabled and getattr(self.memory, 'delay_table', None) is not None
+        if self.contended:
+            self.base_read, self.base_write = contended_accessors(self)
+            self.fetch, self.fetch_word, self.fetch_opcode = contended_fetchers(self)
+            self.run_until = self.run_until_contended
+        else:
+            self.base_read, self.base_write = self.memory.read, self.memory.write
+            for name in ('fetch', 'fetch_word', 'fetch_opcode', 'run_until'):
+                self.__dict__.pop(name, None)
+        self.hooks.refresh()
+        if self.translator is not None:
+            # Блоки транслируются по-разному с задержками и без них
+            self.memory.invalidate_code()
+
+    def step(self):
+        """
+        Выполняет следующий базовый блок, если трансляция включена,
+        иначе одну команду.
+        """
+        if self.translator is not None:
+            self.translator.execute()
+        else:
+            self.execute_instruction()
+
+    def run_tstates(self, count):
+        """
+        Выполняет команды, пока не будет израсходовано count T-состояний.
+        Последняя команда (или блок) может выйти за границу на несколько тактов.
+
+        :param count: число T-состояний
+        :return: фактически выполненное число T-состояний
+        """
+        start = self.tstates
+        if self.idle_detector is not None:
+            self.idle_detector.run(start + count)
+        else:
+            self.run_until(start + count)
+        return self.tstates - start
+
+    def run_until(self, deadline):
+        """
+        Выполняет команды, пока счетчик tstates не достигнет deadline.
+
+        :param deadline: значение tstates, до которого нужно выполнить команды
+        """
+        self.deadline = deadline
+        regs = self.regs
+        memory = self.memory
+        translator = self.translator
+
+        if translator is not None:
+            cache = translator.cache
+            translate = translator.translate
+            read, write = self.read_byte, self.write_byte
+            while self.tstates < deadline:
+                if self.halted:
+                    self.skip_halt(deadline)
+                    break
+                pc = regs[REG_PC]
+                key = (memory.paged_banks[pc >> 14], pc)
+                block = cache.get(key)
+                if block is None:
+                    block = translate(key)
+                block(self, regs, read, write)
+        else:
+            pages = self.pages
+            table = self.MAIN_TABLE
+            while self.tstates < deadline:
+                if self.halted:
+                    self.skip_halt(deadline)
+                    break
+                r = regs[REG_R]
+                regs[REG_R] = (r + 1) & 0x7F | (r & 0x80)
+                pc = regs[REG_PC]
+                regs[REG_PC] = (pc + 1) & 0xFFFF
+                opcode = pages[pc >> 14][pc & 0x3FFF]
+                self.tstates += MAIN_TSTATES[opcode]
+                table[opcode](self)
+
+        self.deadline = 0
+
+    def run_until_contended(self, deadline):
+        """
+        run_until с задержками спорной памяти: задержка выборки кода берется одним
+        индексом из таблицы окна по такту начала команды, дальше access_time отсчитывает
+        такты обращений к операндам и данным (fetch, base_read/base_write) от конца M1.
+        Блоки из спорных банков не транслируются (их команды выполняет execute_instruction),
+        блочные команды над спорной памятью идут по одной итерации.
+
+        :param deadline: значение tstates, до которого нужно выполнить команды
+        """
+        self.deadline = deadline
+        regs = self.regs
+        memory = self.memory
+        translator = self.translator
+        delays = memory.page_delay
+        frame = memory.contention_frame
+
+        if translator is not None:
+            cache = translator.cache
+            translate = translator.translate
+            read, write = self.read_byte, self.write_byte
+            while self.tstates < deadline:
+                if self.halted:
+                    self.skip_halt(deadline)
+                    break
+                pc = regs[REG_PC]
+                key = (memory.paged_banks[pc >> 14], pc)
+                block = cache.get(key)
+                if block is None:
+                    block = translate(key)
+                block(self, regs, read, write)
+        else:
+            pages = self.pages
+            table = self.MAIN_TABLE
+            while self.tstates < deadline:
+                if self.halted:
+                    self.skip_halt(deadline)
+                    break
+                r = regs[REG_R]
+                regs[REG_R] = (r + 1) & 0x7F | (r & 0x80)
+                pc = regs[REG_PC]
+                regs[REG_PC] = (pc + 1) & 0xFFFF
+                opcode = pages[pc >> 14][pc & 0x3FFF]
+                t = self.tstates
+                t += delays[pc >> 14][(t - self.frame_start) % frame]
+                self.access_time = t + M1_TSTATES[opcode]
+                self.tstates = t + MAIN_TSTATES[opcode]
+                table[opcode](self)
+
+        self.deadline = 0
+
+    def skip_halt(self, deadline):
+        """
+        HALT: процессор выполняет NOP (4 T-состояния, +1 к R) до прерывания.
+        Вместо выполнения по одному время и R сразу продвигаются до deadline.
+
+        :param deadline: значение tstates, до которого процессор стоит в HALT
+        """
+        count = (deadline - self.tstates + 3) // 4
+        if count > 0:
+            self.tstates += 4 * count
+            regs = self.regs
+            r = regs[REG_R]
+            regs[REG_R] = (r + count) & 0x7F | (r & 0x80)
+
+    def run_frame(self):
+        """
+        Выполняет один кадр: маскируемое прерывание в начале кадра
+        и команды до его конца. Перебег последней команды переносится в следующий кадр.
+
+        :return: фактически выполненное число T-состояний
+        """
+        if not 0 <= self.tstates - self.frame_end < self.frame_tstates:
+            # Счетчик ушел от границы кадров (step(), отладка) - начинаем кадр отсюда
+            self.frame_end = self.tstates
+        self.frame_start = self.frame_end
+        self.frame_end += self.frame_tstates
+        self.frames += 1
+        self.handle_interrupt()
+        return self.run_tstates(self.frame_end - self.tstates)
+
     def execute_instruction(self, debug = False):
-        opcode = self.fetch()
+        regs = self.regs
+        r = regs[REG_R]
+        regs[REG_R] = (r + 1) & 0x7F | (r & 0x80)
+        pc = regs[REG_PC]
+        regs[REG_PC] = (pc + 1) & 0xFFFF
+        opcode = self.pages[pc >> 14][pc & 0x3FFF]
 
         if debug:
             logging.info('#')
-            logging.info(f"{self.registers['PC']-1:04X}: {z80_to_asm[opcode]}")
+            logging.info(f"{self.regs[REG_PC]-1:04X}: {z80_to_asm[opcode]}")
             logging.info(f"opcode: {opcode:02X}")
 
             print('#')
-            print(f"{self.registers['PC']-1:04X}: {z80_to_asm[opcode]}")
+            print(f"{self.regs[REG_PC]-1:04X}: {z80_to_asm[opcode]}")
             print(f"opcode: {opcode:02X}")
 
-        if opcode in self.instructions:
-            self.instructions[opcode]()
+        if self.contended:
+            # Как в run_until_contended: задержка выборки кода и отсчет тактов обращений
+            t = self.tstates
+            t += self.memory.page_delay[pc >> 14][(t - self.frame_start) % self.memory.contention_frame]
+            self.access_time = t + M1_TSTATES[opcode]
+            self.tstates = t + MAIN_TSTATES[opcode]
         else:
-            raise ValueError(f"Unknown opcode: {opcode:02X}")
-
-    def create_instruction_table(self):
-        def ld_r_r(r1, r2):
-            return lambda: self.load_register(r1, self.registers[r2])
-
-        def ld_r_n(r):
-            return lambda: self.load_register(r, self.fetch())
-
-        def ld_r_hl(r):
-            return lambda: self.load_register(r, self.memory[self.get_register_pair('HL')])
-
-        def ld_hl_r(r):
-            return lambda: self.store_memory(self.get_register_pair('HL'), self.registers[r])
-
-        def ld_a_rr(rr):
-            return lambda: self.load_register('A', self.memory[self.get_register_pair(rr)])
-
-        def ld_rr_a(rr):
-            return lambda: self.store_memory(self.get_register_pair(rr), self.registers['A'])
-
-        def add_a_r(r):
-            return lambda: self.add(self.registers[r])
-
-        def adc_a_r(r):
-            return lambda: self.adc(self.registers[r])
-
-        def sub_r(r):
-            return lambda: self.sub(self.registers[r])
-
-        def sbc_a_r(r):
-            return lambda: self.sbc(self.registers[r])
-
-        def and_r(r):
-            return lambda: self.and_a(self.registers[r])
-
-        def xor_r(r):
-            return lambda: self.xor_a(self.registers[r])
-
-        def or_r(r):
-            return lambda: self.or_a(self.registers[r])
-
-        def cp_r(r):
-            return lambda: self.cp(self.registers[r])
-
-        def inc_r(r):
-            return lambda: self.inc_register(r)
-
-        def dec_r(r):
-            return lambda: self.dec_register(r)
-
-        def add_hl_rr(rr):
-            return lambda: self.add_hl(rr)
-
-        def inc_rr(rr):
-            return lambda: self.inc_register_pair(rr)
-
-        def dec_rr(rr):
-            return lambda: self.dec_register_pair(rr)
-
-        return {
-            # 8-bit load group
-            0x40: ld_r_r('B', 'B'), 0x41: ld_r_r('B', 'C'), 0x42: ld_r_r('B', 'D'), 0x43: ld_r_r('B', 'E'),
-            0x44: ld_r_r('B', 'H'), 0x45: ld_r_r('B', 'L'), 0x46: ld_r_hl('B'), 0x47: ld_r_r('B', 'A'),
-            0x48: ld_r_r('C', 'B'), 0x49: ld_r_r('C', 'C'), 0x4A: ld_r_r('C', 'D'), 0x4B: ld_r_r('C', 'E'),
-            0x4C: ld_r_r('C', 'H'), 0x4D: ld_r_r('C', 'L'), 0x4E: ld_r_hl('C'), 0x4F: ld_r_r('C', 'A'),
-            0x50: ld_r_r('D', 'B'), 0x51: ld_r_r('D', 'C'), 0x52: ld_r_r('D', 'D'), 0x53: ld_r_r('D', 'E'),
-            0x54: ld_r_r('D', 'H'), 0x55: ld_r_r('D', 'L'), 0x56: ld_r_hl('D'), 0x57: ld_r_r('D', 'A'),
-            0x58: ld_r_r('E', 'B'), 0x59: ld_r_r('E', 'C'), 0x5A: ld_r_r('E', 'D'), 0x5B: ld_r_r('E', 'E'),
-            0x5C: ld_r_r('E', 'H'), 0x5D: ld_r_r('E', 'L'), 0x5E: ld_r_hl('E'), 0x5F: ld_r_r('E', 'A'),
-            0x60: ld_r_r('H', 'B'), 0x61: ld_r_r('H', 'C'), 0x62: ld_r_r('H', 'D'), 0x63: ld_r_r('H', 'E'),
-            0x64: ld_r_r('H', 'H'), 0x65: ld_r_r('H', 'L'), 0x66: ld_r_hl('H'), 0x67: ld_r_r('H', 'A'),
-            0x68: ld_r_r('L', 'B'), 0x69: ld_r_r('L', 'C'), 0x6A: ld_r_r('L', 'D'), 0x6B: ld_r_r('L', 'E'),
-            0x6C: ld_r_r('L', 'H'), 0x6D: ld_r_r('L', 'L'), 0x6E: ld_r_hl('L'), 0x6F: ld_r_r('L', 'A'),
-            0x70: ld_hl_r('B'), 0x71: ld_hl_r('C'), 0x72: ld_hl_r('D'), 0x73: ld_hl_r('E'),
-            0x74: ld_hl_r('H'), 0x75: ld_hl_r('L'), 0x77: ld_hl_r('A'),
-            0x78: ld_r_r('A', 'B'), 0x79: ld_r_r('A', 'C'), 0x7A: ld_r_r('A', 'D'), 0x7B: ld_r_r('A', 'E'),
-            0x7C: ld_r_r('A', 'H'), 0x7D: ld_r_r('A', 'L'), 0x7E: ld_r_hl('A'), 0x7F: ld_r_r('A', 'A'),
-            0x06: ld_r_n('B'), 0x0E: ld_r_n('C'), 0x16: ld_r_n('D'), 0x1E: ld_r_n('E'),
-            0x26: ld_r_n('H'), 0x2E: ld_r_n('L'), 0x36: lambda: self.store_memory(self.get_register_pair('HL'), self.fetch()),
-            0x3E: ld_r_n('A'),
-            0x0A: ld_a_rr('BC'), 0x1A: ld_a_rr('DE'), 0x3A: lambda: self.load_register('A', self.memory[self.fetch_word()]),
-            0x02: ld_rr_a('BC'), 0x12: ld_rr_a('DE'), 0x32: lambda: self.store_memory(self.fetch_word(), self.registers['A']),
-
-            # 16-bit load group
-            0x01: lambda: self.load_register_pair('BC', self.fetch_word()),
-            0x11: lambda: self.load_register_pair('DE', self.fetch_word()),
-            0x21: lambda: self.load_register_pair('HL', self.fetch_word()),
-            0x31: lambda: self.load_register_pair('SP', self.fetch_word()),
-            0x2A: lambda: self.load_register_pair('HL', self.load_word(self.fetch_word())),
-            0x22: lambda: self.store_word(self.fetch_word(), self.get_register_pair('HL')),
-            0xF9: lambda: self.load_register_pair('SP', self.get_register_pair('HL')),
-            0xC5: lambda: self.push('BC'), 0xD5: lambda: self.push('DE'),
-            0xE5: lambda: self.push('HL'), 0xF5: lambda: self.push('AF'),
-            0xC1: lambda: self.pop('BC'), 0xD1: lambda: self.pop('DE'),
-            0xE1: lambda: self.pop('HL'), 0xF1: lambda: self.pop('AF'),
-
-            # Exchange, Block Transfer, and Search Group
-            0xEB: lambda: self.exchange_de_hl(),
-            0x08: lambda: self.exchange_af(),
-            0xD9: lambda: self.exx(),
-            0xE3: lambda: self.exchange_sp_hl(),
-
-            # 8-bit arithmetic group
-            0x80: add_a_r('B'), 0x81: add_a_r('C'), 0x82: add_a_r('D'), 0x83: add_a_r('E'),
-            0x84: add_a_r('H'), 0x85: add_a_r('L'), 0x86: lambda: self.add(self.memory[self.get_register_pair('HL')]),
-            0x87: add_a_r('A'), 0xC6: lambda: self.add(self.fetch()),
-            0x88: adc_a_r('B'), 0x89: adc_a_r('C'), 0x8A: adc_a_r('D'), 0x8B: adc_a_r('E'),
-            0x8C: adc_a_r('H'), 0x8D: adc_a_r('L'), 0x8E: lambda: self.adc(self.memory[self.get_register_pair('HL')]),
-            0x8F: adc_a_r('A'), 0xCE: lambda: self.adc(self.fetch()),
-            0x90: sub_r('B'), 0x91: sub_r('C'), 0x92: sub_r('D'), 0x93: sub_r('E'),
-            0x94: sub_r('H'), 0x95: sub_r('L'), 0x96: lambda: self.sub(self.memory[self.get_register_pair('HL')]),
-            0x97: sub_r('A'), 0xD6: lambda: self.sub(self.fetch()),
-            0x98: sbc_a_r('B'), 0x99: sbc_a_r('C'), 0x9A: sbc_a_r('D'), 0x9B: sbc_a_r('E'),
-            0x9C: sbc_a_r('H'), 0x9D: sbc_a_r('L'), 0x9E: lambda: self.sbc(self.memory[self.get_register_pair('HL')]),
-            0x9F: sbc_a_r('A'), 0xDE: lambda: self.sbc(self.fetch()),
-            0xA0: and_r('B'), 0xA1: and_r('C'), 0xA2: and_r('D'), 0xA3: and_r('E'),
-            0xA4: and_r('H'), 0xA5: and_r('L'), 0xA6: lambda: self.and_a(self.memory[self.get_register_pair('HL')]),
-            0xA7: and_r('A'), 0xE6: lambda: self.and_a(self.fetch()),
-            0xA8: xor_r('B'), 0xA9: xor_r('C'), 0xAA: xor_r('D'), 0xAB: xor_r('E'),
-            0xAC: xor_r('H'), 0xAD: xor_r('L'), 0xAE: lambda: self.xor_a(self.memory[self.get_register_pair('HL')]),
-            0xAF: xor_r('A'), 0xEE: lambda: self.xor_a(self.fetch()),
-            0xB0: or_r('B'), 0xB1: or_r('C'), 0xB2: or_r('D'), 0xB3: or_r('E'),
-            0xB4: or_r('H'), 0xB5: or_r('L'), 0xB6: lambda: self.or_a(self.memory[self.get_register_pair('HL')]),
-            0xB7: or_r('A'), 0xF6: lambda: self.or_a(self.fetch()),
-            0xB8: cp_r('B'), 0xB9: cp_r('C'), 0xBA: cp_r('D'), 0xBB: cp_r('E'),
-            0xBC: cp_r('H'), 0xBD: cp_r('L'), 0xBE: lambda: self.cp(self.memory[self.get_register_pair('HL')]),
-            0xBF: cp_r('A'), 0xFE: lambda: self.cp(self.fetch()),
-            0x04: inc_r('B'), 0x0C: inc_r('C'), 0x14: inc_r('D'), 0x1C: inc_r('E'),
-            0x24: inc_r('H'), 0x2C: inc_r('L'), 0x34: lambda: self.inc_memory(self.get_register_pair('HL')),
-            0x3C: inc_r('A'),
-            0x05: dec_r('B'), 0x0D: dec_r('C'), 0x15: dec_r('D'), 0x1D: dec_r('E'),
-            0x25: dec_r('H'), 0x2D: dec_r('L'), 0x35: lambda: self.dec_memory(self.get_register_pair('HL')),
-            0x3D: dec_r('A'),
-
-            # General-purpose arithmetic and CPU control groups
-            0x27: lambda: self.daa(),
-            0x2F: lambda: self.cpl(),
-            0x3F: lambda: self.ccf(),
-            0x37: lambda: self.scf(),
-            0x00: lambda: None,  # NOP
-            0x76: lambda: self.halt(),
-            0xF3: lambda: self.di(),
-            0xFB: lambda: self.ei(),
-
-            # 16-bit arithmetic group
-            0x09: add_hl_rr('BC'), 0x19: add_hl_rr('DE'),
-            0x29: add_hl_rr('HL'), 0x39: add_hl_rr('SP'),
-            0x03: inc_rr('BC'), 0x13: inc_rr('DE'),
-            0x23: inc_rr('HL'), 0x33: inc_rr('SP'),
-            0x0B: dec_rr('BC'), 0x1B: dec_rr('DE'),
-            0x2B: dec_rr('HL'), 0x3B: dec_rr('SP'),
-
-            # Rotate and Shift group
-            0x07: lambda: self.rlca(),
-            0x0F: lambda: self.rrca(),
-            # Rotate and Shift group (продолжение)
-            0x17: lambda: self.rla(),
-            0x1F: lambda: self.rra(),
-
-            # Jump group
-            0xC3: lambda: self.jp(self.fetch_word()),
-            0xC2: lambda: self.jp_cc('NZ', self.fetch_word()),
-            0xCA: lambda: self.jp_cc('Z', self.fetch_word()),
-            0xD2: lambda: self.jp_cc('NC', self.fetch_word()),
-            0xDA: lambda: self.jp_cc('C', self.fetch_word()),
-
-            0xE2: lambda: self.jp_cc('PO', self.fetch_word()),  # JP PO, nn
-            0xEA: lambda: self.jp_cc('PE', self.fetch_word()),  # JP PE, nn
-            0xF2: lambda: self.jp_cc('P', self.fetch_word()),   # JP P, nn
-            0xFA: lambda: self.jp_cc('M', self.fetch_word()),   # JP M, nn
-
-            0xE9: lambda: self.jp(self.get_register_pair('HL')),
-            0x18: lambda: self.jr(self.fetch_signed()),
-            0x20: lambda: self.jr_cc('NZ', self.fetch_signed()),
-            0x28: lambda: self.jr_cc('Z', self.fetch_signed()),
-            0x30: lambda: self.jr_cc('NC', self.fetch_signed()),
-            0x38: lambda: self.jr_cc('C', self.fetch_signed()),
-            0x10: lambda: self.djnz(self.fetch_signed()),
-
-            # Call and Return group
-            0xCD: lambda: self.call(self.fetch_word()),
-            0xC4: lambda: self.call_cc('NZ', self.fetch_word()),
-            0xCC: lambda: self.call_cc('Z', self.fetch_word()),
-            0xD4: lambda: self.call_cc('NC', self.fetch_word()),
-            0xDC: lambda: self.call_cc('C', self.fetch_word()),
-
-            0xE4: lambda: self.call_cc('PO', self.fetch_word()),  # CALL PO, nn
-            0xEC: lambda: self.call_cc('PE', self.fetch_word()),  # CALL PE, nn
-            0xF4: lambda: self.call_cc('P', self.fetch_word()),   # CALL P, nn
-            0xFC: lambda: self.call_cc('M', self.fetch_word()),   # CALL M, nn
-
-            0xC9: lambda: self.ret(),
-            0xC0: lambda: self.ret_cc('NZ'),
-            0xC8: lambda: self.ret_cc('Z'),
-            0xD0: lambda: self.ret_cc('NC'),
-            0xD8: lambda: self.ret_cc('C'),
-            0xE0: lambda: self.ret_cc('PO'),  # RET PO
-            0xE8: lambda: self.ret_cc('PE'),  # RET PE
-            0xF0: lambda: self.ret_cc('P'),  # RET P
-            0xF8: lambda: self.ret_cc('M'),  # RET M
-            0xC7: lambda: self.rst(0x00), 0xCF: lambda: self.rst(0x08),
-            0xD7: lambda: self.rst(0x10), 0xDF: lambda: self.rst(0x18),
-            0xE7: lambda: self.rst(0x20), 0xEF: lambda: self.rst(0x28),
-            0xF7: lambda: self.rst(0x30), 0xFF: lambda: self.rst(0x38),
-
-            # Input and Output group
-            0xDB: lambda: self.in_a_n(),
-            0xD3: lambda: self.out_n_a(),
-
-            # Prefix Instructions
-            0xCB: lambda: self.execute_cb(),
-            0xDD: lambda: self.execute_dd(),
-            0xED: lambda: self.execute_ed(),
-            0xFD: lambda: self.execute_fd(),
-        }
+            self.tstates += MAIN_TSTATES[opcode]
+        self.MAIN_TABLE[opcode](self)
 
     def daa(self):
         """
         Decimal Adjust Accumulator.
         Adjusts the accumulator for BCD (Binary Coded Decimal) arithmetic.
         """
-        a = self.registers['A']
+        a = self.regs[REG_A]
         cf = self.get_flag('C')
         hf = self.get_flag('H')
 
@@ -267,7 +563,7 @@ class Z80(extCPUClass):
             if hf:
                 a -= 0x06
 
-        self.registers['A'] = a & 0xFF
+        self.regs[REG_A] = a & 0xFF
         self.set_flag('S', a & 0x80)
         self.set_flag('Z', a == 0)
         self.set_flag('H', 0)
@@ -277,12 +573,12 @@ class Z80(extCPUClass):
         """
         Complement accumulator (A = ~A).
         """
-        self.registers['A'] = (~self.registers['A']) & 0xFF
+        self.regs[REG_A] = (~self.regs[REG_A]) & 0xFF
         self.set_flag('H', 1)
         self.set_flag('N', 1)
         # Установка флагов 3 и 5
-        self.set_flag('3', self.registers['A'] & 0x08)
-        self.set_flag('5', self.registers['A'] & 0x20)
+        self.set_flag('3', self.regs[REG_A] & 0x08)
+        self.set_flag('5', self.regs[REG_A] & 0x20)
 
     def ccf(self):
         """
@@ -292,8 +588,8 @@ class Z80(extCPUClass):
         self.set_flag('H', not self.get_flag('C'))
         self.set_flag('N', 0)
         # Установка флагов 3 и 5
-        self.set_flag('3', self.registers['A'] & 0x08)
-        self.set_flag('5', self.registers['A'] & 0x20)
+        self.set_flag('3', self.regs[REG_A] & 0x08)
+        self.set_flag('5', self.regs[REG_A] & 0x20)
 
     def scf(self):
         """
@@ -303,8 +599,8 @@ class Z80(extCPUClass):
         self.set_flag('H', 0)
         self.set_flag('N', 0)
         # Установка флагов 3 и 5
-        self.set_flag('3', self.registers['A'] & 0x08)
-        self.set_flag('5', self.registers['A'] & 0x20)
+        self.set_flag('3', self.regs[REG_A] & 0x08)
+        self.set_flag('5', self.regs[REG_A] & 0x20)
 
     def nop(self):
         """
@@ -333,7 +629,7 @@ class Z80(extCPUClass):
         #print(f"port {port:02X}")
         value = self.io_read(port)  # Читаем из порта
         #print(f"value {value:02X}")
-        self.registers['A'] = value  # Сохраняем значение в аккумуляторе
+        self.regs[REG_A] = value  # Сохраняем значение в аккумуляторе
 
         # Устанавливаем флаги
         #self.set_flag('S', value & 0x80)  # Знаковый флаг
@@ -348,7 +644,7 @@ class Z80(extCPUClass):
         Инструкция: OUT (n), A
         """
         port = self.fetch()  # Получаем номер порта из следующего байта
-        self.io_write((self.registers['A'] << 8) | port, self.registers['A'])  # Записываем в порт
+        self.io_write((self.regs[REG_A] << 8) | port, self.regs[REG_A])  # Записываем в порт
 
     def ld_i_a(self):
         """
@@ -356,6 +652,6 @@ class Z80(extCPUClass):
         Инструкция: LD I, A
         """
         # Копируем значение из аккумулятора в регистр I
-        self.registers['I'] = self.registers['A']
+        self.regs[REG_I] = self.regs[REG_A]
 
         # Эта инструкция не влияет на флаги
\ No newline at end of file
@@ -0,0 +1,67 @@
+# scheduler.py
+# Расписание кадров: 50 Гц по реальному времени, турбо-режим и пропуск вывода кадров
+
+import time
+
+
+class FrameScheduler:
+    """
+    Согласует эмуляцию кадров с реальным временем.
+
+    После эмуляции кадра present_frame() решает, выводить ли его, а wait() ждет
+    начала следующего кадра, так что кадры идут с частотой frame_rate. Если хост
+    не успевает (кадр закончился позже своего срока) и включен пропуск кадров,
+    вывод пропускается, но не более max_skip кадров подряд. В турбо-режиме ожидания
+    нет, а кадры выводятся не чаще frame_rate.
+    """
+    def __init__(self, frame_rate=50, max_skip=4, max_lag=0.25):
+        """
+        :param frame_rate: частота кадров, Гц
+        :param max_skip: наибольшее число кадров подряд без вывода
+        :param max_lag: отставание в секундах, после которого расписание не догоняется,
+                        а начинается заново (пауза, меню, медленный хост)
+        """
+        self.period = 1.0 / frame_rate
+        self.max_skip = max_skip
+        self.max_lag = max_lag
+        self.turbo = False          # Без ожидания: эмуляция с наибольшей скоростью
+        self.frame_skip = True      # Пропускать вывод кадров при отставании
+        self.next_time = None       # Время начала следующего кадра (perf_counter)
+        self.last_present = 0.0     # Время вывода последнего кадра
+        self.skipped = 0            # Кадров подряд без вывода
+        self.skipped_total = 0      # Всего пропущено кадров
+
+    def restart(self):
+        """Начинает расписание заново (после паузы, меню, загрузки)."""
+        self.next_time = None
+        self.skipped = 0
+
+    def present_frame(self):
+        """
+        Вызывается после эмуляции кадра.
+
+        :return: True - кадр нужно вывести, False - вывод пропускается
+        """
+        now = time.perf_counter()
+        if self.turbo:
+            present = now - self.last_present >= self.period
+        else:
+            late = self.next_time is not None and now > self.next_time
+            present = not (self.frame_skip and late and self.skipped < self.max_skip)
+        if present:
+            self.last_present = now
+            self.skipped = 0
+        else:
+            self.skipped += 1
+            self.skipped_total += 1
+        return present
+
+    def wait(self):
+        """Ждет начала следующего кадра (в турбо-режиме не ждет)."""
+        now = time.perf_counter()
+        if self.turbo or self.next_time is None or now - self.next_time > self.max_lag:
+            self.next_time = now + self.period
+            return
+        if now < self.next_time:
+            time.sleep(self.next_time - now)
+        self.next_time += self.period
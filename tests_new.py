@@ -118,21 +118,21 @@ if __name__ == '__main__':
         #mach.bc_prime = regs[5]
         #mach.de_prime = regs[6]
         #mach.hl_prime = regs[7]
-        mach.registers['A_'] = regs[4] >> 8
-        mach.registers['F_'] = regs[4] & 0xFF
-        mach.registers['B_'] = regs[5] >> 8
-        mach.registers['C_'] = regs[5] & 0xFF
-        mach.registers['D_'] = regs[6] >> 8
-        mach.registers['E_'] = regs[6] & 0xFF
-        mach.registers['H_'] = regs[7] >> 8
-        mach.registers['L_'] = regs[7] & 0xFF
-        mach.registers['IX'] = regs[8]
-        mach.registers['IY'] = regs[9]
-        mach.registers['SP'] = regs[10]
-        mach.registers['PC'] = regs[11]
+        mach.set_register('A_', regs[4] >> 8)
+        mach.set_register('F_', regs[4] & 0xFF)
+        mach.set_register('B_', regs[5] >> 8)
+        mach.set_register('C_', regs[5] & 0xFF)
+        mach.set_register('D_', regs[6] >> 8)
+        mach.set_register('E_', regs[6] & 0xFF)
+        mach.set_register('H_', regs[7] >> 8)
+        mach.set_register('L_', regs[7] & 0xFF)
+        mach.set_register('IX', regs[8])
+        mach.set_register('IY', regs[9])
+        mach.set_register('SP', regs[10])
+        mach.set_register('PC', regs[11])
         regs2 = [s for s in test_lines[2].split()]
-        mach.registers['I'] = int(regs2[0], 16)
-        mach.registers['R'] = int(regs2[1], 16)
+        mach.set_register('I', int(regs2[0], 16))
+        mach.set_register('R', int(regs2[1], 16))
         #mach.registers.IFF = regs2[2] == "1"
         #mach.registers.IFF2 = regs2[3] == "1"
         #mach.registers.IFF2 = regs2[3] == "1"
@@ -159,9 +159,9 @@ if __name__ == '__main__':
                 #states, asm =  mach.execute_instruction()
                 #states = 1
                 asm = ''
+                before = mach.tstates
                 mach.execute_instruction(True)
-                states = mach.cycles
-                if states == 0: states = 1
+                states = mach.tstates - before
                 taken += states
                 trace += "%d/%d\t%d\t" % (taken, tstates, states) + asm
         except Exception as e:
@@ -0,0 +1,353 @@
+# worker.py
+# Эмуляция в отдельном процессе: кадры через разделяемую память, ввод через кольцевой буфер
+
+import multiprocessing
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from keyboard import Keyboard
+from memory import BANK_SIZE, SCREEN_BANKS
+
+REGISTER_COUNT = 22         # Длина Z80.regs
+BORDER_CAPACITY = 8192      # Записей журнала бордюра в кадре (как у BorderLog)
+
+# Поля заголовка кадра (int64)
+(SEQUENCE, FRAMES, TSTATES, FRAME_START, PORT_7FFD, PORT_1FFD, INTERRUPTS_ENABLED,
+ INTERRUPT_MODE, HALTED, BORDER_START, BORDER_LAST, BORDER_COUNT) = range(12)
+HEADER_SIZE = 16
+
+# Сообщения кольцевого буфера ввода: (вид, значение)
+KEYS = 1        # Значение - матрица клавиатуры 8x8, упакованная в 64 бита (pack_matrix)
+COMMAND = 2     # Значение - индекс команды в COMMANDS
+COMMANDS = ('reset', 'translation', 'idle_skip', 'contention', 'turbo', 'frame_skip', 'quit')
+
+
+def pack_matrix(matrix):
+    """
+    :param matrix: матрица клавиатуры 8x8 (bool)
+    :return: матрица в 64-битном целом со знаком, строка на байт
+    """
+    return int.from_bytes(np.packbits(matrix, axis=1).tobytes(), 'little', signed=True)
+
+
+def unpack_matrix(value):
+    """
+    :param value: результат pack_matrix
+    :return: матрица клавиатуры 8x8 (bool)
+    """
+    rows = np.frombuffer(value.to_bytes(8, 'little', signed=True), dtype=np.uint8)
+    return np.unpackbits(rows[:, np.newaxis], axis=1).astype(bool)
+
+
+class SharedFrame:
+    """
+    Кадр в разделяемой памяти: заголовок, регистры, экранные банки 5 и 7 и журнал бордюра.
+
+    Пишет только worker, читает только frontend. Согласованность - по счетчику
+    sequence (seqlock): на время записи он нечетный. Читатель копирует кадр в свои буферы
+    и сверяет счетчик; если кадр переписали во время чтения, копия отбрасывается и кадр
+    будет прочитан заново. Блокировок нет, и worker никогда не ждет frontend.
+    """
+    def __init__(self, name=None, border_capacity=BORDER_CAPACITY):
+        """
+        :param name: имя существующего блока разделяемой памяти; None - создать новый
+        :param border_capacity: число записей журнала бордюра в кадре
+        """
+        sizes = [HEADER_SIZE * 8, REGISTER_COUNT * 8, len(SCREEN_BANKS) * BANK_SIZE,
+                 border_capacity * 8, border_capacity]
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=sum(sizes))
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.border_capacity = border_capacity
+        offsets = np.cumsum([0] + sizes).tolist()
+        buf = self.shm.buf
+        self.header = np.ndarray(HEADER_SIZE, dtype=np.int64, buffer=buf, offset=offsets[0])
+        self.regs = np.ndarray(REGISTER_COUNT, dtype=np.int64, buffer=buf, offset=offsets[1])
+        self.banks = np.ndarray((len(SCREEN_BANKS), BANK_SIZE), dtype=np.uint8, buffer=buf, offset=offsets[2])
+        self.border_times = np.ndarray(border_capacity, dtype=np.int64, buffer=buf, offset=offsets[3])
+        self.border_colors = np.ndarray(border_capacity, dtype=np.uint8, buffer=buf, offset=offsets[4])
+        self.received = 0       # Счетчик последнего прочитанного кадра (сторона frontend)
+
+    def published(self):
+        """:return: число опубликованных кадров"""
+        return int(self.header[SEQUENCE]) >> 1
+
+    def publish(self, emulator):
+        """
+        Публикует кадр worker: экранные банки, регистры и журнал бордюра за кадр.
+        Журнал эмулятора после публикации очищается.
+
+        :param emulator: ZX_Spectrum_Emulator процесса worker
+        """
+        cpu = emulator.cpu
+        memory = emulator.memory
+        log = emulator.border_log
+        header = self.header
+        header[SEQUENCE] += 1   # Нечетный: идет запись
+        header[FRAMES] = cpu.frames
+        header[TSTATES] = cpu.tstates
+        header[FRAME_START] = cpu.frame_start
+        header[PORT_7FFD] = memory.port_7ffd
+        header[PORT_1FFD] = memory.port_1ffd
+        header[INTERRUPTS_ENABLED] = cpu.interrupts_enabled
+        header[INTERRUPT_MODE] = cpu.interrupt_mode
+        header[HALTED] = cpu.halted
+        self.regs[:] = cpu.regs
+        for data, bank in zip(self.banks, SCREEN_BANKS):
+            data[:] = np.frombuffer(memory.memory[bank], dtype=np.uint8)
+        count = min(log.count, self.border_capacity)
+        self.border_times[:count] = np.frombuffer(log.times, dtype=np.int64, count=count)
+        self.border_colors[:count] = np.frombuffer(log.colors, dtype=np.uint8, count=count)
+        header[BORDER_START] = log.start_color
+        header[BORDER_LAST] = log.last_color
+        header[BORDER_COUNT] = count
+        log.count = 0
+        log.start_color = log.last_color
+        header[SEQUENCE] += 1   # Четный: кадр готов
+
+    def receive(self, emulator):
+        """
+        Переносит последний опубликованный кадр в эмулятор frontend: экранные банки,
+        порты страниц, регистры и смены цвета бордюра (в его border_log).
+        Кадр сначала копируется целиком; эмулятор меняется, только если за время
+        копирования worker кадр не переписал.
+
+        :param emulator: ZX_Spectrum_Emulator процесса frontend
+        :return: True, если получен новый кадр
+        """
+        header = self.header
+        sequence = int(header[SEQUENCE])
+        if sequence & 1 or sequence == self.received:
+            return False
+        fields = header.tolist()
+        regs = self.regs.tolist()
+        banks = [data.tobytes() for data in self.banks]
+        count = min(max(fields[BORDER_COUNT], 0), self.border_capacity)
+        changes = list(zip(self.border_times[:count].tolist(), self.border_colors[:count].tolist()))
+        if int(header[SEQUENCE]) != sequence:
+            return False        # Кадр переписан во время чтения: следующий вызов прочитает новый
+
+        cpu = emulator.cpu
+        memory = emulator.memory
+        for data, bank in zip(banks, SCREEN_BANKS):
+            memory.update_screen_bank(bank, data)
+        port_7ffd, port_1ffd = fields[PORT_7FFD], fields[PORT_1FFD]
+        if (port_7ffd, port_1ffd) != (memory.port_7ffd, memory.port_1ffd):
+            memory.set_paging(port_7ffd, port_1ffd)
+        cpu.regs[:] = regs
+        cpu.frames = fields[FRAMES]
+        cpu.tstates = fields[TSTATES]
+        cpu.frame_start = fields[FRAME_START]
+        cpu.interrupts_enabled = bool(fields[INTERRUPTS_ENABLED])
+        cpu.interrupt_mode = fields[INTERRUPT_MODE]
+        cpu.halted = bool(fields[HALTED])
+
+        # Пропущенные frontend кадры дают только цвет бордюра на начало этого кадра
+        log = emulator.border_log
+        log.add(cpu.frame_start, fields[BORDER_START])
+        for tstate, color in changes:
+            log.add(tstate, color)
+        emulator.io_controller.border_color = fields[BORDER_LAST]
+        self.received = sequence
+        return True
+
+    def close(self, unlink=False):
+        """
+        Отключается от разделяемой памяти.
+
+        :param unlink: True - удалить блок (вызывает создатель)
+        """
+        # Представления numpy держат буфер: без их удаления close() невозможен
+        self.header = self.regs = self.banks = self.border_times = self.border_colors = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+class InputRing:
+    """
+    Кольцевой буфер сообщений frontend -> worker в разделяемой памяти.
+
+    Писатель и читатель по одному: голову двигает только писатель, хвост - только
+    читатель, поэтому блокировки не нужны. Переполненный буфер (worker не успевает
+    забирать сообщения) новое сообщение отбрасывает.
+    """
+    def __init__(self, name=None, capacity=256):
+        """
+        :param name: имя существующего блока разделяемой памяти; None - создать новый
+        :param capacity: число сообщений в буфере
+        """
+        size = 16 + capacity * 16
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.capacity = capacity
+        self.positions = np.ndarray(2, dtype=np.int64, buffer=self.shm.buf)     # [голова, хвост]
+        self.entries = np.ndarray((capacity, 2), dtype=np.int64, buffer=self.shm.buf, offset=16)
+
+    def push(self, kind, value):
+        """
+        Добавляет сообщение (сторона писателя).
+
+        :param kind: вид сообщения (KEYS, COMMAND)
+        :param value: значение
+        :return: False, если буфер полон и сообщение отброшено
+        """
+        head = int(self.positions[0])
+        if head - int(self.positions[1]) >= self.capacity:
+            return False
+        self.entries[head % self.capacity] = (kind, value)
+        self.positions[0] = head + 1    # Сообщение видно читателю только после записи
+        return True
+
+    def pop(self):
+        """
+        Забирает накопленные сообщения (сторона читателя).
+
+        :return: список пар (вид, значение) в порядке добавления
+        """
+        head = int(self.positions[0])
+        tail = int(self.positions[1])
+        messages = [tuple(self.entries[i % self.capacity].tolist()) for i in range(tail, head)]
+        self.positions[1] = head
+        return messages
+
+    def close(self, unlink=False):
+        """
+        Отключается от разделяемой памяти.
+
+        :param unlink: True - удалить блок (вызывает создатель)
+        """
+        self.positions = self.entries = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+class RemoteKeyboard(Keyboard):
+    """Клавиатура процесса worker: матрица приходит от frontend, а не из pygame."""
+    def read_keyboard(self):
+        pass
+
+    def set_matrix(self, value):
+        """
+        :param value: матрица, упакованная pack_matrix
+        """
+        self.keyboard_matrix[:] = unpack_matrix(value)
+
+
+def run_worker(machine, rom_file, selected_file, frame_name, ring_name):
+    """
+    Точка входа процесса worker: эмулирует машину с частотой кадров FrameScheduler
+    и публикует каждый кадр, пока не придет команда 'quit' или не завершится frontend.
+
+    :param machine: модель машины (memory.MACHINES)
+    :param rom_file: (имя, путь) файла ПЗУ
+    :param selected_file: (имя, путь) выбранного в меню файла
+    :param frame_name: имя блока SharedFrame
+    :param ring_name: имя блока InputRing
+    """
+    from emulator import ZX_Spectrum_Emulator   # emulator импортирует этот модуль
+
+    frame = SharedFrame(frame_name)
+    ring = InputRing(ring_name)
+    parent = multiprocessing.parent_process()
+    emulator = ZX_Spectrum_Emulator(machine)
+    emulator.keyboard = RemoteKeyboard(emulator.io_controller)
+    try:
+        emulator.load_files(rom_file, selected_file)
+        frame.publish(emulator)     # Первый кадр - признак готовности
+        emulator.scheduler.restart()
+        while parent is None or parent.is_alive():
+            commands = []
+            for kind, value in ring.pop():
+                if kind == KEYS:
+                    emulator.keyboard.set_matrix(value)
+                else:
+                    commands.append(COMMANDS[value])
+            if 'quit' in commands:
+                break
+            for command in commands:
+                emulator.apply_command(command)
+            if emulator.reset_requested:
+                emulator.reset()
+            emulator.cpu.run_frame()
+            frame.publish(emulator)
+            emulator.scheduler.wait()
+    finally:
+        frame.close()
+        ring.close()
+
+
+class EmulationWorker:
+    """
+    Процесс worker с машиной (процессор, память, устройства) и каналы связи с ним.
+
+    Frontend отправляет клавиатуру и команды через InputRing, а кадры забирает из
+    SharedFrame в свой эмулятор, который только рисует: эмуляция и вывод идут
+    на разных ядрах и друг друга не ждут.
+    """
+    def __init__(self, machine, rom_file, selected_file, timeout=10.0):
+        """
+        Запускает процесс и ждет первого кадра.
+
+        :param machine: модель машины (memory.MACHINES)
+        :param rom_file: (имя, путь) файла ПЗУ
+        :param selected_file: (имя, путь) выбранного в меню файла
+        :param timeout: наибольшее время запуска, секунды
+        """
+        self.frame = SharedFrame()
+        self.ring = InputRing()
+        self.keys = None        # Последняя отправленная матрица клавиатуры
+        self.poll_interval = 0.002
+        # spawn: процесс без копии окна pygame и одинаково на всех платформах
+        context = multiprocessing.get_context('spawn')
+        self.process = context.Process(target=run_worker, daemon=True,
+                                       args=(machine, rom_file, selected_file, self.frame.name, self.ring.name))
+        self.process.start()
+        deadline = time.perf_counter() + timeout
+        while self.frame.published() == 0:
+            if not self.process.is_alive() or time.perf_counter() > deadline:
+                self.stop()
+                raise RuntimeError("Процесс эмуляции не запустился")
+            time.sleep(self.poll_interval)
+
+    def is_alive(self):
+        return self.process.is_alive()
+
+    def send_keys(self, matrix):
+        """
+        Отправляет матрицу клавиатуры, если она изменилась.
+
+        :param matrix: матрица клавиатуры 8x8
+        """
+        keys = pack_matrix(matrix)
+        if keys != self.keys and self.ring.push(KEYS, keys):
+            self.keys = keys
+
+    def send_command(self, command):
+        """
+        :param command: команда из COMMANDS (ZX_Spectrum_Emulator.apply_command)
+        """
+        self.ring.push(COMMAND, COMMANDS.index(command))
+
+    def receive(self, emulator):
+        """Переносит новый кадр в эмулятор frontend (SharedFrame.receive)."""
+        return self.frame.receive(emulator)
+
+    def stop(self, timeout=2.0):
+        """Останавливает процесс и удаляет блоки разделяемой памяти."""
+        if self.process.is_alive():
+            self.send_command('quit')
+            self.process.join(timeout)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join()
+        self.frame.close(unlink=True)
+        self.ring.close(unlink=True)
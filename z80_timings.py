@@ -0,0 +1,104 @@
+# z80_timings.py
+# Длительность команд Z80 в T-состояниях
+
+# Основные (беспрефиксные) команды.
+# Для условных переходов указано время при невыполненном условии,
+# для префиксов CB/DD/ED/FD - только цикл выборки самого префикса.
+MAIN_TSTATES = [
+    #  0   1   2   3   4   5   6   7   8   9   A   B   C   D   E   F
+       4, 10,  7,  6,  4,  4,  7,  4,  4, 11,  7,  6,  4,  4,  7,  4,  # 00
+       8, 10,  7,  6,  4,  4,  7,  4, 12, 11,  7,  6,  4,  4,  7,  4,  # 10
+       7, 10, 16,  6,  4,  4,  7,  4,  7, 11, 16,  6,  4,  4,  7,  4,  # 20
+       7, 10, 13,  6, 11, 11, 10,  4,  7, 11, 13,  6,  4,  4,  7,  4,  # 30
+       4,  4,  4,  4,  4,  4,  7,  4,  4,  4,  4,  4,  4,  4,  7,  4,  # 40
+       4,  4,  4,  4,  4,  4,  7,  4,  4,  4,  4,  4,  4,  4,  7,  4,  # 50
+       4,  4,  4,  4,  4,  4,  7,  4,  4,  4,  4,  4,  4,  4,  7,  4,  # 60
+       7,  7,  7,  7,  7,  7,  4,  7,  4,  4,  4,  4,  4,  4,  7,  4,  # 70
+       4,  4,  4,  4,  4,  4,  7,  4,  4,  4,  4,  4,  4,  4,  7,  4,  # 80
+       4,  4,  4,  4,  4,  4,  7,  4,  4,  4,  4,  4,  4,  4,  7,  4,  # 90
+       4,  4,  4,  4,  4,  4,  7,  4,  4,  4,  4,  4,  4,  4,  7,  4,  # A0
+       4,  4,  4,  4,  4,  4,  7,  4,  4,  4,  4,  4,  4,  4,  7,  4,  # B0
+       5, 10, 10, 10, 10, 11,  7, 11,  5, 10, 10,  4, 10, 17,  7, 11,  # C0
+       5, 10, 10, 11, 10, 11,  7, 11,  5,  4, 10, 11, 10,  4,  7, 11,  # D0
+       5, 10, 10, 19, 10, 11,  7, 11,  5,  4, 10,  4, 10,  4,  7, 11,  # E0
+       5, 10, 10,  4, 10, 11,  7, 11,  5,  6, 10,  4, 10,  4,  7, 11,  # F0
+]
+
+# Дополнительное время при выполненном условии:
+# JR cc и DJNZ +5, CALL cc +7, RET cc +6
+MAIN_TSTATES_TAKEN = [0] * 256
+for _opcode in (0x10, 0x20, 0x28, 0x30, 0x38):
+    MAIN_TSTATES_TAKEN[_opcode] = 5
+for _opcode in (0xC4, 0xCC, 0xD4, 0xDC, 0xE4, 0xEC, 0xF4, 0xFC):
+    MAIN_TSTATES_TAKEN[_opcode] = 7
+for _opcode in (0xC0, 0xC8, 0xD0, 0xD8, 0xE0, 0xE8, 0xF0, 0xF8):
+    MAIN_TSTATES_TAKEN[_opcode] = 6
+
+# Длительность цикла выборки кода (M1) беспрефиксных команд вместе с внутренними тактами
+# перед следующим обращением к памяти: PUSH, RST, RET cc и DJNZ - 5, LD SP,HL и INC/DEC rr - 6.
+# По ней отсчитываются такты обращений внутри команды (задержки спорной памяти).
+M1_TSTATES = [4] * 256
+for _opcode in (0xC5, 0xD5, 0xE5, 0xF5, 0x10):
+    M1_TSTATES[_opcode] = 5
+for _opcode in range(0xC0, 0x100, 8):
+    M1_TSTATES[_opcode] = 5         # RET cc
+    M1_TSTATES[_opcode | 7] = 5     # RST p
+for _opcode in (0x03, 0x0B, 0x13, 0x1B, 0x23, 0x2B, 0x33, 0x3B, 0xF9):
+    M1_TSTATES[_opcode] = 6
+
+# Команды с префиксом CB (без учета выборки префикса):
+# r - 8, BIT n,(HL) - 12, остальные (HL) - 15 T-состояний
+CB_TSTATES = []
+for _opcode in range(256):
+    if _opcode & 0x07 != 6:
+        CB_TSTATES.append(4)
+    elif 0x40 <= _opcode < 0x80:
+        CB_TSTATES.append(8)
+    else:
+        CB_TSTATES.append(11)
+
+# Команды с префиксом ED (без учета выборки префикса).
+# Пустые ячейки - NONI, 8 T-состояний вместе с префиксом.
+# Для LDIR/CPIR/INIR/OTIR и т.п. указано время последней (неповторяемой) итерации.
+ED_TSTATES = [
+    #  0   1   2   3   4   5   6   7   8   9   A   B   C   D   E   F
+       4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  # 00
+       4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  # 10
+       4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  # 20
+       4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  # 30
+       8,  8, 11, 16,  4, 10,  4,  5,  8,  8, 11, 16,  4, 10,  4,  5,  # 40
+       8,  8, 11, 16,  4, 10,  4,  5,  8,  8, 11, 16,  4, 10,  4,  5,  # 50
+       8,  8, 11, 16,  4, 10,  4, 14,  8,  8, 11, 16,  4, 10,  4, 14,  # 60
+       8,  8, 11, 16,  4, 10,  4,  4,  8,  8, 11, 16,  4, 10,  4,  4,  # 70
+       4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  # 80
+       4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  # 90
+      12, 12, 12, 12,  4,  4,  4,  4, 12, 12, 12, 12,  4,  4,  4,  4,  # A0
+      12, 12, 12, 12,  4,  4,  4,  4, 12, 12, 12, 12,  4,  4,  4,  4,  # B0
+       4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  # C0
+       4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  # D0
+       4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  # E0
+       4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  4,  # F0
+]
+
+# Каждая повторяемая итерация LDIR/LDDR/CPIR/CPDR/INIR/INDR/OTIR/OTDR (16 + 5)
+BLOCK_REPEAT_TSTATES = 21
+
+# Команды с префиксом DD/FD (без учета выборки префикса).
+# Команды без индексного регистра и с IXh/IXl выполняются за время беспрефиксных,
+# обращения к (IX+d) дольше на 8 T-состояний (смещение и вычисление адреса).
+INDEX_TSTATES = list(MAIN_TSTATES)
+INDEX_TSTATES[0x34] = INDEX_TSTATES[0x35] = 19   # INC/DEC (IX+d)
+INDEX_TSTATES[0x36] = 15                         # LD (IX+d),n
+for _opcode in (0x46, 0x4E, 0x56, 0x5E, 0x66, 0x6E, 0x7E,
+                0x70, 0x71, 0x72, 0x73, 0x74, 0x75, 0x77,
+                0x86, 0x8E, 0x96, 0x9E, 0xA6, 0xAE, 0xB6, 0xBE):
+    INDEX_TSTATES[_opcode] = 15                  # LD r,(IX+d) / LD (IX+d),r / ALU (IX+d)
+INDEX_TSTATES[0xCB] = 0                          # Время DD CB d op берется из INDEX_CB_TSTATES
+
+# Команды DD CB d op / FD CB d op (без учета выборки DD/FD): BIT - 16, остальные - 19
+INDEX_CB_TSTATES = [16 if 0x40 <= _opcode < 0x80 else 19 for _opcode in range(256)]
+
+# Прием прерывания: IM 0/1 - 13, IM 2 - 19; NMI - 11 T-состояний
+INTERRUPT_TSTATES = (13, 13, 19)
+NMI_TSTATES = 11
+del _opcode